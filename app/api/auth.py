@@ -3,6 +3,7 @@ from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 import os
+import time
 from dotenv import load_dotenv
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
@@ -10,6 +11,7 @@ from sqlalchemy.orm import Session
 
 from ..models import usuario
 from ..database import get_db
+from .cache import TTLCache
 
 # 🔹 Cargar variables de entorno
 load_dotenv()
@@ -24,6 +26,25 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 # 🔹 Esquema OAuth2
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# 🔹 Cachés por worker: token -> user_id y user_id -> datos de identidad
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", 60))
+_tokens_cache = TTLCache(maxsize=int(os.getenv("AUTH_TOKEN_CACHE_SIZE", 20000)), ttl=AUTH_CACHE_TTL)
+_usuarios_cache = TTLCache(maxsize=int(os.getenv("AUTH_USER_CACHE_SIZE", 20000)), ttl=AUTH_CACHE_TTL)
+
+
+class UsuarioActual:
+    """
+    Snapshot de identidad del usuario autenticado (sin saldo).
+    Se sirve desde caché; las rutas que dependen del saldo deben leer la fila real.
+    """
+    __slots__ = ("id", "username", "verificado", "verificacion_pendiente")
+
+    def __init__(self, id: int, username: str, verificado: bool, verificacion_pendiente: bool):
+        self.id = id
+        self.username = username
+        self.verificado = bool(verificado)
+        self.verificacion_pendiente = bool(verificacion_pendiente)
+
 # -------------------------------
 # Funciones de autenticación
 # -------------------------------
@@ -43,32 +64,95 @@ def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> usuario.Usuario:
-    """Obtiene el usuario actual a partir del token."""
-    credentials_exception = HTTPException(
+def invalidar_usuario_cache(user_id: int) -> None:
+    """
+    Descarta el snapshot cacheado de un usuario.
+    Llamar en toda escritura que cambie username, verificado o verificacion_pendiente.
+    Solo afecta al worker actual; los demás expiran por TTL (AUTH_CACHE_TTL).
+    """
+    _usuarios_cache.delete(int(user_id))
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudo validar las credenciales",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
+
+def _user_id_desde_token(token: str) -> int:
+    """Decodifica el JWT (o lo toma de caché) y devuelve el id del usuario."""
+    user_id = _tokens_cache.get(token)
+    if user_id is not None:
+        return user_id
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
+        sub = payload.get("sub")
+        if sub is None:
+            raise _credentials_exception()
+        user_id = int(sub)
+    except (JWTError, ValueError):
+        raise _credentials_exception()
+
+    # Nunca cachear más allá de la expiración del propio token
+    exp = payload.get("exp")
+    ttl = AUTH_CACHE_TTL
+    if exp is not None:
+        ttl = min(ttl, float(exp) - time.time())
+    if ttl > 0:
+        _tokens_cache.set(token, user_id, ttl=ttl)
+    return user_id
+
+
+def principal_desde_token(token: str, db: Session) -> UsuarioActual:
+    """Resuelve la identidad del token sin ir a la BD cuando está en caché."""
+    user_id = _user_id_desde_token(token)
+
+    principal = _usuarios_cache.get(user_id)
+    if principal is not None:
+        return principal
+
+    fila = db.query(
+        usuario.Usuario.id,
+        usuario.Usuario.username,
+        usuario.Usuario.verificado,
+        usuario.Usuario.verificacion_pendiente,
+    ).filter(usuario.Usuario.id == user_id).first()
+    if fila is None:
+        raise _credentials_exception()
+
+    principal = UsuarioActual(fila.id, fila.username, fila.verificado, fila.verificacion_pendiente)
+    _usuarios_cache.set(user_id, principal)
+    return principal
+
+
+def get_current_principal(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+) -> UsuarioActual:
+    """
+    Identidad del usuario actual desde caché (id, username, verificado, verificacion_pendiente).
+    Usar en rutas que solo necesitan saber quién es el usuario.
+    """
+    return principal_desde_token(token, db)
+
+
+def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+) -> usuario.Usuario:
+    """Obtiene el usuario actual (fila viva de la BD) a partir del token."""
+    user_id = _user_id_desde_token(token)
 
-    user = db.query(usuario.Usuario).filter(usuario.Usuario.id == int(user_id)).first()
+    user = db.query(usuario.Usuario).filter(usuario.Usuario.id == user_id).first()
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
 
     return user
 
-def verificar_admin(current_user: usuario.Usuario = Depends(get_current_user)):
+def verificar_admin(current_user: UsuarioActual = Depends(get_current_principal)):
     """Dependencia para verificar permisos de administrador"""
     if current_user.username != "admin":
         raise HTTPException(status_code=403, detail="No autorizado - Se requieren permisos de administrador")
@@ -0,0 +1,53 @@
+# app/api/cache.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Caché en memoria por worker con expiración (TTL) y desalojo LRU.
+
+    Es thread-safe porque las dependencias síncronas de FastAPI se ejecutan
+    en el threadpool. No se comparte entre procesos: cada worker tiene la suya.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._datos: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clave: Hashable) -> Optional[Any]:
+        """Devuelve el valor si existe y no ha expirado, o None."""
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            expira, valor = entrada
+            if expira <= time.monotonic():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return valor
+
+    def set(self, clave: Hashable, valor: Any, ttl: Optional[float] = None) -> None:
+        """Guarda un valor; si se supera maxsize se desaloja el menos usado."""
+        expira = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._datos[clave] = (expira, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maxsize:
+                self._datos.popitem(last=False)
+
+    def delete(self, clave: Hashable) -> None:
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self) -> int:
+        return len(self._datos)
@@ -1,5 +1,6 @@
 # app/api/juegos.py
-from typing import Dict
+from .sesiones import SessionStore, crear_session_store
 
-# Almacén temporal para sesiones de juego (en producción usar Redis)
-game_sessions: Dict[str, dict] = {}
+# Almacén compartido de sesiones de juego (blackjack, aviator, póker).
+# El backend se elige con SESSION_STORE: "memoria" (un worker) o "postgres".
+game_sessions: SessionStore = crear_session_store(prefijo="juegos:")
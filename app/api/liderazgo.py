@@ -0,0 +1,130 @@
+# app/api/liderazgo.py
+"""
+Elección de líder entre workers y réplicas con un advisory lock de Postgres.
+
+Solo el proceso que tiene el lock ejecuta los jobs del scheduler; el resto
+queda en espera. El lock es de sesión: vive mientras viva la conexión que lo
+tomó, así que si el líder muere (o su conexión se corta) Postgres lo libera
+solo y otro proceso lo toma en el siguiente intento (failover automático).
+"""
+import asyncio
+import os
+from typing import Callable, Optional
+
+import anyio
+from sqlalchemy import text
+
+from ..database import ES_SQLITE, engine
+
+# Identificador del advisory lock (igual en todos los procesos de la app)
+LEADER_LOCK_ID = int(os.environ.get("LEADER_LOCK_ID", 727_001))
+# Cada cuántos segundos el líder comprueba su conexión y los seguidores reintentan
+LEADER_HEARTBEAT_SEGUNDOS = int(os.environ.get("LEADER_HEARTBEAT_SEGUNDOS", 10))
+
+
+class EleccionLider:
+    def __init__(
+        self,
+        al_ganar: Callable[[], None],
+        al_perder: Callable[[], None],
+        lock_id: int = LEADER_LOCK_ID,
+        intervalo: int = LEADER_HEARTBEAT_SEGUNDOS
+    ):
+        self.al_ganar = al_ganar
+        self.al_perder = al_perder
+        self.lock_id = lock_id
+        self.intervalo = intervalo
+        self.es_lider = False
+        self._conexion = None
+        self._tarea: Optional[asyncio.Task] = None
+
+    # -------------------------------
+    # Operaciones bloqueantes (se ejecutan en el threadpool)
+    # -------------------------------
+
+    def _intentar_lock(self) -> bool:
+        """Abre una conexión dedicada e intenta tomar el lock sin esperar."""
+        if self._conexion is None:
+            # AUTOCOMMIT: el lock de sesión no deja transacciones abiertas
+            self._conexion = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        # Si no se obtiene, la conexión se conserva para el próximo intento
+        obtenido = self._conexion.execute(
+            text("SELECT pg_try_advisory_lock(:id)"), {"id": self.lock_id}
+        ).scalar()
+        return bool(obtenido)
+
+    def _latido(self) -> bool:
+        """Comprueba que la conexión que sostiene el lock sigue viva."""
+        try:
+            self._conexion.execute(text("SELECT 1"))
+            return True
+        except Exception as e:
+            print(f"⚠️ [LÍDER] Conexión del lock perdida: {e}")
+            self._cerrar_conexion()
+            return False
+
+    def _liberar(self) -> None:
+        if self._conexion is not None:
+            try:
+                self._conexion.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": self.lock_id})
+            except Exception:
+                pass
+        self._cerrar_conexion()
+
+    def _cerrar_conexion(self) -> None:
+        if self._conexion is not None:
+            try:
+                self._conexion.invalidate()
+                self._conexion.close()
+            except Exception:
+                pass
+            self._conexion = None
+
+    # -------------------------------
+    # Ciclo de vida
+    # -------------------------------
+
+    def _ganar(self) -> None:
+        self.es_lider = True
+        print(f"👑 [LÍDER] Este proceso (pid {os.getpid()}) es el líder: jobs activos")
+        self.al_ganar()
+
+    def _perder(self) -> None:
+        self.es_lider = False
+        print(f"💤 [LÍDER] Proceso {os.getpid()} deja de ser líder: jobs en pausa")
+        self.al_perder()
+
+    async def _bucle(self) -> None:
+        while True:
+            try:
+                if self.es_lider:
+                    if not await anyio.to_thread.run_sync(self._latido):
+                        self._perder()
+                elif await anyio.to_thread.run_sync(self._intentar_lock):
+                    self._ganar()
+            except Exception as e:
+                print(f"❌ [LÍDER] Error en la elección: {e}")
+                if self.es_lider:
+                    self._perder()
+                await anyio.to_thread.run_sync(self._cerrar_conexion)
+            await asyncio.sleep(self.intervalo)
+
+    async def iniciar(self) -> None:
+        # Con SQLite solo hay un proceso local: siempre es líder
+        if ES_SQLITE:
+            self._ganar()
+            return
+        self._tarea = asyncio.create_task(self._bucle())
+
+    async def detener(self) -> None:
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        if self.es_lider:
+            self._perder()
+        if not ES_SQLITE:
+            await anyio.to_thread.run_sync(self._liberar)
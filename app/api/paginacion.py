@@ -0,0 +1,75 @@
+# app/api/paginacion.py
+"""
+Paginación por cursor (keyset) compartida por los listados.
+
+El cursor es opaco para el cliente: codifica los valores de la última fila de
+la página (p. ej. fecha e id) y la siguiente página se pide con
+`WHERE (fecha, id) < (:fecha, :id)`, que usa el índice compuesto y cuesta lo
+mismo en la primera página que en la milésima (a diferencia de OFFSET).
+El cursor de la siguiente página viaja en la cabecera X-Next-Cursor.
+"""
+import base64
+import json
+import os
+from datetime import datetime
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import tuple_
+
+PAGINA_POR_DEFECTO = int(os.environ.get("PAGINA_POR_DEFECTO", 50))
+PAGINA_MAXIMA = int(os.environ.get("PAGINA_MAXIMA", 500))
+CABECERA_CURSOR = "X-Next-Cursor"
+
+
+def codificar_cursor(*valores: Any) -> str:
+    """Serializa los valores de la última fila (las fechas en ISO 8601)."""
+    datos = [v.isoformat() if isinstance(v, datetime) else v for v in valores]
+    return base64.urlsafe_b64encode(json.dumps(datos).encode()).decode()
+
+
+def decodificar_cursor(cursor: Optional[str], tipos: Sequence[type]) -> Optional[List[Any]]:
+    """Devuelve los valores del cursor convertidos a `tipos`, o None si no hay cursor."""
+    if not cursor:
+        return None
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(datos) != len(tipos):
+            raise ValueError("longitud incorrecta")
+        return [
+            datetime.fromisoformat(v) if tipo is datetime else tipo(v)
+            for v, tipo in zip(datos, tipos)
+        ]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+
+
+def despues_del_cursor(columnas: Sequence, valores: Sequence[Any], descendente: bool = True):
+    """Condición keyset: filas posteriores al cursor en el orden de `columnas`."""
+    if descendente:
+        return tuple_(*columnas) < tuple_(*valores)
+    return tuple_(*columnas) > tuple_(*valores)
+
+
+def cortar_pagina(filas: List[Any], limite: int, clave) -> Tuple[List[Any], Optional[str]]:
+    """
+    Recibe `limite + 1` filas: si sobra una hay otra página y se devuelve el
+    cursor construido con `clave(ultima_fila)` (una tupla de valores).
+    """
+    if len(filas) <= limite:
+        return filas, None
+    filas = filas[:limite]
+    return filas, codificar_cursor(*clave(filas[-1]))
+
+
+def respuesta_json_streaming(items: Iterable[Any], siguiente: Optional[str]) -> StreamingResponse:
+    """Emite una lista JSON elemento a elemento, sin armar el documento completo en memoria."""
+    def generar():
+        yield "["
+        for i, item in enumerate(items):
+            yield ("," if i else "") + json.dumps(item, default=str)
+        yield "]"
+
+    headers = {CABECERA_CURSOR: siguiente} if siguiente else {}
+    return StreamingResponse(generar(), media_type="application/json", headers=headers)
@@ -0,0 +1,474 @@
+# app/api/sesiones.py
+import asyncio
+import heapq
+import os
+import pickle
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import anyio
+
+from sqlalchemy import text
+
+# TTL por defecto de una sesión de juego (segundos)
+SESSION_TTL = int(os.environ.get("SESSION_TTL", 3600))
+# Máximo de sesiones en memoria por worker (se desaloja la menos usada)
+SESSION_MAX_MEMORIA = int(os.environ.get("SESSION_MAX_MEMORIA", 50000))
+# Cada cuántos segundos el reaper borra sesiones vencidas
+SESSION_REAPER_SEGUNDOS = int(os.environ.get("SESSION_REAPER_SEGUNDOS", 30))
+
+
+def estado_de(sesion: Any) -> Optional[str]:
+    """Estado de una sesión: clave "estado" de un dict o atributo `estado` de un objeto."""
+    if isinstance(sesion, dict):
+        return sesion.get("estado")
+    return getattr(sesion, "estado", None)
+
+
+def _fijar_estado(sesion: Any, estado: str) -> None:
+    if isinstance(sesion, dict):
+        sesion["estado"] = estado
+    else:
+        sesion.estado = estado
+
+
+class SessionStore(ABC):
+    """
+    Interfaz del almacén de sesiones de juego.
+
+    Las sesiones son objetos Python arbitrarios (dicts, SesionPoker, JuegoMinas...).
+    Tras mutar una sesión hay que volver a llamar a `guardar`: en los backends
+    fuera de proceso lo que devuelve `obtener` es una copia.
+
+    obtener -> comprobar estado -> guardar no es atómico entre workers. Todo lo
+    que paga (o cierra) una partida debe pasar antes por `reclamar`, y las
+    mutaciones intermedias deben guardarse con `si_estado` para no resucitar una
+    sesión que otra petición ya reclamó.
+    """
+
+    def __init__(self, prefijo: str = "", ttl: int = SESSION_TTL):
+        self.prefijo = prefijo
+        self.ttl = ttl
+
+    def _clave(self, session_id: str) -> str:
+        return f"{self.prefijo}{session_id}"
+
+    @abstractmethod
+    def obtener(self, session_id: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def guardar(self, session_id: str, sesion: Any, ttl: Optional[int] = None, si_estado: Optional[str] = None) -> bool:
+        """
+        Crea o actualiza una sesión. Con `ttl=None` una sesión existente conserva
+        su expiración original (se cuenta desde que se creó, no desde el último uso).
+
+        Con `si_estado` solo actualiza si la sesión guardada sigue vigente y en ese
+        estado (nunca la crea). Devuelve si escribió.
+        """
+
+    @abstractmethod
+    def reclamar(self, session_id: str, estado_esperado: str, nuevo_estado: str) -> Optional[Any]:
+        """
+        Compare-and-set atómico del estado: si la sesión existe y está en
+        `estado_esperado`, pasa a `nuevo_estado` y se devuelve (con el estado ya
+        cambiado). Si no, devuelve None. Entre peticiones concurrentes, en
+        cualquier worker, solo una reclama la sesión.
+        """
+
+    @abstractmethod
+    def eliminar(self, session_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        """Itera (session_id, sesion) de las sesiones vigentes de este prefijo."""
+
+    @abstractmethod
+    def limpiar_expiradas(self) -> int:
+        """Borra las sesiones expiradas y devuelve cuántas eliminó (lo llama el reaper)."""
+
+    @abstractmethod
+    def metricas(self) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.obtener(session_id) is not None
+
+
+# ============================================================================
+# BACKEND EN MEMORIA (un solo proceso)
+# ============================================================================
+
+class AlmacenMemoria:
+    """
+    Datos compartidos por todos los MemorySessionStore del proceso.
+
+    - `_datos` es un OrderedDict en orden LRU (el último usado al final).
+    - `_expiraciones` es un min-heap (expira, clave) para que el reaper solo
+      toque las sesiones vencidas: O(k log n) en vez de recorrer toda la tabla.
+      Las entradas obsoletas del heap (sesión borrada o re-guardada con otro
+      TTL) se descartan al sacarlas.
+    - Con más de `max_sesiones` se desaloja la sesión menos usada.
+    """
+
+    def __init__(self, max_sesiones: int = SESSION_MAX_MEMORIA):
+        self.max_sesiones = max_sesiones
+        self._datos: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._expiraciones: List[Tuple[float, str]] = []
+        self._lock = threading.Lock()
+        # Sesiones vivas por prefijo ("juegos:", "minas:") para contar en O(1)
+        self._por_prefijo: Dict[str, int] = {}
+        self.total_expiradas = 0
+        self.total_desalojadas = 0
+
+    @staticmethod
+    def _prefijo_de(clave: str) -> str:
+        return clave[:clave.find(":") + 1]
+
+    def _quitar(self, clave: str) -> bool:
+        """Borra una clave (con el lock tomado) y actualiza el contador por prefijo."""
+        if self._datos.pop(clave, None) is None:
+            return False
+        self._por_prefijo[self._prefijo_de(clave)] -= 1
+        return True
+
+    def _vigente(self, clave: str) -> Optional[Any]:
+        """Sesión vigente de `clave` (con el lock tomado); borra la vencida."""
+        entrada = self._datos.get(clave)
+        if entrada is None:
+            return None
+        expira, sesion = entrada
+        if expira <= time.time():
+            # Vencida pero aún no recogida por el reaper
+            self._quitar(clave)
+            self.total_expiradas += 1
+            return None
+        self._datos.move_to_end(clave)
+        return sesion
+
+    def obtener(self, clave: str) -> Optional[Any]:
+        with self._lock:
+            return self._vigente(clave)
+
+    def reclamar(self, clave: str, esperado: str, nuevo: str) -> Optional[Any]:
+        with self._lock:
+            sesion = self._vigente(clave)
+            if sesion is None or estado_de(sesion) != esperado:
+                return None
+            _fijar_estado(sesion, nuevo)
+            return sesion
+
+    def guardar(self, clave: str, sesion: Any, ttl: Optional[int], ttl_defecto: int, si_estado: Optional[str] = None) -> bool:
+        with self._lock:
+            if si_estado is not None:
+                actual = self._vigente(clave)
+                if actual is None or estado_de(actual) != si_estado:
+                    return False
+            anterior = self._datos.get(clave)
+            if ttl is None and anterior is not None:
+                expira = anterior[0]
+            else:
+                expira = time.time() + (ttl_defecto if ttl is None else ttl)
+                heapq.heappush(self._expiraciones, (expira, clave))
+            if anterior is None:
+                prefijo = self._prefijo_de(clave)
+                self._por_prefijo[prefijo] = self._por_prefijo.get(prefijo, 0) + 1
+            self._datos[clave] = (expira, sesion)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_sesiones:
+                self._quitar(next(iter(self._datos)))
+                self.total_desalojadas += 1
+            return True
+
+    def eliminar(self, clave: str) -> None:
+        with self._lock:
+            self._quitar(clave)
+
+    def items(self, prefijo: str) -> List[Tuple[str, Any]]:
+        ahora = time.time()
+        n = len(prefijo)
+        with self._lock:
+            return [
+                (clave[n:], sesion)
+                for clave, (expira, sesion) in self._datos.items()
+                if clave.startswith(prefijo) and expira > ahora
+            ]
+
+    def contar(self, prefijo: str) -> int:
+        if not prefijo:
+            return len(self._datos)
+        return self._por_prefijo.get(prefijo, 0)
+
+    def limpiar_expiradas(self) -> int:
+        """Saca del heap solo las sesiones vencidas."""
+        ahora = time.time()
+        eliminadas = 0
+        with self._lock:
+            while self._expiraciones and self._expiraciones[0][0] <= ahora:
+                expira, clave = heapq.heappop(self._expiraciones)
+                entrada = self._datos.get(clave)
+                if entrada is not None and entrada[0] == expira:
+                    self._quitar(clave)
+                    eliminadas += 1
+            # Compactar el heap si acumula demasiadas entradas obsoletas
+            if len(self._expiraciones) > 2 * len(self._datos) + 1024:
+                self._expiraciones = [(e, c) for c, (e, _) in self._datos.items()]
+                heapq.heapify(self._expiraciones)
+            self.total_expiradas += eliminadas
+        return eliminadas
+
+    def metricas(self) -> Dict[str, int]:
+        return {
+            "vivas": len(self._datos),
+            "max_sesiones": self.max_sesiones,
+            "expiradas": self.total_expiradas,
+            "desalojadas_lru": self.total_desalojadas,
+        }
+
+
+class MemorySessionStore(SessionStore):
+    """Guarda los objetos tal cual en memoria del proceso. Solo sirve con un worker."""
+
+    def __init__(self, prefijo: str = "", ttl: int = SESSION_TTL, almacen: Optional[AlmacenMemoria] = None):
+        super().__init__(prefijo, ttl)
+        # Varios stores (prefijos) pueden compartir el mismo almacén
+        self.almacen = almacen or AlmacenMemoria()
+
+    def obtener(self, session_id: str) -> Optional[Any]:
+        return self.almacen.obtener(self._clave(session_id))
+
+    def guardar(self, session_id: str, sesion: Any, ttl: Optional[int] = None, si_estado: Optional[str] = None) -> bool:
+        return self.almacen.guardar(self._clave(session_id), sesion, ttl, self.ttl, si_estado)
+
+    def reclamar(self, session_id: str, estado_esperado: str, nuevo_estado: str) -> Optional[Any]:
+        return self.almacen.reclamar(self._clave(session_id), estado_esperado, nuevo_estado)
+
+    def eliminar(self, session_id: str) -> None:
+        self.almacen.eliminar(self._clave(session_id))
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        return iter(self.almacen.items(self.prefijo))
+
+    def limpiar_expiradas(self) -> int:
+        return self.almacen.limpiar_expiradas()
+
+    def metricas(self) -> Dict[str, Any]:
+        return {"backend": "memoria", **self.almacen.metricas()}
+
+    def __len__(self) -> int:
+        return self.almacen.contar(self.prefijo)
+
+
+# ============================================================================
+# BACKEND POSTGRES (tabla UNLOGGED compartida entre workers y réplicas)
+# ============================================================================
+
+class PostgresSessionStore(SessionStore):
+    """
+    Guarda las sesiones serializadas con pickle en una tabla UNLOGGED:
+    sin WAL (escrituras baratas) y se vacía si Postgres se reinicia, que es
+    aceptable para partidas en curso de minutos.
+
+    El estado de la sesión se copia en la columna `estado` en cada escritura,
+    así `reclamar` y `guardar(si_estado=...)` son un UPDATE condicional.
+    """
+
+    _tabla_creada = False
+    total_expiradas = 0
+
+    def __init__(self, engine, prefijo: str = "", ttl: int = SESSION_TTL):
+        super().__init__(prefijo, ttl)
+        self.engine = engine
+        self._crear_tabla()
+
+    def _crear_tabla(self) -> None:
+        if PostgresSessionStore._tabla_creada:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                CREATE UNLOGGED TABLE IF NOT EXISTS sesiones_juego (
+                    clave TEXT PRIMARY KEY,
+                    datos BYTEA NOT NULL,
+                    expira TIMESTAMPTZ NOT NULL
+                )
+            """))
+            conn.execute(text("ALTER TABLE sesiones_juego ADD COLUMN IF NOT EXISTS estado TEXT"))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_sesiones_juego_expira ON sesiones_juego (expira)"
+            ))
+        PostgresSessionStore._tabla_creada = True
+
+    def obtener(self, session_id: str) -> Optional[Any]:
+        with self.engine.connect() as conn:
+            datos = conn.execute(
+                text("SELECT datos FROM sesiones_juego WHERE clave = :clave AND expira > now()"),
+                {"clave": self._clave(session_id)}
+            ).scalar()
+        return pickle.loads(datos) if datos is not None else None
+
+    def guardar(self, session_id: str, sesion: Any, ttl: Optional[int] = None, si_estado: Optional[str] = None) -> bool:
+        parametros = {
+            "clave": self._clave(session_id),
+            "datos": pickle.dumps(sesion, protocol=pickle.HIGHEST_PROTOCOL),
+            "estado": estado_de(sesion),
+            "ttl": self.ttl if ttl is None else ttl,
+        }
+        if si_estado is not None:
+            # Solo si sigue en ese estado: nunca crea ni resucita la sesión
+            sql = """
+                UPDATE sesiones_juego SET datos = :datos, estado = :estado{expira}
+                WHERE clave = :clave AND estado = :si_estado AND expira > now()
+            """.format(expira="" if ttl is None else ", expira = now() + make_interval(secs => :ttl)")
+            parametros["si_estado"] = si_estado
+        elif ttl is None:
+            # Conservar la expiración de una sesión existente
+            sql = """
+                INSERT INTO sesiones_juego (clave, datos, estado, expira)
+                VALUES (:clave, :datos, :estado, now() + make_interval(secs => :ttl))
+                ON CONFLICT (clave) DO UPDATE SET datos = EXCLUDED.datos, estado = EXCLUDED.estado
+            """
+        else:
+            sql = """
+                INSERT INTO sesiones_juego (clave, datos, estado, expira)
+                VALUES (:clave, :datos, :estado, now() + make_interval(secs => :ttl))
+                ON CONFLICT (clave) DO UPDATE
+                SET datos = EXCLUDED.datos, estado = EXCLUDED.estado, expira = EXCLUDED.expira
+            """
+        with self.engine.begin() as conn:
+            return conn.execute(text(sql), parametros).rowcount > 0
+
+    def reclamar(self, session_id: str, estado_esperado: str, nuevo_estado: str) -> Optional[Any]:
+        clave = self._clave(session_id)
+        with self.engine.begin() as conn:
+            # El UPDATE condicional toma el lock de la fila: solo una petición lo gana
+            datos = conn.execute(text("""
+                UPDATE sesiones_juego SET estado = :nuevo
+                WHERE clave = :clave AND estado = :esperado AND expira > now()
+                RETURNING datos
+            """), {"clave": clave, "esperado": estado_esperado, "nuevo": nuevo_estado}).scalar()
+            if datos is None:
+                return None
+            sesion = pickle.loads(datos)
+            _fijar_estado(sesion, nuevo_estado)
+            # Misma transacción: nadie ve la columna y el pickle desalineados
+            conn.execute(
+                text("UPDATE sesiones_juego SET datos = :datos WHERE clave = :clave"),
+                {"clave": clave, "datos": pickle.dumps(sesion, protocol=pickle.HIGHEST_PROTOCOL)}
+            )
+        return sesion
+
+    def eliminar(self, session_id: str) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("DELETE FROM sesiones_juego WHERE clave = :clave"),
+                {"clave": self._clave(session_id)}
+            )
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        n = len(self.prefijo)
+        with self.engine.connect() as conn:
+            filas = conn.execute(
+                text("SELECT clave, datos FROM sesiones_juego WHERE clave LIKE :patron AND expira > now()"),
+                {"patron": f"{self.prefijo}%"}
+            ).all()
+        return iter([(clave[n:], pickle.loads(datos)) for clave, datos in filas])
+
+    def limpiar_expiradas(self) -> int:
+        with self.engine.begin() as conn:
+            eliminadas = conn.execute(text("DELETE FROM sesiones_juego WHERE expira <= now()")).rowcount
+        PostgresSessionStore.total_expiradas += eliminadas
+        return eliminadas
+
+    def metricas(self) -> Dict[str, Any]:
+        with self.engine.connect() as conn:
+            vivas = conn.execute(text("SELECT count(*) FROM sesiones_juego WHERE expira > now()")).scalar()
+        return {"backend": "postgres", "vivas": vivas, "expiradas": PostgresSessionStore.total_expiradas}
+
+    def __len__(self) -> int:
+        with self.engine.connect() as conn:
+            return conn.execute(
+                text("SELECT count(*) FROM sesiones_juego WHERE clave LIKE :patron AND expira > now()"),
+                {"patron": f"{self.prefijo}%"}
+            ).scalar()
+
+
+# ============================================================================
+# FÁBRICA
+# ============================================================================
+
+# memoria | postgres
+SESSION_STORE = os.environ.get("SESSION_STORE", "memoria").lower()
+
+_almacen_memoria = AlmacenMemoria()
+_stores: List[SessionStore] = []
+
+
+def crear_session_store(prefijo: str = "", ttl: int = SESSION_TTL) -> SessionStore:
+    """Crea el store configurado en SESSION_STORE (todos los prefijos comparten backend)."""
+    store: Optional[SessionStore] = None
+    if SESSION_STORE == "postgres":
+        from ..database import ES_SQLITE, engine
+        if ES_SQLITE:
+            print("⚠️ SESSION_STORE=postgres requiere PostgreSQL; usando memoria")
+        else:
+            store = PostgresSessionStore(engine, prefijo, ttl)
+    if store is None:
+        store = MemorySessionStore(prefijo, ttl, almacen=_almacen_memoria)
+    _stores.append(store)
+    return store
+
+
+def metricas_sesiones() -> Dict[str, Any]:
+    """Métricas del backend de sesiones (vivas, expiradas, desalojadas) para /info."""
+    if not _stores:
+        return {}
+    metricas = _stores[0].metricas()
+    metricas["por_prefijo"] = {store.prefijo: len(store) for store in _stores}
+    return metricas
+
+
+# ============================================================================
+# REAPER: única tarea de fondo que borra sesiones vencidas
+# ============================================================================
+
+_tarea_reaper: Optional[asyncio.Task] = None
+
+
+async def _bucle_reaper(intervalo: int) -> None:
+    while True:
+        await asyncio.sleep(intervalo)
+        if not _stores:
+            continue
+        try:
+            # Todos los stores comparten backend: basta con limpiar uno
+            eliminadas = await anyio.to_thread.run_sync(_stores[0].limpiar_expiradas)
+            if eliminadas:
+                print(f"🧹 [SESIONES] {eliminadas} sesiones expiradas eliminadas")
+        except Exception as e:
+            print(f"❌ [SESIONES] Error en el reaper: {e}")
+
+
+def iniciar_reaper(intervalo: int = SESSION_REAPER_SEGUNDOS) -> None:
+    """Arranca el reaper de sesiones (llamar desde el lifespan)."""
+    global _tarea_reaper
+    if _tarea_reaper is None:
+        _tarea_reaper = asyncio.create_task(_bucle_reaper(intervalo))
+
+
+async def detener_reaper() -> None:
+    global _tarea_reaper
+    if _tarea_reaper is not None:
+        _tarea_reaper.cancel()
+        try:
+            await _tarea_reaper
+        except asyncio.CancelledError:
+            pass
+        _tarea_reaper = None
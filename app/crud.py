@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
 import os
-import shutil
+
+from typing import Optional
 
 from fastapi import HTTPException, UploadFile
 from jose import jwt
@@ -10,6 +11,10 @@ from sqlalchemy.orm import Session
 from .models.usuario import Usuario
 from .models.verificacion import Verificacion
 from .schemas.auth import Token
+from .api.auth import invalidar_usuario_cache
+from .services.archivos import guardar_upload
+from .services.billetera import acreditar
+from .services.referidos import contar_verificacion
 
 
 # ------------------- Configuración -------------------
@@ -63,8 +68,14 @@ def autenticar_usuario(db: Session, username_or_email: str, password: str) -> To
 
 # ------------------- Usuario -------------------
 
-def listar_usuarios(db: Session):
-    return db.query(Usuario).all()
+def listar_usuarios(db: Session, limite: Optional[int] = None, despues_de: Optional[int] = None):
+    """Usuarios ordenados por id; con `despues_de` se continúa desde esa posición (keyset)"""
+    consulta = db.query(Usuario).order_by(Usuario.id)
+    if despues_de is not None:
+        consulta = consulta.filter(Usuario.id > despues_de)
+    if limite is not None:
+        consulta = consulta.limit(limite)
+    return consulta.all()
 
 def get_usuario_por_id(db: Session, user_id: int):
     return db.query(Usuario).filter(Usuario.id == user_id).first()
@@ -77,36 +88,27 @@ def verificar_usuario(db: Session, user_id: int):
     if usuario.verificado:
         raise HTTPException(status_code=400, detail="El usuario ya está verificado")
 
-    usuario2 = None
-    if usuario.referido_por:
-        usuario2 = db.query(Usuario).filter(Usuario.id == usuario.referido_por).first()
-
     usuario.verificado = True
-    usuario.saldo += 10000  # Aumenta saldo
-
-    if usuario2:
-        usuario2.saldo += 2000  # Aumenta saldo del referidor
+    # UPDATE atómicos (saldo = saldo + x), confirmados con la verificación
+    acreditar(db, usuario.id, 10000, commit=False)  # Aumenta saldo
+    if usuario.referido_por:
+        acreditar(db, usuario.referido_por, 2000, commit=False)  # Aumenta saldo del referidor
+    contar_verificacion(db, usuario.referido_por)
 
     db.commit()
+    invalidar_usuario_cache(usuario.id)
     db.refresh(usuario)
-    if usuario2:
-        db.refresh(usuario2)
     return usuario
 
 # ------------------- Verificaciones -------------------
 
 def crear_solicitud_verificacion(db: Session, user_id: int, archivo: UploadFile):
-    carpeta_recibos = "recibos"
-    if not os.path.exists(carpeta_recibos):
-        os.makedirs(carpeta_recibos)
-
-    filename = f"{carpeta_recibos}/{user_id}_{archivo.filename}"
-    with open(filename, "wb") as buffer:
-        shutil.copyfileobj(archivo.file, buffer)
+    # Handler síncrono (threadpool): la copia por bloques no bloquea el event loop
+    guardado = guardar_upload(archivo.file, archivo.filename)
 
     verificacion = Verificacion(
         usuario_id=user_id,
-        archivo_url=filename,
+        archivo_url=guardado.url,
         estado="pendiente"
     )
 
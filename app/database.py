@@ -1,8 +1,13 @@
 # app/database.py
-from sqlalchemy import create_engine
+import hashlib
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, create_engine, inspect, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 import os
+from typing import Optional
 from urllib.parse import urlparse
 
 # 🔹 Obtener DATABASE_URL de Railway (Railway la inyecta automáticamente)
@@ -16,32 +21,193 @@ if not DATABASE_URL:
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-# 🔹 Añadir parámetros SSL (obligatorio en Railway)
+ES_SQLITE = DATABASE_URL.startswith("sqlite")
+
+# 🔹 Añadir parámetros SSL (obligatorio en Railway, no aplica a SQLite local)
 # Parseamos la URL para mantener credenciales intactas
 parsed_url = urlparse(DATABASE_URL)
-query_params = "sslmode=require"
-if parsed_url.query:
-    DATABASE_URL = f"{DATABASE_URL.split('?')[0]}?{query_params}"
-else:
-    DATABASE_URL = f"{DATABASE_URL}?{query_params}"
+BASE_DATABASE_URL = DATABASE_URL.split('?')[0]
+if not ES_SQLITE:
+    DATABASE_URL = f"{BASE_DATABASE_URL}?sslmode=require"
 
 print(f"📡 Conectando a: {parsed_url.hostname}:{parsed_url.port}")  # Para debug
 
 # 🔹 Configuración del motor con parámetros optimizados
-engine = create_engine(
-    DATABASE_URL,
-    pool_size=10,  # Tamaño del pool de conexiones
-    max_overflow=20,  # Conexiones adicionales cuando el pool está lleno
-    pool_pre_ping=True,  # Verifica conexiones antes de usarlas
-    echo=False  # Cambia a True para ver queries SQL en logs (solo desarrollo)
-)
+if ES_SQLITE:
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        echo=False
+    )
+else:
+    engine = create_engine(
+        DATABASE_URL,
+        pool_size=10,  # Tamaño del pool de conexiones
+        max_overflow=20,  # Conexiones adicionales cuando el pool está lleno
+        pool_pre_ping=True,  # Verifica conexiones antes de usarlas
+        echo=False  # Cambia a True para ver queries SQL en logs (solo desarrollo)
+    )
 
 # 🔹 Sesión para interactuar con la base de datos
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# -------------------------------
+# Motor asíncrono (asyncpg en Railway, aiosqlite en local)
+# -------------------------------
+
+def _url_asincrona(url_base: str) -> str:
+    """Convierte la URL síncrona al driver asíncrono equivalente."""
+    if url_base.startswith("sqlite"):
+        return url_base.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    if url_base.startswith("postgresql+psycopg2://"):
+        return url_base.replace("postgresql+psycopg2://", "postgresql+asyncpg://", 1)
+    if url_base.startswith("postgresql://"):
+        return url_base.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url_base
+
+
+ASYNC_DATABASE_URL = os.environ.get("ASYNC_DATABASE_URL") or _url_asincrona(BASE_DATABASE_URL)
+
+if ES_SQLITE:
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False)
+else:
+    # asyncpg no entiende 'sslmode': el SSL se pasa como argumento de conexión
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        pool_size=int(os.environ.get("ASYNC_POOL_SIZE", 20)),
+        max_overflow=int(os.environ.get("ASYNC_MAX_OVERFLOW", 20)),
+        pool_pre_ping=True,
+        connect_args={"ssl": "require"},
+        echo=False
+    )
+
+# 🔹 expire_on_commit=False: en async no se puede recargar atributos de forma implícita
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 # 🔹 Base para los modelos
 Base = declarative_base()
 
+
+def crear_indices_faltantes():
+    """
+    create_all solo crea los índices al crear una tabla nueva; esto añade a las
+    tablas ya existentes los índices declarados después (checkfirst evita duplicarlos).
+    """
+    for tabla in Base.metadata.sorted_tables:
+        for indice in tabla.indexes:
+            indice.create(bind=engine, checkfirst=True)
+
+
+def crear_columnas_faltantes():
+    """
+    create_all tampoco altera tablas existentes: añade con ALTER TABLE las
+    columnas nuevas de los modelos (con su server_default, si lo tienen).
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for tabla in Base.metadata.sorted_tables:
+            if not inspector.has_table(tabla.name):
+                continue
+            existentes = {c["name"] for c in inspector.get_columns(tabla.name)}
+            for columna in tabla.columns:
+                if columna.name in existentes:
+                    continue
+                ddl = f"ALTER TABLE {tabla.name} ADD COLUMN {columna.name} {columna.type.compile(dialect=engine.dialect)}"
+                if columna.server_default is not None:
+                    ddl += f" DEFAULT {columna.server_default.arg}"
+                    if not columna.nullable:
+                        ddl += " NOT NULL"
+                conn.execute(text(ddl))
+                print(f"🧱 Columna añadida: {tabla.name}.{columna.name}")
+
+
+# -------------------------------
+# Versión del esquema
+# -------------------------------
+
+# Lock compartido por las réplicas para no sincronizar el esquema a la vez
+ESQUEMA_LOCK_ID = int(os.environ.get("ESQUEMA_LOCK_ID", 727_002))
+
+# Fuera de Base.metadata: no forma parte de la huella que registra
+_version_esquema = Table(
+    "esquema_version",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("huella", String(64), nullable=False),
+    Column("actualizado_en", DateTime, nullable=False)
+)
+
+
+def huella_esquema() -> str:
+    """
+    SHA-256 de las tablas, columnas e índices declarados en los modelos.
+    Cambia con cualquier modelo nuevo o modificado, sin numerar versiones a mano.
+    """
+    partes = []
+    for tabla in sorted(Base.metadata.sorted_tables, key=lambda t: t.name):
+        partes.append(f"T {tabla.name}")
+        for columna in tabla.columns:
+            default = columna.server_default.arg if columna.server_default is not None else None
+            partes.append(
+                f"C {columna.name} {columna.type.compile(dialect=engine.dialect)} {columna.nullable} {default}"
+            )
+        for indice in sorted(tabla.indexes, key=lambda i: i.name or ""):
+            partes.append(f"I {indice.name} {[c.name for c in indice.columns]} {indice.unique}")
+    return hashlib.sha256("\n".join(partes).encode()).hexdigest()
+
+
+def _huella_guardada(conn) -> Optional[str]:
+    try:
+        return conn.execute(
+            select(_version_esquema.c.huella).where(_version_esquema.c.id == 1)
+        ).scalar()
+    except Exception:
+        # La tabla aún no existe (primer arranque con esta versión)
+        conn.rollback()
+        return None
+
+
+def sincronizar_esquema() -> bool:
+    """
+    Sustituye al create_all de cada arranque: compara la huella de los modelos
+    con la guardada en `esquema_version` (una sola consulta) y solo si difiere
+    crea tablas, columnas e índices faltantes. Los modelos deben estar
+    importados antes de llamarla. Devuelve True si tuvo que sincronizar.
+    """
+    huella = huella_esquema()
+    with engine.connect() as conn:
+        if _huella_guardada(conn) == huella:
+            return False
+
+        if not ES_SQLITE:
+            # Con varias réplicas arrancando a la vez, solo una aplica el DDL
+            conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": ESQUEMA_LOCK_ID})
+        try:
+            # Otra réplica pudo terminar mientras se esperaba el lock
+            if _huella_guardada(conn) == huella:
+                return False
+            conn.commit()
+
+            Base.metadata.create_all(bind=engine)
+            crear_columnas_faltantes()
+            crear_indices_faltantes()
+
+            _version_esquema.create(bind=conn, checkfirst=True)
+            conn.execute(_version_esquema.delete())
+            conn.execute(_version_esquema.insert().values(id=1, huella=huella, actualizado_en=datetime.utcnow()))
+            conn.commit()
+        finally:
+            if not ES_SQLITE:
+                conn.rollback()
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": ESQUEMA_LOCK_ID})
+                conn.commit()
+    return True
+
 # -------------------------------
 # Función para obtener sesión de DB
 # -------------------------------
@@ -51,4 +217,13 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    """
+    Dependencia para obtener una sesión asíncrona de base de datos.
+    Permite migrar los routers uno a uno a handlers `async def` sin pasar por el threadpool.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -3,41 +3,28 @@ FastAPI Application - Sistema de Gaming y Referidos
 Versión optimizada para Railway
 """
 
+import importlib
 import os
+import time
 from datetime import date, datetime, timedelta
 from contextlib import asynccontextmanager
 
+_INICIO_ARRANQUE = time.perf_counter()
+
+import anyio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
-from app.database import Base, engine
-from app.services.auth import router as auth_router
-from app.services.referidos import router as referidos_router
-from app.services.verify import router as verify_router
-from app.services.admin import router as admin_router
-from app.services.vip import router as vip_router
-from app.services.vip import resolver_sorteo
-from app.services.inversion import acumular_intereses
-from app.services.juegos.blackjack import router as blackjack_router
-from app.services.juegos.bonus import router as bonus_router
-from app.services.juegos.ruleta import router as ruleta_router
-from app.services.juegos.tragamonedas import router as tragamonedas_router
-from app.services.juegos.dados import router as dados_router
-from app.services.juegos.minas import router as minas_router
-from app.services.transacciones import router as transacciones_router
-from app.services.juegos.aviator import router as aviator_router
-from app.services.juegos.caraosello import router as caraosello_router
-from app.services.juegos.cartamayor import router as cartamayor_router
-from app.services.inversion import router as inversion_router
-from app.services.juegos.piedrapapeltijera import router as piedrapapeltijera_router
-from app.services.juegos.ruletaeuropea import router as ruletaeuropea_router
-from app.services.juegos.poker import router as poker_router
-from app.services.juegos.tragamonedas2 import router as tragamonedas2_router
-from app.services.juegos.cascadastestris import router as cascadastestris_router
+from app import models  # noqa: F401  (registra las tablas para la huella del esquema)
+from app.database import async_engine, sincronizar_esquema
+from app.services import archivos
+from app.services.movimientos import buffer_movimientos
+from app.services.correos import enviador_correos
+from app.api.sesiones import iniciar_reaper, detener_reaper, metricas_sesiones
+from app.api.liderazgo import EleccionLider
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
 from sqlalchemy.orm import Session
 
 # ============================================================================
@@ -52,6 +39,81 @@ ALGORITHM = os.environ.get("ALGORITHM", "HS256")
 NEXT_DRAW = datetime.utcnow() + timedelta(days=3)
 PARTICIPANTS = []
 scheduler = AsyncIOScheduler()
+# Solo el proceso líder (advisory lock en Postgres) reanuda el scheduler
+eleccion_lider = EleccionLider(al_ganar=scheduler.resume, al_perder=scheduler.pause)
+
+# ============================================================================
+# CARGA DIFERIDA DE ROUTERS
+# ============================================================================
+
+# (módulo, prefijo, etiqueta) en orden de registro. Se importan en el lifespan,
+# en paralelo con la comprobación del esquema, y no al importar este módulo
+ROUTERS = [
+    ("app.services.auth", "", "Autenticación"),
+    ("app.services.referidos", "", "Referidos"),
+    ("app.services.verify", "/verificate", "Verificación"),
+    ("app.services.admin", "/admin", "Administración"),
+    ("app.services.vip", "/vip", "VIP"),
+    ("app.services.juegos.bonus", "/bonus-diario", "Juegos"),
+    ("app.services.juegos.blackjack", "/juegos/blackjack", "Juegos"),
+    ("app.services.juegos.ruleta", "/juegos/ruleta", "Juegos"),
+    ("app.services.juegos.tragamonedas", "/juegos/tragamonedas", "Juegos"),
+    ("app.services.juegos.dados", "/juegos/dados", "Juegos"),
+    ("app.services.juegos.minas", "/juegos/minas", "Juegos"),
+    ("app.services.juegos.caraosello", "", "Juegos"),
+    ("app.services.juegos.aviator", "", "Juegos"),
+    ("app.services.juegos.cartamayor", "", "Juegos"),
+    ("app.services.juegos.piedrapapeltijera", "", "Juegos"),
+    ("app.services.juegos.ruletaeuropea", "", "Juegos"),
+    ("app.services.juegos.poker", "", "Juegos"),
+    ("app.services.juegos.tragamonedas2", "/juegos/tragamonedas2", "Juegos"),
+    ("app.services.juegos.cascadastestris", "", "Juegos"),
+    ("app.services.transacciones", "/transacciones", "Transacciones"),
+    ("app.services.inversion", "/inversiones", "Inversiones"),
+]
+
+# Presupuesto de importación de routers; si se supera se avisa en el log
+ARRANQUE_PRESUPUESTO_MS = int(os.environ.get("ARRANQUE_PRESUPUESTO_MS", 1500))
+
+# Tiempos del último arranque (se exponen en /info)
+informe_arranque = {}
+
+
+def registrar_routers(app: FastAPI) -> None:
+    """
+    Importa y registra los routers midiendo cuánto cuesta cada módulo. El
+    tiempo es acumulado: el primer router que importa una dependencia
+    compartida (passlib, pytz...) es quien la paga.
+    """
+    tiempos = {}
+    for modulo, prefijo, etiqueta in ROUTERS:
+        inicio = time.perf_counter()
+        router = importlib.import_module(modulo).router
+        tiempos[modulo] = round((time.perf_counter() - inicio) * 1000, 1)
+        app.include_router(router, prefix=prefijo, tags=[etiqueta])
+
+    total = round(sum(tiempos.values()), 1)
+    informe_arranque["routers_ms"] = total
+    informe_arranque["importacion_ms"] = tiempos
+
+    lentos = sorted(tiempos.items(), key=lambda t: t[1], reverse=True)[:3]
+    detalle = ", ".join(f"{m.rsplit('.', 1)[-1]} {ms} ms" for m, ms in lentos)
+    if total > ARRANQUE_PRESUPUESTO_MS:
+        print(f"⚠️  Routers cargados en {total} ms (presupuesto {ARRANQUE_PRESUPUESTO_MS} ms); más lentos: {detalle}")
+    else:
+        print(f"📦 {len(ROUTERS)} routers cargados en {total} ms; más lentos: {detalle}")
+
+
+def comprobar_esquema() -> None:
+    inicio = time.perf_counter()
+    try:
+        if sincronizar_esquema():
+            print("✅ Esquema sincronizado (tablas, columnas e índices nuevos)")
+        else:
+            print("✅ Esquema al día (huella sin cambios)")
+    except Exception as e:
+        print(f"⚠️  Advertencia al sincronizar el esquema: {e}")
+    informe_arranque["esquema_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
 
 # ============================================================================
 # FUNCIONES DE CICLO DE VIDA (LIFESPAN)
@@ -62,9 +124,10 @@ async def ejecutar_sorteo_automatico():
     try:
         print("🎰 [SCHEDULER] Iniciando sorteo automático...")
         from app.database import SessionLocal
+        from app.services.vip import resolver_sorteo
         db = SessionLocal()
         try:
-            resolver_sorteo(db)
+            await anyio.to_thread.run_sync(resolver_sorteo, db)
             print("✅ [SCHEDULER] Sorteo completado exitosamente")
         except Exception as e:
             print(f"❌ [SCHEDULER] Error durante el sorteo: {e}")
@@ -73,18 +136,33 @@ async def ejecutar_sorteo_automatico():
     except Exception as e:
         print(f"🔥 [SCHEDULER] Error crítico: {e}")
         
-async def interes_acumulado_por_segundo():
-    """Calcular y acumular intereses para todas las inversiones activas cada segundo"""
+async def conciliar_referidos():
+    """Corregir desvíos en los contadores materializados de referidos"""
+    try:
+        from app.database import SessionLocal
+        from app.services.referidos import conciliar_contadores_referidos
+        db = SessionLocal()
+        try:
+            corregidos = await anyio.to_thread.run_sync(conciliar_contadores_referidos, db)
+            print(f"✅ [SCHEDULER] Contadores de referidos conciliados ({corregidos} corregidos)")
+        except Exception as e:
+            print(f"❌ [SCHEDULER] Error al conciliar referidos: {e}")
+        finally:
+            db.close()
+    except Exception as e:
+        print(f"🔥 [SCHEDULER] Error crítico: {e}")
+
+async def limpiar_archivos_huerfanos():
+    """Borrar comprobantes que ya no referencia ningún depósito ni verificación"""
     try:
-        print("💰 [SCHEDULER] Iniciando acumulación de intereses...")
         from app.database import SessionLocal
+        from app.services.archivos import limpiar_huerfanos
         db = SessionLocal()
         try:
-            from app.services.inversion import acumular_intereses
-            acumular_intereses(db)
-            print("✅ [SCHEDULER] Intereses acumulados exitosamente")
+            eliminados = await anyio.to_thread.run_sync(limpiar_huerfanos, db)
+            print(f"✅ [SCHEDULER] Limpieza de comprobantes: {eliminados} archivos huérfanos eliminados")
         except Exception as e:
-            print(f"❌ [SCHEDULER] Error durante la acumulación de intereses: {e}")
+            print(f"❌ [SCHEDULER] Error al limpiar comprobantes: {e}")
         finally:
             db.close()
     except Exception as e:
@@ -99,15 +177,29 @@ async def lifespan(app: FastAPI):
     # ==================== INICIO ====================
     print("🚀 Iniciando Gaming Platform API...")
     
-    # Crear tablas en la base de datos (solo si no existen)
-    try:
-        Base.metadata.create_all(bind=engine)
-        print("✅ Tablas de base de datos verificadas/creadas")
-    except Exception as e:
-        print(f"⚠️  Advertencia al crear tablas: {e}")
+    # La comprobación del esquema (ida y vuelta a la base) y la importación de
+    # los routers (CPU) se solapan: el arranque cuesta el mayor de los dos
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(anyio.to_thread.run_sync, comprobar_esquema)
+        tg.start_soon(anyio.to_thread.run_sync, registrar_routers, app)
     
+    # Reloj de las rondas compartidas de Aviator (liquida solo el líder)
+    from app.services.juegos.aviator import motor_rondas
+    await motor_rondas.iniciar(es_lider=lambda: eleccion_lider.es_lider)
+
+    # Arrancar el volcado en segundo plano del libro mayor de movimientos
+    await buffer_movimientos.iniciar()
+
+    # Reaper de sesiones de juego (los handlers ya no recorren la tabla)
+    iniciar_reaper()
+
+    # Enviador de la bandeja de salida de correos
+    await enviador_correos.iniciar()
+
     # Configurar y arrancar el scheduler
     try:
+        from apscheduler.triggers.cron import CronTrigger
+
         # Programar sorteo diario a las 23:59 hora Colombia
         scheduler.add_job(
             ejecutar_sorteo_automatico,
@@ -116,11 +208,24 @@ async def lifespan(app: FastAPI):
             replace_existing=True
         )
         
+        # Conciliación de contadores de referidos (también al tomar el liderazgo)
+        scheduler.add_job(
+            conciliar_referidos,
+            'interval',
+            minutes=int(os.environ.get("REFERIDOS_CONCILIAR_MINUTOS", 60)),
+            next_run_time=datetime.now(),
+            misfire_grace_time=None,
+            coalesce=True,
+            id='conciliar_referidos',
+            replace_existing=True
+        )
+
+        # Barrido de comprobantes huérfanos (almacenamiento por hash)
         scheduler.add_job(
-            interes_acumulado_por_segundo,
+            limpiar_archivos_huerfanos,
             'interval',
-            seconds=30,
-            id='acumular_intereses',
+            hours=int(os.environ.get("ARCHIVOS_LIMPIEZA_HORAS", 24)),
+            id='limpiar_archivos_huerfanos',
             replace_existing=True
         )
 
@@ -135,7 +240,9 @@ async def lifespan(app: FastAPI):
             )
             print("⏰ Scheduler de prueba configurado (cada 5 min)")
         
-        scheduler.start()
+        # Arranca en pausa: los jobs solo corren en el proceso líder
+        scheduler.start(paused=True)
+        await eleccion_lider.iniciar()
         print("✅ Scheduler iniciado correctamente")
         
     except Exception as e:
@@ -145,17 +252,32 @@ async def lifespan(app: FastAPI):
     print(f"🔧 Entorno: {os.environ.get('RAILWAY_ENVIRONMENT', 'desarrollo')}")
     print(f"🌐 Host: 0.0.0.0")
     print(f"🔑 Puerto: {os.environ.get('PORT', '8000')}")
+    informe_arranque["hasta_primera_peticion_ms"] = round((time.perf_counter() - _INICIO_ARRANQUE) * 1000, 1)
+    print(f"⏱️  Listo para recibir peticiones en {informe_arranque['hasta_primera_peticion_ms']} ms")
     
     yield  # La aplicación está en ejecución
     
     # ==================== FINALIZACIÓN ====================
     print("🛑 Deteniendo aplicación...")
     
+    # Soltar el liderazgo para que otro proceso tome los jobs
+    await eleccion_lider.detener()
+    
     # Apagar el scheduler
     if scheduler.running:
         scheduler.shutdown()
         print("✅ Scheduler detenido")
     
+    await enviador_correos.detener()
+    await motor_rondas.detener()
+    await detener_reaper()
+
+    # Volcar los movimientos pendientes antes de cerrar conexiones
+    await buffer_movimientos.detener()
+    
+    # Cerrar el pool de conexiones asíncronas
+    await async_engine.dispose()
+    
     print("👋 Aplicación finalizada")
 
 # ============================================================================
@@ -200,9 +322,9 @@ app.add_middleware(
 # ARCHIVOS ESTÁTICOS
 # ============================================================================
 
-# Crear directorio para recibos si no existe
-os.makedirs("recibos", exist_ok=True)
-app.mount("/recibos", StaticFiles(directory="recibos"), name="recibos")
+# Crear directorio para recibos si no existe (RECIBOS_DIR puede ser un volumen)
+os.makedirs(archivos.RECIBOS_DIR, exist_ok=True)
+app.mount(f"/{archivos.RECIBOS_URL}", StaticFiles(directory=archivos.RECIBOS_DIR), name="recibos")
 
 # ============================================================================
 # ENDPOINTS DE RAÍZ Y SALUD
@@ -248,57 +370,21 @@ def info():
     """Información detallada del sistema (solo desarrollo)"""
     if os.environ.get("RAILWAY_ENVIRONMENT") == "production":
         return {"message": "Información restringida en producción"}
+    from app.services.juegos.aviator import motor_rondas
     
     return {
         "python_version": os.environ.get("PYTHON_VERSION"),
         "database_url": f"{os.environ.get('DATABASE_URL', '')[:30]}..." if os.environ.get('DATABASE_URL') else "not set",
         "port": os.environ.get("PORT", "8000"),
         "scheduler_jobs": len(scheduler.get_jobs()) if scheduler.running else 0,
+        "scheduler_lider": eleccion_lider.es_lider,
+        "sesiones_juego": metricas_sesiones(),
+        "aviator_rondas": motor_rondas.metricas(),
+        "arranque": informe_arranque,
         "current_time_utc": datetime.utcnow().isoformat(),
         "current_time_colombia": (datetime.utcnow() - timedelta(hours=5)).isoformat()
     }
 
-# ============================================================================
-# REGISTRO DE ROUTERS
-# ============================================================================
-
-# Rutas de autenticación y usuarios
-app.include_router(auth_router, tags=["Autenticación"])
-
-# Rutas de referidos
-app.include_router(referidos_router, tags=["Referidos"])
-
-# Rutas de verificación
-app.include_router(verify_router, prefix="/verificate", tags=["Verificación"])
-
-# Rutas de administración
-app.include_router(admin_router, prefix="/admin", tags=["Administración"])
-
-# Rutas de VIP
-app.include_router(vip_router, prefix="/vip", tags=["VIP"])
-
-# Rutas de juegos
-app.include_router(bonus_router, prefix="/bonus-diario", tags=["Juegos"])
-app.include_router(blackjack_router, prefix="/juegos/blackjack", tags=["Juegos"])
-app.include_router(ruleta_router, prefix="/juegos/ruleta", tags=["Juegos"])
-app.include_router(tragamonedas_router, prefix="/juegos/tragamonedas", tags=["Juegos"])
-app.include_router(dados_router, prefix="/juegos/dados", tags=["Juegos"])
-app.include_router(minas_router, prefix="/juegos/minas", tags=["Juegos"])
-app.include_router(caraosello_router, prefix="", tags=["Juegos"])
-app.include_router(aviator_router, prefix="", tags=["Juegos"])
-app.include_router(cartamayor_router, prefix="", tags=["Juegos"])
-app.include_router(piedrapapeltijera_router, prefix="", tags=["Juegos"])
-app.include_router(ruletaeuropea_router, prefix="", tags=["Juegos"])
-app.include_router(poker_router, prefix="", tags=["Juegos"])
-app.include_router(tragamonedas2_router, prefix="/juegos/tragamonedas2", tags=["Juegos"])
-app.include_router(cascadastestris_router, prefix="", tags=["Juegos"])
-
-# Rutas de transacciones
-app.include_router(transacciones_router, prefix="/transacciones", tags=["Transacciones"])
-# Rutas de inversiones
-app.include_router(inversion_router, prefix="/inversiones", tags=["Inversiones"])
-
-
 # ============================================================================
 # PUNTO DE ENTRADA PARA RAILWAY
 # ============================================================================
@@ -0,0 +1,4 @@
+# app/models/__init__.py
+# Registra todos los modelos en Base.metadata (la huella del esquema y los
+# mappers con relaciones por nombre necesitan verlos todos)
+from . import apuesta_ronda, correo, deposito, inversion, movimiento, resultado_sorteo, retiro, usuario, verificacion
@@ -0,0 +1,32 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Numeric, Float, Index
+from datetime import datetime
+from app.database import Base
+
+class ApuestaRonda(Base):
+    """
+    Apuesta en una ronda compartida de Aviator. El estado avanza con UPDATE
+    condicionales (activa -> cobrada -> liquidada): el retiro y la
+    liquidación no pueden pisarse y una apuesta se paga una sola vez.
+    """
+    __tablename__ = "apuestas_ronda"
+
+    id = Column(String(36), primary_key=True)  # uuid4
+    ronda_id = Column(String, nullable=False)
+    usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=False)
+    apuesta = Column(Numeric(12, 2), nullable=False)
+    auto = Column(Numeric(6, 2), nullable=True)  # auto-retiro pedido
+    retiro = Column(Numeric(6, 2), nullable=True)  # multiplicador del retiro manual
+    multiplicador_crash = Column(Numeric(6, 2), nullable=False)
+    despegue = Column(Float, nullable=False)  # epoch
+    explosion = Column(Float, nullable=False)  # epoch
+    estado = Column(String, nullable=False, default="activa")  # activa, cobrada, liquidada
+    fecha = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("ix_apuestas_ronda_ronda_estado", "ronda_id", "estado"),
+        # Recuperar lo que dejó sin liquidar un líder anterior
+        Index("ix_apuestas_ronda_estado_explosion", "estado", "explosion"),
+    )
+
+    def __repr__(self):
+        return f"<ApuestaRonda(id={self.id}, ronda_id={self.ronda_id}, usuario_id={self.usuario_id}, estado={self.estado})>"
@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index
+from datetime import datetime
+from app.database import Base
+
+class CorreoSaliente(Base):
+    """
+    Bandeja de salida de correos. El handler solo inserta la fila (en su misma
+    transacción) y el enviador en segundo plano la despacha con reintentos.
+    """
+    __tablename__ = "correos_salientes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    destinatario = Column(String, nullable=False)
+    asunto = Column(String, nullable=False)
+    texto = Column(Text, nullable=False)
+    html = Column(Text, nullable=False)
+    estado = Column(String, nullable=False, default="pendiente")  # pendiente, enviado, fallido
+    intentos = Column(Integer, nullable=False, default=0)
+    proximo_intento = Column(DateTime, nullable=False, default=datetime.utcnow)
+    ultimo_error = Column(Text, nullable=True)
+    creado_en = Column(DateTime, nullable=False, default=datetime.utcnow)
+    enviado_en = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_correos_salientes_estado_proximo", "estado", "proximo_intento"),
+    )
+
+    def __repr__(self):
+        return f"<CorreoSaliente(id={self.id}, destinatario={self.destinatario}, estado={self.estado})>"
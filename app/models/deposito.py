@@ -1,5 +1,5 @@
 # app/models.py (agregar estos modelos)
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from ..database import Base
@@ -17,4 +17,11 @@ class Deposito(Base):
     fecha_solicitud = Column(DateTime, default=datetime.now)
     fecha_procesamiento = Column(DateTime, nullable=True)
     
-    usuario = relationship("Usuario", back_populates="depositos")
\ No newline at end of file
+    usuario = relationship("Usuario", back_populates="depositos")
+
+    __table_args__ = (
+        # Cola del panel de administración: WHERE estado = ... ORDER BY fecha_solicitud
+        Index("ix_depositos_estado_fecha", "estado", "fecha_solicitud"),
+        # Historial del usuario: WHERE usuario_id = ... ORDER BY fecha_solicitud
+        Index("ix_depositos_usuario_fecha", "usuario_id", "fecha_solicitud"),
+    )
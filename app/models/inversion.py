@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Float, String, DateTime, Boolean, ForeignKey, JSON
+from sqlalchemy import Column, Integer, Float, String, DateTime, Boolean, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from ..database import Base
@@ -9,7 +9,7 @@ class Inversion(Base):
     id = Column(Integer, primary_key=True, index=True)
     usuario_id = Column(Integer, ForeignKey("usuarios.id"))
     monto = Column(Float, nullable=False)  # Monto depositado
-    interes_acumulado = Column(Float, default=0)  # Intereses acumulados
+    interes_acumulado = Column(Float, default=0)  # Se calcula al leer (calcular_interes); 0 tras cada retiro
     fecha_deposito = Column(DateTime, default=datetime.utcnow)
     fecha_ultimo_retiro_intereses = Column(DateTime, nullable=True)
     fecha_ultimo_retiro_capital = Column(DateTime, nullable=True)
@@ -22,6 +22,10 @@ class Inversion(Base):
     usuario = relationship("Usuario", back_populates="inversiones")
     retiros = relationship("RetiroInversion", back_populates="inversion")
 
+    __table_args__ = (
+        Index("ix_inversiones_usuario_fecha", "usuario_id", "fecha_deposito"),
+    )
+
 class RetiroInversion(Base):
     __tablename__ = "retiros_inversiones"
     
@@ -33,4 +37,8 @@ class RetiroInversion(Base):
     detalles = Column(JSON, nullable=True)
     
     # Relaciones
-    inversion = relationship("Inversion", back_populates="retiros")
\ No newline at end of file
+    inversion = relationship("Inversion", back_populates="retiros")
+
+    __table_args__ = (
+        Index("ix_retiros_inversiones_inversion_fecha", "inversion_id", "fecha"),
+    )
@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Numeric, Text, Index
+from datetime import datetime
+from app.database import Base
+
+class Movimiento(Base):
+    """
+    Libro mayor (append-only) de movimientos de saldo: apuestas, premios,
+    depósitos, retiros e intereses. Nunca se actualiza ni se borra una fila.
+    """
+    __tablename__ = "movimientos"
+
+    id = Column(Integer, primary_key=True, index=True)
+    usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=False)
+    tipo = Column(String, nullable=False)  # apuesta, premio, deposito, retiro, interes, bonus
+    juego = Column(String, nullable=True)  # dados, ruleta, minas... (NULL si no es un juego)
+    monto = Column(Numeric(12, 2), nullable=False)
+    saldo_resultante = Column(Numeric(12, 2), nullable=True)
+    detalles = Column(Text, nullable=True)  # JSON serializado
+    fecha = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("ix_movimientos_usuario_fecha", "usuario_id", "fecha"),
+    )
+
+    def __repr__(self):
+        return f"<Movimiento(id={self.id}, usuario_id={self.usuario_id}, tipo={self.tipo}, monto={self.monto})>"
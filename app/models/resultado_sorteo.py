@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, DateTime, Float, Boolean
+from sqlalchemy import Column, ForeignKey, Integer, String, DateTime, Float, Boolean, Index
 from datetime import datetime
 from sqlalchemy.orm import relationship
 import pytz
@@ -13,6 +13,14 @@ class ResultadoSorteo(Base):
     ganadores = Column(String, nullable=False)  # JSON serializado
     total_participantes = Column(Integer, nullable=False, default=0)
     total_ganadores = Column(Integer, nullable=False, default=0)
+    # Corte del sorteo (id máximo de participación incluido) y si ya se
+    # archivaron todas sus participaciones; NULL en sorteos anteriores
+    corte_participacion_id = Column(Integer, nullable=True)
+    archivado = Column(Boolean, nullable=True)
+
+    __table_args__ = (
+        Index("ix_resultados_sorteo_fecha", "fecha", "id"),
+    )
 
     def __repr__(self):
         return f"<ResultadoSorteo(id={self.id}, numero_ganador={self.numero_ganador})>"
@@ -31,4 +39,16 @@ class ParticipanteSorteo(Base):
     
     # Relaciones
     sorteo = relationship("ResultadoSorteo")
-    usuario = relationship("Usuario", backref="participaciones")
\ No newline at end of file
+    usuario = relationship("Usuario", backref="participaciones")
+
+class ContadorSorteo(Base):
+    """
+    Agregado del sorteo activo (una sola fila, id=1). Lo mantienen en la misma
+    transacción la inscripción y la resolución del sorteo, para que
+    /vip/next_draw no tenga que contar participantes_sorteo en cada consulta.
+    """
+    __tablename__ = "contadores_sorteo"
+
+    id = Column(Integer, primary_key=True)
+    participantes = Column(Integer, nullable=False, default=0)
+    fichas = Column(Integer, nullable=False, default=0)
@@ -10,12 +10,16 @@ class Usuario(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     username = Column(String, unique=True, index=True, nullable=False)
     password_hash = Column(String, nullable=False)
-    referido_por = Column(Integer, ForeignKey("usuarios.id"), nullable=True)
+    referido_por = Column(Integer, ForeignKey("usuarios.id"), nullable=True, index=True)
     saldo = Column(Numeric(10, 2), default=0.00)
     verificado = Column(Boolean, default=False)
     verificacion_pendiente = Column(Boolean, default=False)
     fecha_registro = Column(DateTime, default=datetime.utcnow)
     ultima_recompensa = Column(Date, nullable=True)
+    # Contadores de referidos: se actualizan al registrar/verificar y un job los concilia
+    referidos_total = Column(Integer, nullable=False, default=0, server_default="0")
+    referidos_verificados = Column(Integer, nullable=False, default=0, server_default="0")
+    ganancia_referidos = Column(Integer, nullable=False, default=0, server_default="0")
 
     # Relaciones
     referidos = relationship("Usuario", backref="padrino", remote_side=[id])
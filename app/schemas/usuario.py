@@ -73,10 +73,13 @@ from typing import List, Optional
 class SubReferidoOut(BaseModel):
     username: str
     verificado: bool
+    referidos: List["SubReferidoOut"] = []  # Solo se llena con profundidad > 2
 
     class Config:
         from_attributes = True
 
+SubReferidoOut.model_rebuild()
+
 class ReferidoOut(BaseModel):
     username: str
     verificado: bool
@@ -1,29 +1,61 @@
 from datetime import datetime
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from ..database import get_db
-from ..api.auth import verificar_admin
+from ..api.auth import invalidar_usuario_cache, verificar_admin
+from ..api.paginacion import CABECERA_CURSOR, PAGINA_MAXIMA, PAGINA_POR_DEFECTO, cortar_pagina, decodificar_cursor
 from ..models.usuario import Usuario
 from ..schemas.usuario import UsuarioOut
 from ..models.verificacion import Verificacion
 from ..schemas.verificacion import VerificacionOut
 from ..services.mail import smtp2go
-from fastapi import BackgroundTasks
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 from ..crud import listar_usuarios, listar_verificaciones_pendientes, verificar_usuario
+from .billetera import acreditar
+from .referidos import contar_verificacion
+from .correos import encolar_correo, enviador_correos
 
 router = APIRouter()
 
+# Bonos por verificación: usuario, referidor y referidor del referidor
+BONO_VERIFICACION = 10000
+BONO_REFERIDOR = 2000
+BONO_SUBREFERIDOR = 200
+
+
+def _acreditar_bonos_verificacion(db: Session, usuario: Usuario) -> None:
+    """
+    Abona los bonos con UPDATE atómicos (saldo = saldo + x) sin commit: se
+    confirman junto con la verificación y no pisan apuestas concurrentes.
+    """
+    if usuario.referido_por:
+        acreditar(db, usuario.referido_por, BONO_REFERIDOR, commit=False)
+        referidor = db.get(Usuario, usuario.referido_por)
+        if referidor and referidor.referido_por:
+            acreditar(db, referidor.referido_por, BONO_SUBREFERIDOR, commit=False)
+    nuevo_saldo = acreditar(db, usuario.id, BONO_VERIFICACION, commit=False)
+    # El objeto de la sesión no ve el UPDATE: se fija el saldo sin marcarlo como modificado
+    set_committed_value(usuario, "saldo", nuevo_saldo)
+
 # ========================
 # PANEL DE ADMINISTRACIÓN
 # ========================
 @router.get("/admin/usuarios", response_model=List[UsuarioOut])
 def admin_listar_usuarios(
+    response: Response,
+    limite: int = Query(PAGINA_POR_DEFECTO, ge=1, le=PAGINA_MAXIMA),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(verificar_admin)
 ):
-    """Listar todos los usuarios (admin)"""
-    return listar_usuarios(db)
+    """Listar usuarios (admin), paginados por id"""
+    posicion = decodificar_cursor(cursor, (int,))
+    usuarios = listar_usuarios(db, limite=limite + 1, despues_de=posicion[0] if posicion else None)
+    usuarios, siguiente = cortar_pagina(usuarios, limite, lambda u: (u.id,))
+    if siguiente:
+        response.headers[CABECERA_CURSOR] = siguiente
+    return usuarios
 
 @router.get("/admin/verificaciones", response_model=List[VerificacionOut])
 def admin_listar_verificaciones(
@@ -36,7 +68,6 @@ def admin_listar_verificaciones(
 @router.post("/admin/verificar/{user_id}")
 async def admin_verificar_usuario(
     user_id: int,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(verificar_admin)  # Asumiendo que tienes esta función
 ):
@@ -52,39 +83,19 @@ async def admin_verificar_usuario(
     
     if not usuario.email:
         raise HTTPException(status_code=400, detail="Usuario sin email")
-     # Dar bonus al referidor si existe
-    if usuario.referido_por != 0:
-        referidor = db.query(Usuario).filter_by(id=usuario.referido_por).first()
-        if referidor:
-            referidor.saldo += 2000
-        if referidor.referido_por != 0:
-            sub_referidor = db.query(Usuario).filter_by(id=referidor.referido_por).first()
-            if sub_referidor: 
-                sub_referidor.saldo += 200
-            db.commit()
-    #DAR BONUS PORSUBREFERIDO
     
     # Marcar como verificado
     usuario.verificado = True
     usuario.fecha_verificacion = datetime.now()
     usuario.verificacion_pendiente = False
-    usuario.saldo += 10000  # Bonus por verificación
+    _acreditar_bonos_verificacion(db, usuario)
+    contar_verificacion(db, usuario.referido_por)
+    # Correo de confirmación por la bandeja de salida (se confirma con la verificación)
+    encolar_correo(db, usuario.email, *smtp2go.contenido_verificacion(usuario))
     db.commit()
+    invalidar_usuario_cache(usuario.id)
     
-    # Función para enviar email en background
-    def enviar_email():
-        try:
-            resultado = smtp2go.enviar_verificacion(usuario)
-            # Opcional: marcar que se envió el correo
-            if resultado.get("success"):
-                usuario.correo_enviado = True
-                usuario.correo_fecha = datetime.now()
-                db.commit()
-        except Exception as e:
-            print(f"Error enviando email: {e}")
-    
-    # Agregar tarea en background
-    background_tasks.add_task(enviar_email)
+    enviador_correos.despertar()
     
     return {
         "ok": True,
@@ -139,6 +150,7 @@ def admin_rechazar_verificacion(
     verificacion.estado = "rechazada"
     # Opcional: guardar comentarios (requiere agregar campo al modelo)
     db.commit()
+    invalidar_usuario_cache(user_id)
 
     return {
         "mensaje": "Verificación rechazada",
@@ -164,6 +176,7 @@ def admin_eliminar_usuario(
     username_eliminado = usuario.username
     db.delete(usuario)
     db.commit()
+    invalidar_usuario_cache(user_id)
 
     return {
         "mensaje": f"Usuario {username_eliminado} eliminado correctamente",
@@ -173,7 +186,6 @@ def admin_eliminar_usuario(
 @router.post("/verificacion/{user_id}")
 async def verificar_usuario(
     user_id: int,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """Verificar usuario manualmente - Versión simple"""
@@ -188,39 +200,19 @@ async def verificar_usuario(
     
     if not usuario.email:
         raise HTTPException(status_code=400, detail="Usuario sin email")
-     # Dar bonus al referidor si existe
-    if usuario.referido_por != 0:
-        referidor = db.query(Usuario).filter_by(id=usuario.referido_por).first()
-        if referidor:
-            referidor.saldo += 2000
-        if referidor.referido_por != 0:
-            sub_referidor = db.query(Usuario).filter_by(id=referidor.referido_por).first()
-            if sub_referidor: 
-                sub_referidor.saldo += 200
-            db.commit()
-    #DAR BONUS PORSUBREFERIDO
     
     # Marcar como verificado
     usuario.verificado = True
     usuario.fecha_verificacion = datetime.now()
     usuario.verificacion_pendiente = False
-    usuario.saldo += 10000  # Bonus por verificación
+    _acreditar_bonos_verificacion(db, usuario)
+    contar_verificacion(db, usuario.referido_por)
+    # Correo de confirmación por la bandeja de salida (se confirma con la verificación)
+    encolar_correo(db, usuario.email, *smtp2go.contenido_verificacion(usuario))
     db.commit()
+    invalidar_usuario_cache(usuario.id)
     
-    # Función para enviar email en background
-    def enviar_email():
-        try:
-            resultado = smtp2go.enviar_verificacion(usuario)
-            # Opcional: marcar que se envió el correo
-            if resultado.get("success"):
-                usuario.correo_enviado = True
-                usuario.correo_fecha = datetime.now()
-                db.commit()
-        except Exception as e:
-            print(f"Error enviando email: {e}")
-    
-    # Agregar tarea en background
-    background_tasks.add_task(enviar_email)
+    enviador_correos.despertar()
     
     return {
         "ok": True,
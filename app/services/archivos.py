@@ -0,0 +1,178 @@
+# app/services/archivos.py
+"""
+Pipeline común para guardar archivos subidos (comprobantes y verificaciones).
+
+El archivo se copia en bloques de UPLOAD_CHUNK_BYTES, fuera del event loop,
+cortando en cuanto supera UPLOAD_MAX_BYTES, y se calcula su SHA-256 durante la
+misma copia. Se escribe en un temporal del mismo directorio y se publica con
+un rename atómico, así nunca queda a la vista un archivo a medio escribir.
+
+El almacenamiento es direccionado por contenido: el nombre final es el hash
+(`ab/cd/abcd....png` dentro de RECIBOS_DIR), repartido en dos niveles de
+subdirectorios para que ningún directorio crezca sin límite. Subir dos veces
+la misma captura reutiliza el archivo existente.
+
+RECIBOS_DIR es solo dónde vive en disco (p. ej. un volumen montado); main.py
+lo sirve en /RECIBOS_URL. En la base se guarda la URL relativa a ese montaje
+(`recibos/ab/cd/abcd....png`), no la ruta del sistema de archivos. Las
+referencias son las filas de `Deposito.comprobante_url` y
+`Verificacion.archivo_url`; `limpiar_huerfanos` borra los archivos que ya no
+tienen ninguna.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import time
+from typing import BinaryIO, NamedTuple
+
+import anyio
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..models.deposito import Deposito
+from ..models.verificacion import Verificacion
+
+RECIBOS_DIR = os.environ.get("RECIBOS_DIR", "recibos")
+# Prefijo en el que main.py monta RECIBOS_DIR (y de las URLs guardadas)
+RECIBOS_URL = "recibos"
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_MB", 10)) * 1024 * 1024
+UPLOAD_CHUNK_BYTES = int(os.environ.get("UPLOAD_CHUNK_KB", 256)) * 1024
+# Los archivos más nuevos que esto no se tocan (su fila puede no estar confirmada aún)
+ARCHIVOS_GRACIA_SEGUNDOS = int(os.environ.get("ARCHIVOS_GRACIA_MINUTOS", 60)) * 60
+
+_PREFIJO_TEMPORAL = ".subida-"
+_SHARD = re.compile(r"^[0-9a-f]{2}$")
+
+
+class ArchivoGuardado(NamedTuple):
+    url: str
+    sha256: str
+    tamano: int
+
+
+def nombre_seguro(nombre: str) -> str:
+    """Quita rutas del nombre enviado por el cliente (evita escribir fuera del directorio)."""
+    return os.path.basename((nombre or "").replace("\\", "/")) or "archivo"
+
+
+def _extension(nombre: str) -> str:
+    """Extensión en minúsculas si es razonable (".png", ".pdf"...), si no, vacía."""
+    extension = os.path.splitext(nombre_seguro(nombre))[1].lower()
+    return extension if re.fullmatch(r"\.[a-z0-9]{1,8}", extension) else ""
+
+
+def ruta_por_hash(sha256: str, extension: str = "", directorio: str = RECIBOS_DIR) -> str:
+    """<directorio>/ab/cd/abcd...ext"""
+    return os.path.join(directorio, sha256[:2], sha256[2:4], sha256 + extension)
+
+
+def url_por_hash(sha256: str, extension: str = "") -> str:
+    """recibos/ab/cd/abcd...ext (relativa al montaje de estáticos)"""
+    return f"{RECIBOS_URL}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}"
+
+
+def guardar_upload(
+    origen: BinaryIO,
+    nombre_original: str,
+    directorio: str = RECIBOS_DIR,
+    max_bytes: int = UPLOAD_MAX_BYTES
+) -> ArchivoGuardado:
+    """
+    Guarda `origen` bajo su hash (operación bloqueante: llamar desde el
+    threadpool o con `guardar_upload_async`). Del nombre original solo se
+    conserva la extensión. Lanza 413 si el archivo supera `max_bytes`; en ese
+    caso no queda nada escrito.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    digest = hashlib.sha256()
+    tamano = 0
+
+    fd, temporal = tempfile.mkstemp(dir=directorio, prefix=_PREFIJO_TEMPORAL)
+    try:
+        with os.fdopen(fd, "wb") as salida:
+            while True:
+                bloque = origen.read(UPLOAD_CHUNK_BYTES)
+                if not bloque:
+                    break
+                tamano += len(bloque)
+                if tamano > max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"El archivo supera el máximo de {max_bytes // (1024 * 1024)} MB"
+                    )
+                digest.update(bloque)
+                salida.write(bloque)
+
+        sha256 = digest.hexdigest()
+        extension = _extension(nombre_original)
+        destino = ruta_por_hash(sha256, extension, directorio)
+        if os.path.exists(destino):
+            # Mismo contenido ya almacenado: se reutiliza (deduplicación). Se
+            # renueva su fecha para que la limpieza no lo borre antes del commit
+            os.remove(temporal)
+            os.utime(destino)
+        else:
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            os.replace(temporal, destino)
+    except BaseException:
+        try:
+            os.remove(temporal)
+        except OSError:
+            pass
+        raise
+
+    return ArchivoGuardado(url=url_por_hash(sha256, extension), sha256=sha256, tamano=tamano)
+
+
+async def guardar_upload_async(
+    archivo: UploadFile,
+    directorio: str = RECIBOS_DIR,
+    max_bytes: int = UPLOAD_MAX_BYTES
+) -> ArchivoGuardado:
+    """Versión para handlers `async def`: la copia corre en el threadpool."""
+    return await anyio.to_thread.run_sync(
+        guardar_upload, archivo.file, archivo.filename, directorio, max_bytes
+    )
+
+
+def limpiar_huerfanos(db: Session, directorio: str = RECIBOS_DIR) -> int:
+    """
+    Borra los archivos del almacenamiento por hash que ninguna fila referencia
+    (y los temporales abandonados). Solo recorre los subdirectorios de shard,
+    así que los comprobantes antiguos con nombre libre no se tocan.
+    Devuelve cuántos archivos eliminó. Operación bloqueante.
+    """
+    if not os.path.isdir(directorio):
+        return 0
+
+    prefijo = RECIBOS_URL + "/"
+    referenciados = set()
+    for columna in (Deposito.comprobante_url, Verificacion.archivo_url):
+        referenciados.update(
+            db.execute(select(columna).where(columna.like(prefijo + "%")).distinct()).scalars()
+        )
+
+    limite = time.time() - ARCHIVOS_GRACIA_SEGUNDOS
+    eliminados = 0
+
+    for entrada in os.scandir(directorio):
+        if entrada.is_file() and entrada.name.startswith(_PREFIJO_TEMPORAL) and entrada.stat().st_mtime < limite:
+            os.remove(entrada.path)
+            eliminados += 1
+
+    for nivel1 in os.scandir(directorio):
+        if not (nivel1.is_dir() and _SHARD.match(nivel1.name)):
+            continue
+        for nivel2 in os.scandir(nivel1.path):
+            if not (nivel2.is_dir() and _SHARD.match(nivel2.name)):
+                continue
+            for archivo in os.scandir(nivel2.path):
+                ruta = f"{prefijo}{nivel1.name}/{nivel2.name}/{archivo.name}"
+                if ruta in referenciados or archivo.stat().st_mtime >= limite:
+                    continue
+                os.remove(archivo.path)
+                eliminados += 1
+
+    return eliminados
@@ -4,11 +4,13 @@ from typing import List
 import random
 from ..models import usuario, resultado_sorteo
 from ..database import get_db
-from ..api.auth import get_current_user
+from ..api.auth import UsuarioActual, get_current_principal, get_current_user
 from ..crud import autenticar_usuario, hash_password
 from ..schemas.usuario import UsuarioCreate, UsuarioOut
 from ..schemas.auth import Token, UsuarioLogin
-from .mail import SMTP2GoSimple
+from .mail import smtp2go
+from .correos import encolar_correo, enviador_correos
+from .referidos import contar_nuevo_referido
 
 router = APIRouter()
 
@@ -43,10 +45,12 @@ def registrar_usuario(user: UsuarioCreate, db: Session = Depends(get_db)):
     )
 
     db.add(nuevo_usuario)
+    contar_nuevo_referido(db, ref_id)
+    # El correo sale por la bandeja de salida: el registro no espera a SMTP2Go
+    encolar_correo(db, nuevo_usuario.email, *smtp2go.contenido_solicitud_verificacion(nuevo_usuario))
     db.commit()
     db.refresh(nuevo_usuario)
-
-    SMTP2GoSimple().enviar_solicitud_verificacion(nuevo_usuario)
+    enviador_correos.despertar()
 
     return nuevo_usuario
 
@@ -64,10 +68,15 @@ def obtener_info_usuario_actual(
     return current_user
 
 @router.get("/usuario/info")
-def obtener_info_basica_usuario(current_user: usuario.Usuario = Depends(get_current_user)):
+def obtener_info_basica_usuario(
+    db: Session = Depends(get_db),
+    current_user: UsuarioActual = Depends(get_current_principal)
+):
     """Obtener información básica del usuario (ID, username, saldo)"""
+    # Identidad desde caché; el saldo siempre se lee en vivo
+    saldo = db.query(usuario.Usuario.saldo).filter(usuario.Usuario.id == current_user.id).scalar()
     return {
         "id": current_user.id,
         "username": current_user.username,
-        "saldo": current_user.saldo
+        "saldo": saldo
     }
\ No newline at end of file
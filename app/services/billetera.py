@@ -0,0 +1,213 @@
+# app/services/billetera.py
+"""
+Operaciones atómicas sobre el saldo de los usuarios.
+
+Cada operación es un único UPDATE condicional con RETURNING, de modo que
+validar saldo, descontar y leer el nuevo saldo cuesta un solo round trip y
+no hay carreras de lost-update cuando un usuario lanza apuestas en paralelo.
+
+Si se indica `juego` (o `tipo`), el movimiento se encola en el libro mayor
+(`movimientos.registrar_al_confirmar`) cuando la transacción hace commit: con
+`commit=False` eso ocurre en el commit del llamador y un rollback lo descarta.
+"""
+from decimal import Decimal
+from typing import Dict, Optional, Union
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..models.usuario import Usuario
+from .movimientos import registrar_al_confirmar
+
+Monto = Union[int, float, Decimal]
+
+
+def _a_decimal(monto: Monto) -> Decimal:
+    return monto if isinstance(monto, Decimal) else Decimal(str(monto))
+
+
+def _con_saldo(stmt):
+    return stmt.returning(Usuario.saldo).execution_options(synchronize_session=False)
+
+
+def _ejecutar(db: Session, stmt) -> Optional[Decimal]:
+    return db.execute(_con_saldo(stmt)).scalar_one_or_none()
+
+
+def _sentencia_debito(usuario_id: int, monto: Decimal):
+    return (
+        update(Usuario)
+        .where(Usuario.id == usuario_id, Usuario.saldo >= monto)
+        .values(saldo=Usuario.saldo - monto)
+    )
+
+
+def _sentencia_credito(usuario_id: int, monto: Decimal):
+    return (
+        update(Usuario)
+        .where(Usuario.id == usuario_id)
+        .values(saldo=Usuario.saldo + monto)
+    )
+
+
+def debitar(
+    db: Session,
+    usuario_id: int,
+    monto: Monto,
+    commit: bool = True,
+    juego: Optional[str] = None,
+    tipo: str = "apuesta",
+    detalles: Optional[dict] = None
+) -> Optional[Decimal]:
+    """
+    UPDATE usuarios SET saldo = saldo - :monto WHERE id = :id AND saldo >= :monto RETURNING saldo
+
+    Devuelve el nuevo saldo, o None si el saldo es insuficiente (o el usuario no existe).
+    """
+    monto = _a_decimal(monto)
+    nuevo_saldo = _ejecutar(db, _sentencia_debito(usuario_id, monto))
+    if nuevo_saldo is not None and juego:
+        registrar_al_confirmar(db, usuario_id, tipo, -monto, juego=juego, saldo_resultante=nuevo_saldo, detalles=detalles)
+    if commit:
+        db.commit()
+    return nuevo_saldo
+
+
+def acreditar(
+    db: Session,
+    usuario_id: int,
+    monto: Monto,
+    commit: bool = True,
+    juego: Optional[str] = None,
+    tipo: str = "premio",
+    detalles: Optional[dict] = None
+) -> Optional[Decimal]:
+    """
+    UPDATE usuarios SET saldo = saldo + :monto WHERE id = :id RETURNING saldo
+
+    Devuelve el nuevo saldo, o None si el usuario no existe.
+    """
+    monto = _a_decimal(monto)
+    nuevo_saldo = _ejecutar(db, _sentencia_credito(usuario_id, monto))
+    if nuevo_saldo is not None and juego and monto:
+        registrar_al_confirmar(db, usuario_id, tipo, monto, juego=juego, saldo_resultante=nuevo_saldo, detalles=detalles)
+    if commit:
+        db.commit()
+    return nuevo_saldo
+
+
+def acreditar_lote(
+    db: Session,
+    pagos: Dict[int, Monto],
+    commit: bool = True,
+    juego: Optional[str] = None,
+    tipo: str = "premio"
+) -> int:
+    """
+    UPDATE usuarios SET saldo = saldo + :monto WHERE id = :id para muchos
+    usuarios en una sola ejecución (executemany) y un solo commit, p. ej. al
+    liquidar una ronda compartida. Devuelve cuántos pagos aplicó.
+
+    Sin RETURNING (no existe para UPDATE en executemany): el movimiento del
+    libro mayor se registra sin saldo_resultante.
+    """
+    filas = [
+        {"b_usuario_id": usuario_id, "b_monto": _a_decimal(monto)}
+        for usuario_id, monto in pagos.items() if monto
+    ]
+    if not filas:
+        return 0
+
+    tabla = Usuario.__table__
+    stmt = (
+        update(tabla)
+        .where(tabla.c.id == bindparam("b_usuario_id"))
+        .values(saldo=tabla.c.saldo + bindparam("b_monto"))
+    )
+    db.connection().execute(stmt, filas)
+    if juego:
+        for fila in filas:
+            registrar_al_confirmar(db, fila["b_usuario_id"], tipo, fila["b_monto"], juego=juego)
+    if commit:
+        db.commit()
+    return len(filas)
+
+
+def liquidar_apuesta(
+    db: Session,
+    usuario_id: int,
+    apuesta: Monto,
+    ganancia: Monto,
+    commit: bool = True,
+    juego: Optional[str] = None
+) -> Optional[Decimal]:
+    """
+    Cobra la apuesta y paga la ganancia en una sola sentencia, para juegos
+    cuyo resultado no depende del saldo (dados, ruleta, tragamonedas...):
+
+    UPDATE usuarios SET saldo = saldo - :apuesta + :ganancia
+    WHERE id = :id AND saldo >= :apuesta RETURNING saldo
+
+    Devuelve el nuevo saldo, o None si el saldo no cubría la apuesta.
+    """
+    apuesta = _a_decimal(apuesta)
+    ganancia = _a_decimal(ganancia)
+    stmt = (
+        update(Usuario)
+        .where(Usuario.id == usuario_id, Usuario.saldo >= apuesta)
+        .values(saldo=Usuario.saldo - apuesta + ganancia)
+    )
+    nuevo_saldo = _ejecutar(db, stmt)
+    if nuevo_saldo is not None and juego:
+        registrar_al_confirmar(db, usuario_id, "apuesta", -apuesta, juego=juego, saldo_resultante=nuevo_saldo - ganancia)
+        if ganancia:
+            registrar_al_confirmar(db, usuario_id, "premio", ganancia, juego=juego, saldo_resultante=nuevo_saldo)
+    if commit:
+        db.commit()
+    return nuevo_saldo
+
+
+async def debitar_async(
+    db: AsyncSession,
+    usuario_id: int,
+    monto: Monto,
+    commit: bool = True,
+    juego: Optional[str] = None,
+    tipo: str = "apuesta",
+    detalles: Optional[dict] = None
+) -> Optional[Decimal]:
+    """`debitar` para handlers async (misma sentencia sobre la AsyncSession)."""
+    monto = _a_decimal(monto)
+    nuevo_saldo = (await db.execute(_con_saldo(_sentencia_debito(usuario_id, monto)))).scalar_one_or_none()
+    if nuevo_saldo is not None and juego:
+        registrar_al_confirmar(db, usuario_id, tipo, -monto, juego=juego, saldo_resultante=nuevo_saldo, detalles=detalles)
+    if commit:
+        await db.commit()
+    return nuevo_saldo
+
+
+async def acreditar_async(
+    db: AsyncSession,
+    usuario_id: int,
+    monto: Monto,
+    commit: bool = True,
+    juego: Optional[str] = None,
+    tipo: str = "premio",
+    detalles: Optional[dict] = None
+) -> Optional[Decimal]:
+    """`acreditar` para handlers async (misma sentencia sobre la AsyncSession)."""
+    monto = _a_decimal(monto)
+    nuevo_saldo = (await db.execute(_con_saldo(_sentencia_credito(usuario_id, monto)))).scalar_one_or_none()
+    if nuevo_saldo is not None and juego and monto:
+        registrar_al_confirmar(db, usuario_id, tipo, monto, juego=juego, saldo_resultante=nuevo_saldo, detalles=detalles)
+    if commit:
+        await db.commit()
+    return nuevo_saldo
+
+
+def obtener_saldo(db: Session, usuario_id: int) -> Optional[Decimal]:
+    """Lee solo la columna saldo (sin cargar la fila completa del usuario)."""
+    return db.execute(
+        select(Usuario.saldo).where(Usuario.id == usuario_id)
+    ).scalar_one_or_none()
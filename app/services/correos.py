@@ -0,0 +1,176 @@
+# app/services/correos.py
+"""
+Bandeja de salida de correos (outbox) con enviador en segundo plano.
+
+`encolar_correo` inserta la fila en la transacción del handler, así que el
+registro responde sin esperar a SMTP2Go y el correo no se pierde si el
+proveedor está caído. Cada worker tiene un enviador que reclama lotes de
+CORREOS_LOTE filas vencidas (FOR UPDATE SKIP LOCKED en Postgres, para que dos
+workers no tomen la misma fila), las envía con como mucho CORREOS_CONCURRENCIA
+peticiones a la vez sobre la sesión keep-alive de SMTP2GoSimple y reprograma
+los fallos con backoff exponencial hasta CORREOS_MAX_INTENTOS.
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import anyio
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+from ..models.correo import CorreoSaliente
+from .mail import SMTP2GoSimple, smtp2go
+
+CORREOS_LOTE = int(os.environ.get("CORREOS_LOTE", 20))
+CORREOS_CONCURRENCIA = int(os.environ.get("CORREOS_CONCURRENCIA", 4))
+CORREOS_INTERVALO_MS = int(os.environ.get("CORREOS_INTERVALO_MS", 2000))
+CORREOS_MAX_INTENTOS = int(os.environ.get("CORREOS_MAX_INTENTOS", 6))
+CORREOS_BACKOFF_SEGUNDOS = int(os.environ.get("CORREOS_BACKOFF_SEGUNDOS", 30))
+CORREOS_BACKOFF_MAX_SEGUNDOS = int(os.environ.get("CORREOS_BACKOFF_MAX_SEGUNDOS", 3600))
+# Mientras se envía, la fila queda "reservada" este tiempo; si el worker muere se reintenta
+CORREOS_RESERVA_SEGUNDOS = int(os.environ.get("CORREOS_RESERVA_SEGUNDOS", 120))
+
+
+def encolar_correo(db: Session, destinatario: str, asunto: str, texto: str, html: str) -> CorreoSaliente:
+    """Añade el correo a la bandeja de salida; se confirma con el commit del llamador."""
+    correo = CorreoSaliente(
+        destinatario=destinatario,
+        asunto=asunto,
+        texto=texto,
+        html=html,
+        estado="pendiente",
+        proximo_intento=datetime.utcnow()
+    )
+    db.add(correo)
+    return correo
+
+
+def calcular_backoff(intentos: int) -> timedelta:
+    """30 s, 60 s, 120 s... con tope en CORREOS_BACKOFF_MAX_SEGUNDOS"""
+    segundos = CORREOS_BACKOFF_SEGUNDOS * (2 ** max(0, intentos - 1))
+    return timedelta(seconds=min(segundos, CORREOS_BACKOFF_MAX_SEGUNDOS))
+
+
+class EnviadorCorreos:
+    """Despacha la bandeja de salida en segundo plano (una instancia por worker)."""
+
+    def __init__(self, cliente: SMTP2GoSimple = smtp2go):
+        self.cliente = cliente
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._evento: Optional[asyncio.Event] = None
+        self._tarea: Optional[asyncio.Task] = None
+        self._limitador: Optional[anyio.CapacityLimiter] = None
+
+    def despertar(self) -> None:
+        """Pide un envío inmediato (p. ej. tras el commit del registro); seguro desde el threadpool."""
+        if self._loop is not None and self._evento is not None:
+            self._loop.call_soon_threadsafe(self._evento.set)
+
+    # -------------------------------
+    # Operaciones bloqueantes (se ejecutan en el threadpool)
+    # -------------------------------
+
+    def _reclamar(self) -> List[Dict[str, Any]]:
+        """Toma un lote de correos vencidos y los reserva para este worker."""
+        ahora = datetime.utcnow()
+        with SessionLocal() as db:
+            correos = db.query(CorreoSaliente).filter(
+                CorreoSaliente.estado == "pendiente",
+                CorreoSaliente.proximo_intento <= ahora
+            ).order_by(
+                CorreoSaliente.proximo_intento
+            ).limit(CORREOS_LOTE).with_for_update(skip_locked=True).all()
+
+            lote = []
+            for correo in correos:
+                correo.proximo_intento = ahora + timedelta(seconds=CORREOS_RESERVA_SEGUNDOS)
+                lote.append({
+                    "id": correo.id,
+                    "destinatario": correo.destinatario,
+                    "asunto": correo.asunto,
+                    "texto": correo.texto,
+                    "html": correo.html,
+                    "intentos": correo.intentos
+                })
+            db.commit()
+        return lote
+
+    def _enviar(self, correo: Dict[str, Any]) -> None:
+        """Envía un correo y guarda el resultado (o reprograma el reintento)."""
+        try:
+            resultado = self.cliente.enviar(correo["destinatario"], correo["asunto"], correo["texto"], correo["html"])
+        except Exception as e:
+            resultado = {"success": False, "error": str(e)}
+
+        intentos = correo["intentos"] + 1
+        ahora = datetime.utcnow()
+        if resultado.get("success"):
+            valores = {"estado": "enviado", "intentos": intentos, "enviado_en": ahora, "ultimo_error": None}
+        elif intentos >= CORREOS_MAX_INTENTOS:
+            valores = {"estado": "fallido", "intentos": intentos, "ultimo_error": str(resultado.get("error"))}
+            print(f"❌ [CORREOS] Correo {correo['id']} descartado tras {intentos} intentos: {resultado.get('error')}")
+        else:
+            valores = {
+                "intentos": intentos,
+                "proximo_intento": ahora + calcular_backoff(intentos),
+                "ultimo_error": str(resultado.get("error"))
+            }
+
+        with SessionLocal() as db:
+            db.execute(update(CorreoSaliente).where(CorreoSaliente.id == correo["id"]).values(**valores))
+            db.commit()
+
+    # -------------------------------
+    # Ciclo de vida
+    # -------------------------------
+
+    async def procesar_lote(self) -> int:
+        """Reclama un lote y lo envía con concurrencia acotada. Devuelve cuántos procesó."""
+        lote = await anyio.to_thread.run_sync(self._reclamar)
+        if lote:
+            async with anyio.create_task_group() as tg:
+                for correo in lote:
+                    tg.start_soon(self._enviar_async, correo)
+        return len(lote)
+
+    async def _enviar_async(self, correo: Dict[str, Any]) -> None:
+        await anyio.to_thread.run_sync(self._enviar, correo, limiter=self._limitador)
+
+    async def _bucle(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._evento.wait(), timeout=CORREOS_INTERVALO_MS / 1000)
+            except asyncio.TimeoutError:
+                pass
+            self._evento.clear()
+            try:
+                # Mientras salgan lotes llenos se sigue vaciando la bandeja
+                while await self.procesar_lote() >= CORREOS_LOTE:
+                    pass
+            except Exception as e:
+                print(f"❌ [CORREOS] Error procesando la bandeja de salida: {e}")
+
+    async def iniciar(self) -> None:
+        """Arranca el enviador (llamar desde el lifespan)."""
+        self._loop = asyncio.get_running_loop()
+        self._evento = asyncio.Event()
+        # El limitador se crea dentro del event loop (anyio lo exige)
+        self._limitador = anyio.CapacityLimiter(CORREOS_CONCURRENCIA)
+        self._tarea = asyncio.create_task(self._bucle())
+        print(f"✅ Enviador de correos activo (lotes de {CORREOS_LOTE}, {CORREOS_CONCURRENCIA} en paralelo)")
+
+    async def detener(self) -> None:
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        # Lo que quede pendiente lo envía el próximo arranque (la bandeja es persistente)
+        print("✅ Enviador de correos detenido")
+
+
+enviador_correos = EnviadorCorreos()
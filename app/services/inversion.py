@@ -1,6 +1,7 @@
 from datetime import date, datetime, timedelta
 from decimal import Decimal
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, func
 import pytz
@@ -9,35 +10,30 @@ from ..models.usuario import Usuario
 from ..models.inversion import Inversion, RetiroInversion
 from ..database import get_db
 from ..api.auth import get_current_user
+from ..api.paginacion import (
+    CABECERA_CURSOR, PAGINA_MAXIMA, PAGINA_POR_DEFECTO, cortar_pagina,
+    decodificar_cursor, despues_del_cursor
+)
+from .billetera import acreditar, debitar
+from .movimientos import registrar_al_confirmar
 
 router = APIRouter()
 
 ZONE = pytz.timezone("America/Bogota")
 
-def acumular_intereses(db: Session):
-    """Función para acumular intereses en todas las inversiones activas"""
-    ahora = datetime.today() + timedelta(hours=-5)
-    
-    inversiones_activas = db.query(Inversion).filter(Inversion.activa == True).all()
-    
-    for inversion in inversiones_activas:
-        # Calcular segundos transcurridos desde el último cálculo o depósito
-        fecha_inicio_calculo = inversion.fecha_ultimo_retiro_intereses or inversion.fecha_deposito
-        dias_transcurridos = (ahora - fecha_inicio_calculo).days
-        segundos_transcurridos = (ahora - fecha_inicio_calculo).seconds
-        segundos_transcurridos += dias_transcurridos * 86400
-        
-        # Calcular interés por segundo
-        tasa_segundo = inversion.tasa_interes / 36500 / 86400
-        interes_por_segundo = inversion.monto * tasa_segundo
-        
-        # Interés acumulado en este período
-        interes_acumulado = interes_por_segundo * segundos_transcurridos
-        
-        # Actualizar interés acumulado en la inversión
-        inversion.interes_acumulado = interes_acumulado
-    
-    db.commit()
+def tasa_por_segundo(inversion: Inversion) -> float:
+    """Interés que genera la inversión por cada segundo (tasa anual / 365 días)"""
+    return inversion.monto * inversion.tasa_interes / 36500 / 86400
+
+def calcular_interes(inversion: Inversion, ahora: datetime) -> float:
+    """
+    Interés acumulado desde el último checkpoint (último retiro de intereses o,
+    si no hay, el depósito). Se deriva al leer en forma cerrada, así que no hace
+    falta ningún job que reescriba `interes_acumulado` en toda la tabla.
+    """
+    fecha_inicio_calculo = inversion.fecha_ultimo_retiro_intereses or inversion.fecha_deposito
+    segundos_transcurridos = max(0, int((ahora - fecha_inicio_calculo).total_seconds()))
+    return tasa_por_segundo(inversion) * segundos_transcurridos
 
 @router.post("/inversion/depositar")
 def depositar_inversion(
@@ -55,25 +51,23 @@ def depositar_inversion(
             detail="El monto debe estar entre $50,000 y $5,000,000"
         )
     
-    # Verificar saldo del usuario
-    usuario = db.query(Usuario).filter(Usuario.id == current_user.id).first()
-    if usuario.saldo < monto:
-        raise HTTPException(
-            status_code=400, 
-            detail="Saldo insuficiente para realizar la inversión"
-        )
-    
     # Calcular fechas de retiro + 19 horas
     ahora = datetime.today() + timedelta(hours=-5)
     proximo_retiro_intereses = ahora + timedelta(days=30)
     proximo_retiro_capital = ahora + timedelta(days=180)
     
-    # Descontar del saldo del usuario
-    usuario.saldo -= monto
+    # Descontar del saldo del usuario (validación de saldo incluida en el UPDATE)
+    nuevo_saldo = debitar(db, current_user.id, monto, commit=False)
+    if nuevo_saldo is None:
+        db.rollback()
+        raise HTTPException(
+            status_code=400, 
+            detail="Saldo insuficiente para realizar la inversión"
+        )
     
     # Crear registro de inversión
     nueva_inversion = Inversion(
-        usuario_id=usuario.id,
+        usuario_id=current_user.id,
         monto=monto,
         fecha_deposito=ahora,
         fecha_proximo_retiro_intereses=proximo_retiro_intereses,
@@ -82,14 +76,18 @@ def depositar_inversion(
     )
     
     db.add(nueva_inversion)
+    db.flush()
+    registrar_al_confirmar(
+        db, current_user.id, "inversion", -monto, saldo_resultante=nuevo_saldo,
+        detalles={"inversion_id": nueva_inversion.id}
+    )
     db.commit()
     db.refresh(nueva_inversion)
-    db.refresh(usuario)
     
     return {
         "success": True,
         "message": f"✅ Inversión de ${monto:,.0f} realizada con éxito",
-        "nuevo_saldo": Decimal(usuario.saldo),
+        "nuevo_saldo": Decimal(nuevo_saldo),
         "inversion_id": nueva_inversion.id,
         "proximo_retiro_intereses": proximo_retiro_intereses.isoformat(),
         "proximo_retiro_capital": proximo_retiro_capital.isoformat()
@@ -118,22 +116,9 @@ def obtener_estado_inversion(
     detalles_inversiones = []
     
     for inversion in inversiones:
-        # Calcular segundos transcurridos
-        segundos_transcurridos = (ahora - inversion.fecha_deposito).seconds
-        
-        # Calcular interés por segundo
-        tasa_segundo = inversion.tasa_interes / 36500 / 86400
-        interes_por_segundo = inversion.monto * tasa_segundo
-        
         # Interés acumulado desde el inicio o último retiro
-        fecha_inicio_calculo = inversion.fecha_ultimo_retiro_intereses or inversion.fecha_deposito
-        dias_transcurridos = (ahora - fecha_inicio_calculo).days
-        segundos_transcurridos = (ahora - fecha_inicio_calculo).seconds
-        segundos_transcurridos += dias_transcurridos * 86400
-        interes_acumulado_desde_retiro = interes_por_segundo * segundos_transcurridos
-        
-        # Interés total acumulado
-        interes_total =interes_acumulado_desde_retiro
+        interes_total = calcular_interes(inversion, ahora)
+        interes_por_segundo = tasa_por_segundo(inversion)
         
         # Verificar si puede retirar intereses
         puede_retirar_intereses = ahora >= inversion.fecha_proximo_retiro_intereses
@@ -199,19 +184,16 @@ def retirar_intereses(
     
     # Calcular interés acumulado
     fecha_inicio_calculo = inversion.fecha_ultimo_retiro_intereses or inversion.fecha_deposito
-    dias_transcurridos = (ahora - fecha_inicio_calculo).days
-    segundos_transcurridos = (ahora - fecha_inicio_calculo).seconds
-    segundos_transcurridos += dias_transcurridos * 86400
-    tasa_segundo = inversion.tasa_interes / 36500 / 86400
-    interes_por_segundo = inversion.monto * tasa_segundo
-    interes_acumulado = interes_por_segundo * segundos_transcurridos
+    interes_acumulado = calcular_interes(inversion, ahora)
     
     if interes_acumulado <= 0:
         raise HTTPException(status_code=400, detail="No hay intereses acumulados para retirar")
     
-    # Actualizar saldo del usuario
-    usuario = db.query(Usuario).filter(Usuario.id == current_user.id).first()
-    usuario.saldo += Decimal(interes_acumulado)
+    # Actualizar saldo del usuario (UPDATE atómico; se confirma con el retiro)
+    nuevo_saldo = acreditar(db, current_user.id, interes_acumulado, commit=False)
+    if nuevo_saldo is None:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
     # Registrar retiro
     retiro = RetiroInversion(
@@ -225,20 +207,23 @@ def retirar_intereses(
         }
     )
     
-    # Actualizar inversión
+    # Checkpoint: el próximo cálculo parte de este retiro
     inversion.interes_acumulado = 0
     inversion.fecha_ultimo_retiro_intereses = ahora
     inversion.fecha_proximo_retiro_intereses = ahora + timedelta(days=30)
     
     db.add(retiro)
+    registrar_al_confirmar(
+        db, current_user.id, "interes", interes_acumulado, saldo_resultante=nuevo_saldo,
+        detalles={"inversion_id": inversion.id}
+    )
     db.commit()
-    db.refresh(usuario)
     
     return {
         "success": True,
         "message": f"✅ Retiro de intereses por ${interes_acumulado:,.0f} realizado con éxito",
         "monto_retirado": Decimal(interes_acumulado),
-        "nuevo_saldo": Decimal(usuario.saldo),
+        "nuevo_saldo": Decimal(nuevo_saldo),
         "proximo_retiro_intereses": inversion.fecha_proximo_retiro_intereses.isoformat()
     }
 
@@ -282,9 +267,11 @@ def retirar_capital(
     # Monto total a retirar (capital + intereses finales)
     monto_total = inversion.monto + interes_final
     
-    # Actualizar saldo del usuario
-    usuario = db.query(Usuario).filter(Usuario.id == current_user.id).first()
-    usuario.saldo += Decimal(monto_total)
+    # Actualizar saldo del usuario (UPDATE atómico; se confirma con el retiro)
+    nuevo_saldo = acreditar(db, current_user.id, monto_total, commit=False)
+    if nuevo_saldo is None:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
     # Registrar retiro
     retiro = RetiroInversion(
@@ -304,8 +291,16 @@ def retirar_capital(
     inversion.fecha_ultimo_retiro_capital = ahora
     
     db.add(retiro)
+    registrar_al_confirmar(
+        db, current_user.id, "inversion", inversion.monto,
+        detalles={"inversion_id": inversion.id}
+    )
+    if interes_final > 0:
+        registrar_al_confirmar(
+            db, current_user.id, "interes", interes_final, saldo_resultante=nuevo_saldo,
+            detalles={"inversion_id": inversion.id}
+        )
     db.commit()
-    db.refresh(usuario)
     
     return {
         "success": True,
@@ -313,26 +308,46 @@ def retirar_capital(
         "capital": Decimal(inversion.monto),
         "intereses_finales": Decimal(interes_final),
         "total_retirado": Decimal(monto_total),
-        "nuevo_saldo": Decimal(usuario.saldo)
+        "nuevo_saldo": Decimal(nuevo_saldo)
     }
 
 @router.get("/inversion/historial")
 def obtener_historial_inversion(
+    response: Response,
+    limite: int = Query(PAGINA_POR_DEFECTO, ge=1, le=PAGINA_MAXIMA),
+    cursor: Optional[str] = Query(None, description="Valor de next_cursor de la página anterior"),
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(get_current_user)
 ):
-    """Obtener historial completo de inversiones y retiros"""
-    inversiones = db.query(Inversion).filter(
+    """Obtener historial de inversiones y sus retiros, paginado por fecha de depósito"""
+    posicion = decodificar_cursor(cursor, (datetime, int))
+
+    consulta = db.query(Inversion).filter(Inversion.usuario_id == current_user.id)
+    if posicion:
+        consulta = consulta.filter(despues_del_cursor((Inversion.fecha_deposito, Inversion.id), posicion))
+    inversiones = consulta.order_by(
+        Inversion.fecha_deposito.desc(), Inversion.id.desc()
+    ).limit(limite + 1).all()
+    inversiones, siguiente = cortar_pagina(inversiones, limite, lambda inv: (inv.fecha_deposito, inv.id))
+    if siguiente:
+        response.headers[CABECERA_CURSOR] = siguiente
+
+    # Retiros de todas las inversiones de la página en una sola consulta
+    retiros_por_inversion = {}
+    if inversiones:
+        retiros = db.query(RetiroInversion).filter(
+            RetiroInversion.inversion_id.in_([inv.id for inv in inversiones])
+        ).order_by(RetiroInversion.fecha.desc()).all()
+        for retiro in retiros:
+            retiros_por_inversion.setdefault(retiro.inversion_id, []).append(retiro)
+
+    total_inversiones = db.query(func.count(Inversion.id)).filter(
         Inversion.usuario_id == current_user.id
-    ).order_by(Inversion.fecha_deposito.desc()).all()
+    ).scalar()
     
     historial = []
     
     for inversion in inversiones:
-        retiros = db.query(RetiroInversion).filter(
-            RetiroInversion.inversion_id == inversion.id
-        ).order_by(RetiroInversion.fecha.desc()).all()
-        
         inversion_data = {
             "id": inversion.id,
             "monto": Decimal(inversion.monto),
@@ -346,13 +361,14 @@ def obtener_historial_inversion(
                     "fecha": retiro.fecha,
                     "detalles": retiro.detalles
                 }
-                for retiro in retiros
+                for retiro in retiros_por_inversion.get(inversion.id, [])
             ]
         }
         
         historial.append(inversion_data)
     
     return {
-        "total_inversiones": len(inversiones),
-        "historial": historial
-    }
\ No newline at end of file
+        "total_inversiones": total_inversiones,
+        "historial": historial,
+        "next_cursor": siguiente
+    }
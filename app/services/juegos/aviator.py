@@ -1,19 +1,28 @@
 from __future__ import annotations
 
+import asyncio
+from bisect import bisect_right
 from datetime import datetime, timedelta
 import decimal
+import hashlib
+import hmac
+import os
 import random
+import time
 import uuid
-from typing import Dict, List, TypedDict, Optional
+from typing import Any, Callable, Dict, List, NamedTuple, Set, Tuple, TypedDict, Optional
 from decimal import Decimal
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 
 from ...api.juegos import game_sessions
-from ...models import usuario
-from ...database import get_db
-from ...api.auth import get_current_user
+from ...database import SessionLocal, get_db
+from ...models.apuesta_ronda import ApuestaRonda
+from ...api.auth import UsuarioActual, get_current_principal, principal_desde_token
+from ..billetera import acreditar, acreditar_lote, debitar, obtener_saldo
 
 router = APIRouter()
 
@@ -25,6 +34,8 @@ APUESTAS_PERMITIDAS = [Decimal(str(x)) for x in [100, 500, 1000, 2000, 5000]]
 MIN_MULTIPLICADOR = Decimal('1.0')
 MAX_MULTIPLICADOR = Decimal('500.0')
 MAX_HORAS_SESION = 1
+# Intervalo entre ticks del multiplicador en el WebSocket
+AVIATOR_TICK_MS = int(os.environ.get("AVIATOR_TICK_MS", 100))
 
 # Probabilidades configuradas (más realistas)
 PROBABILIDADES = [
@@ -65,76 +76,105 @@ class SesionAviator(TypedDict):
 # Utilidades de juego - CORREGIDAS
 # ----------------------------------------------------------------------
 
-def calcular_duracion_animacion(multiplicador: Decimal) -> Decimal:
+# Los multiplicadores se calculan como enteros en centésimas (1.37x -> 137) y
+# las duraciones en décimas de segundo. Decimal solo aparece en la frontera
+# del dinero (ganancias, saldo) y en lo que se guarda en la sesión.
+
+def centesimas(valor: Decimal) -> int:
+    """Decimal con dos decimales -> entero en centésimas."""
+    return int((valor * 100).to_integral_value())
+
+
+def desde_centesimas(valor: int) -> Decimal:
+    """Entero en centésimas -> Decimal con dos decimales (137 -> 1.37)."""
+    return Decimal(valor).scaleb(-2)
+
+
+def _dividir_redondeando(numerador: int, denominador: int) -> int:
+    """numerador / denominador redondeado al par más cercano (como Decimal.quantize)."""
+    cociente, resto = divmod(numerador, denominador)
+    if 2 * resto > denominador or (2 * resto == denominador and cociente % 2):
+        cociente += 1
+    return cociente
+
+
+def _compilar_tabla_crash() -> Tuple[List[float], List[Tuple[int, int]]]:
     """
-    Calcula la duración de la animación en segundos basado en el multiplicador.
-    Retorna valores entre 0.5s y 30s máximo (no 60s para mejor experiencia).
+    Precompila PROBABILIDADES: límites acumulados en porcentaje (los mismos
+    floats con los que comparaba el bucle original) y, por tramo, el rango
+    (mínimo, máximo) del multiplicador en centésimas.
     """
-    if multiplicador <= Decimal('1.0'):
-        return Decimal('0.5')
-    
-    # Para multiplicadores entre 1.0 y 1.5: muy rápido (0.5s a 1.5s)
-    if multiplicador <= Decimal('1.5'):
-        duracion = Decimal('0.5') + (multiplicador - Decimal('1.0')) * Decimal('2.0')
-        return max(Decimal('0.5'), min(duracion.quantize(Decimal('0.1')), Decimal('30.0')))
-    
-    # Para multiplicadores entre 1.5 y 2.0: rápido (1.5s a 2.5s)
-    if multiplicador <= Decimal('2.0'):
-        duracion = Decimal('1.5') + (multiplicador - Decimal('1.5')) * Decimal('2.0')
-        return max(Decimal('0.5'), min(duracion.quantize(Decimal('0.1')), Decimal('30.0')))
-    
-    # Para multiplicadores entre 2.0 y 10.0: medio (2.5s a 8s)
-    if multiplicador <= Decimal('10.0'):
-        duracion = Decimal('2.5') + (multiplicador - Decimal('2.0')) * Decimal('0.69')
-        return max(Decimal('0.5'), min(duracion.quantize(Decimal('0.1')), Decimal('30.0')))
-    
-    # Para multiplicadores entre 10.0 y 100.0: lento (8s a 20s)
-    if multiplicador <= Decimal('100.0'):
-        duracion = Decimal('8.0') + (multiplicador - Decimal('10.0')) * Decimal('0.133')
-        return max(Decimal('0.5'), min(duracion.quantize(Decimal('0.1')), Decimal('30.0')))
-    
-    # Para multiplicadores entre 100.0 y 500.0: muy lento (20s a 30s)
-    if multiplicador <= Decimal('500.0'):
-        duracion = Decimal('20.0') + (multiplicador - Decimal('100.0')) * Decimal('0.025')
-        return max(Decimal('0.5'), min(duracion, Decimal('30.0'))).quantize(Decimal('0.1'))
-    
-    return Decimal('30.0')
+    cortes, tramos = [], []
+    acumulado = Decimal('0.0')
+    anterior = MIN_MULTIPLICADOR
+    for multiplicador, probabilidad in PROBABILIDADES:
+        acumulado += probabilidad
+        cortes.append(float(acumulado))
+        tramos.append((centesimas(anterior), centesimas(multiplicador)))
+        anterior = multiplicador
+    # El primer tramo queda (100, 100): crash inmediato en 1.00x
+    return cortes, tramos
+
 
+_CORTES_CRASH, _TRAMOS_CRASH = _compilar_tabla_crash()
+_MIN_CENTESIMAS = centesimas(MIN_MULTIPLICADOR)
+_MAX_CENTESIMAS = centesimas(MAX_MULTIPLICADOR)
 
-def generar_multiplicador_crash() -> Decimal:
+
+def duracion_decimas(crash: int) -> int:
     """
-    Genera un multiplicador de crash según las probabilidades especificadas.
+    Duración de la animación en décimas de segundo para un crash en
+    centésimas: entre 0.5 s y 30 s, por tramos lineales.
     """
-    r = random.random() * 100  # Porcentaje de 0 a 100
-    
-    acumulado = Decimal('0.0')
-    for i, (multiplier, prob) in enumerate(PROBABILIDADES):
-        acumulado += prob
-        
-        if r < float(acumulado):
-            # Estamos en este rango
-            if i == 0:
-                # Crash inmediato en 1x
-                return Decimal('1.00')
-            
-            min_val = PROBABILIDADES[i-1][0] if i > 0 else Decimal('1.0')
-            max_val = multiplier
-            
-            # Generar valor aleatorio dentro del rango
-            # Sesgo hacia valores bajos (más realista)
-            u = random.random()
-            factor = u ** 1.5  # Sesgo hacia valores bajos
-            
-            if min_val == max_val:
-                return min_val
-            
-            resultado = min_val + (max_val - min_val) * Decimal(str(factor))
-            # Asegurar que el resultado esté dentro de límites razonables
-            resultado = max(MIN_MULTIPLICADOR, min(resultado, MAX_MULTIPLICADOR))
-            return resultado.quantize(Decimal('0.01'))
-    
-    # Fallback seguro
-    return Decimal('1.50')
+    if crash <= 100:
+        return 5
+    if crash <= 150:
+        # 0.5 s a 1.5 s: muy rápido
+        decimas = _dividir_redondeando(50 + 2 * (crash - 100), 10)
+    elif crash <= 200:
+        # 1.5 s a 2.5 s: rápido
+        decimas = _dividir_redondeando(150 + 2 * (crash - 150), 10)
+    elif crash <= 1000:
+        # 2.5 s a 8 s: medio (0.69 s por 1x)
+        decimas = _dividir_redondeando(25_000 + 69 * (crash - 200), 1000)
+    elif crash <= 10000:
+        # 8 s a 20 s: lento (0.133 s por 1x)
+        decimas = _dividir_redondeando(800_000 + 133 * (crash - 1000), 10_000)
+    elif crash <= 50000:
+        # 20 s a 30 s: muy lento (0.025 s por 1x)
+        decimas = _dividir_redondeando(2_000_000 + 25 * (crash - 10000), 10_000)
+    else:
+        return 300
+    return max(5, min(decimas, 300))
+
+
+def crash_centesimas(r: float, u: float) -> int:
+    """
+    Convierte dos uniformes en [0, 1) en un crash (centésimas) según
+    PROBABILIDADES: `r` elige el tramo por bisect sobre la tabla acumulada y
+    `u` la posición dentro de él, con sesgo hacia valores bajos (u ** 1.5).
+    """
+    i = bisect_right(_CORTES_CRASH, r * 100)
+    if i == len(_CORTES_CRASH):
+        # Fallback seguro
+        return 150
+    minimo, maximo = _TRAMOS_CRASH[i]
+    if minimo == maximo:
+        return minimo
+    return max(_MIN_CENTESIMAS, min(round(minimo + (maximo - minimo) * u ** 1.5), _MAX_CENTESIMAS))
+
+
+def multiplicador_centesimas(tiempo_transcurrido: float, crash: int, duracion_total: float) -> int:
+    """
+    Multiplicador (centésimas) a los `tiempo_transcurrido` segundos de un vuelo
+    que explota en `crash`. Curva easeOutCubic: crece rápido al inicio y se
+    desacelera al final.
+    """
+    if duracion_total <= 0:
+        return 100
+    progreso = min(tiempo_transcurrido / duracion_total, 1.0)
+    progreso_eased = 1 - (1 - progreso) ** 3
+    return max(100, min(round(100 + (crash - 100) * progreso_eased), crash))
 
 
 def calcular_multiplicador_actual(
@@ -144,45 +184,18 @@ def calcular_multiplicador_actual(
 ) -> Decimal:
     """
     Calcula el multiplicador actual basado en el tiempo transcurrido.
-    Usa curva exponencial suave (easeOutQuad) para crecimiento natural.
+    Versión Decimal de `multiplicador_centesimas` para la frontera del dinero.
     """
-    if duracion_total <= 0:
-        return Decimal('1.0')
-    
-    # Calcular progreso (0.0 a 1.0)
-    progreso = min(tiempo_transcurrido / duracion_total, 1.0)
-    
-    # Aplicar función de easing (easeOutCubic para crecimiento suave)
-    # Crece rápido al inicio, se desacelera al final
-    progreso_eased = 1 - pow(1 - progreso, 3)
-    
-    # Calcular multiplicador: de 1.0 al multiplicador_crash
-    rango = multiplicador_crash - Decimal('1.0')
-    multiplicador = Decimal('1.0') + rango * Decimal(str(progreso_eased))
-    
-    # Asegurar que el multiplicador esté dentro de límites
-    multiplicador = max(Decimal('1.0'), min(multiplicador, multiplicador_crash))
-    
-    return multiplicador.quantize(Decimal('0.01'))
-
-
-def limpiar_sesiones_expiradas() -> None:
-    """Elimina sesiones expiradas."""
-    now = datetime.now()
-    expiradas = []
-    for sid, sdata in list(game_sessions.items()):
-        created = sdata.get("created_at", now)
-        if now - created > timedelta(hours=MAX_HORAS_SESION):
-            expiradas.append(sid)
-    for sid in expiradas:
-        del game_sessions[sid]
+    return desde_centesimas(
+        multiplicador_centesimas(tiempo_transcurrido, centesimas(multiplicador_crash), duracion_total)
+    )
 
 
 def obtener_sesion_asegurada(session_id: str, user_id: int) -> SesionAviator:
     """Obtiene la sesión y valida existencia/propiedad."""
-    if session_id not in game_sessions:
+    sesion: Optional[SesionAviator] = game_sessions.obtener(session_id)
+    if sesion is None:
         raise HTTPException(status_code=404, detail="Sesión de juego no encontrada")
-    sesion: SesionAviator = game_sessions[session_id]
     if sesion["user_id"] != user_id:
         raise HTTPException(status_code=403, detail="No tienes acceso a esta sesión")
     return sesion
@@ -201,31 +214,31 @@ def leer_apuestas_permitidas():
 def obtener_historial(
     limite: int = Query(20, description="Número de resultados a devolver", ge=1, le=50),
     db: Session = Depends(get_db),
-    current_user: usuario.Usuario = Depends(get_current_user),
+    current_user: UsuarioActual = Depends(get_current_principal),
 ):
     """Obtiene el historial de resultados recientes (público)."""
     historial = []
     now = datetime.now()
     
     for i in range(limite):
-        multiplicador = generar_multiplicador_crash()
+        multiplicador = crash_centesimas(random.random(), random.random())
         timestamp = now - timedelta(seconds=i * random.randint(5, 15))
         
-        # Determinar color basado en multiplicador
-        if multiplicador < Decimal('1.5'):
+        # Determinar color basado en multiplicador (centésimas)
+        if multiplicador < 150:
             color = 'red'
-        elif multiplicador < Decimal('2.0'):
+        elif multiplicador < 200:
             color = 'orange'
-        elif multiplicador < Decimal('5.0'):
+        elif multiplicador < 500:
             color = 'yellow'
-        elif multiplicador < Decimal('10.0'):
+        elif multiplicador < 1000:
             color = 'green'
         else:
             color = 'purple'
         
         historial.append({
             "id": i + 1,
-            "multiplicador": float(multiplicador),
+            "multiplicador": multiplicador / 100,
             "timestamp": timestamp.isoformat(),
             "color": color
         })
@@ -244,29 +257,24 @@ def iniciar_vuelo(
         ge=Decimal('1.0'),
     ),
     db: Session = Depends(get_db),
-    current_user: usuario.Usuario = Depends(get_current_user),
+    current_user: UsuarioActual = Depends(get_current_principal),
 ):
     """Inicia un nuevo vuelo."""
-    limpiar_sesiones_expiradas()
-
     if apuesta not in APUESTAS_PERMITIDAS:
         raise HTTPException(
             status_code=400,
             detail=f"Apuesta no válida. Debe ser una de {[float(a) for a in APUESTAS_PERMITIDAS]}",
         )
 
-    user = db.query(usuario.Usuario).filter(usuario.Usuario.id == current_user.id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
-    if user.saldo < apuesta:
+    # Descontar apuesta (validación de saldo incluida en el UPDATE)
+    nuevo_saldo = debitar(db, current_user.id, apuesta, juego="aviator")
+    if nuevo_saldo is None:
         raise HTTPException(status_code=400, detail=f"Saldo insuficiente. Necesitas ${apuesta} para jugar.")
 
-    # Generar multiplicador de crash
-    multiplicador_crash = generar_multiplicador_crash()
-    
-    # Calcular duración total de la animación
-    duracion_total = float(calcular_duracion_animacion(multiplicador_crash))
+    # Generar multiplicador de crash (centésimas) y la duración de la animación
+    crash = crash_centesimas(random.random(), random.random())
+    multiplicador_crash = desde_centesimas(crash)
+    duracion_total = duracion_decimas(crash) / 10
     
     # Validar valores para evitar datos corruptos
     if not isinstance(multiplicador_crash, Decimal) or multiplicador_crash <= Decimal('0'):
@@ -279,8 +287,8 @@ def iniciar_vuelo(
     session_id = str(uuid.uuid4())
     ahora = datetime.now()
     
-    game_sessions[session_id] = {
-        "user_id": user.id,
+    game_sessions.guardar(session_id, {
+        "user_id": current_user.id,
         "apuesta": apuesta,
         "multiplicador_crash": multiplicador_crash,
         "multiplicador_retiro": None,
@@ -293,18 +301,13 @@ def iniciar_vuelo(
         "created_at": ahora,
         "tiempo_inicio": ahora,
         "tiempo_explosion": None,
-    }
-
-    # Descontar apuesta
-    user.saldo -= apuesta
-    db.commit()
-    db.refresh(user)
+    }, ttl=MAX_HORAS_SESION * 3600)
 
     return {
         "session_id": session_id,
         "apuesta": float(apuesta),
         "multiplicador_inicial": 1.0,
-        "nuevo_saldo": float(user.saldo),
+        "nuevo_saldo": float(nuevo_saldo),
         "tiempo_inicio": ahora.isoformat(),
         "duracion_total": float(duracion_total),
         "multiplicador_crash": float(multiplicador_crash),
@@ -325,20 +328,14 @@ def hacer_cashout(
         le=Decimal('500.0'),
     ),
     db: Session = Depends(get_db),
-    current_user: usuario.Usuario = Depends(get_current_user),
+    current_user: UsuarioActual = Depends(get_current_principal),
 ):
     """El jugador retira sus ganancias antes del crash."""
-    limpiar_sesiones_expiradas()
-
     sesion = obtener_sesion_asegurada(session_id, current_user.id)
     
     if sesion["estado"] != "vuelo":
         raise HTTPException(status_code=400, detail="Este vuelo ya terminó")
 
-    user = db.query(usuario.Usuario).filter(usuario.Usuario.id == current_user.id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
     # Validar multiplicador_actual
     if not isinstance(multiplicador_actual, Decimal):
         multiplicador_actual = Decimal('1.0')
@@ -347,20 +344,33 @@ def hacer_cashout(
     margen = Decimal('0.05')
     if multiplicador_actual > sesion["multiplicador_crash"] + margen:
         # Ya explotó, el usuario perdió
-        sesion["estado"] = "explosion"
+        sesion = game_sessions.reclamar(session_id, "vuelo", "explosion")
+        if sesion is None:
+            raise HTTPException(status_code=400, detail="Este vuelo ya terminó")
         sesion["multiplicador_retiro"] = None
         sesion["retiro_manual"] = False
         sesion["tiempo_explosion"] = datetime.now()
+        game_sessions.guardar(session_id, sesion, si_estado="explosion")
+
+        nuevo_saldo = obtener_saldo(db, current_user.id)
+        if nuevo_saldo is None:
+            raise HTTPException(status_code=404, detail="Usuario no encontrado")
         
         return {
             "resultado": f"¡CRASH! El avión explotó en {sesion['multiplicador_crash']}x",
             "ganancia": 0.0,
             "multiplicador_crash": float(sesion["multiplicador_crash"]),
             "multiplicador_retiro": None,
-            "nuevo_saldo": float(user.saldo),
+            "nuevo_saldo": float(nuevo_saldo),
             "estado": "explosion"
         }
 
+    # Reclamar el vuelo antes de pagar: otro cashout, el auto-retiro o el
+    # socket pueden intentarlo a la vez y solo uno debe cobrar
+    sesion = game_sessions.reclamar(session_id, "vuelo", "cashout")
+    if sesion is None:
+        raise HTTPException(status_code=400, detail="Este vuelo ya terminó")
+
     # Calcular ganancia con el multiplicador actual
     # Limitar al multiplicador de crash si está muy cerca
     multiplicador_final = min(multiplicador_actual, sesion["multiplicador_crash"])
@@ -372,23 +382,23 @@ def hacer_cashout(
     ganancia = sesion["apuesta"] * multiplicador_final
     
     # Actualizar sesión
-    sesion["estado"] = "cashout"
     sesion["multiplicador_retiro"] = multiplicador_final
     sesion["retiro_manual"] = True
     sesion["multiplicador_actual"] = multiplicador_final
     sesion["tiempo_explosion"] = datetime.now()
+    game_sessions.guardar(session_id, sesion, si_estado="cashout")
     
     # Pagar al jugador
-    user.saldo += ganancia
-    db.commit()
-    db.refresh(user)
+    nuevo_saldo = acreditar(db, current_user.id, ganancia, juego="aviator")
+    if nuevo_saldo is None:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
     return {
         "resultado": f"¡Retiro exitoso! Ganaste ${float(ganancia):.2f}",
         "ganancia": float(ganancia),
         "multiplicador_crash": float(sesion["multiplicador_crash"]),
         "multiplicador_retiro": float(multiplicador_final),
-        "nuevo_saldo": float(user.saldo),
+        "nuevo_saldo": float(nuevo_saldo),
         "estado": "cashout"
     }
 
@@ -401,11 +411,9 @@ def hacer_cashout(
 def verificar_estado(
     session_id: str,
     db: Session = Depends(get_db),
-    current_user: usuario.Usuario = Depends(get_current_user),
+    current_user: UsuarioActual = Depends(get_current_principal),
 ):
     """Verifica el estado actual del vuelo."""
-    limpiar_sesiones_expiradas()
-
     sesion = obtener_sesion_asegurada(session_id, current_user.id)
     
     tiempo_transcurrido = (datetime.now() - sesion["tiempo_inicio"]).total_seconds()
@@ -415,60 +423,65 @@ def verificar_estado(
     if duracion_total <= 0:
         duracion_total = 30.0
     
-    multiplicador_actual = calcular_multiplicador_actual(
-        tiempo_transcurrido, 
-        sesion["multiplicador_crash"],
-        duracion_total
-    )
+    # Curva en centésimas enteras; Decimal solo para el dinero y la sesión
+    crash = centesimas(sesion["multiplicador_crash"])
+    multiplicador_actual = multiplicador_centesimas(tiempo_transcurrido, crash, duracion_total)
     
     # Verificar si ya explotó
-    exploto = tiempo_transcurrido >= duracion_total or multiplicador_actual >= sesion["multiplicador_crash"]
+    exploto = tiempo_transcurrido >= duracion_total or multiplicador_actual >= crash
     
     if exploto and sesion["estado"] == "vuelo":
-        # Acaba de explotar
-        sesion["estado"] = "explosion"
-        sesion["tiempo_explosion"] = datetime.now()
+        # Acaba de explotar (si otra petición ya cerró el vuelo, se usa su estado)
+        reclamada = game_sessions.reclamar(session_id, "vuelo", "explosion")
+        if reclamada is not None:
+            reclamada["tiempo_explosion"] = datetime.now()
+        sesion = reclamada or obtener_sesion_asegurada(session_id, current_user.id)
     
     # Actualizar multiplicador actual en sesión
-    sesion["multiplicador_actual"] = multiplicador_actual
+    sesion["multiplicador_actual"] = desde_centesimas(multiplicador_actual)
     
     # Verificar retiro automático si está activo
     if (sesion["estado"] == "vuelo" and 
         sesion["auto_retiro_activo"] and 
-        multiplicador_actual >= sesion["multiplicador_auto"] and
+        multiplicador_actual >= centesimas(sesion["multiplicador_auto"]) and
         sesion["multiplicador_auto"] <= sesion["multiplicador_crash"]):
         
-        # Ejecutar retiro automático
-        user = db.query(usuario.Usuario).filter(usuario.Usuario.id == current_user.id).first()
-        if user:
+        # Ejecutar retiro automático (solo si este poll gana el vuelo)
+        reclamada = game_sessions.reclamar(session_id, "vuelo", "cashout")
+        if reclamada is not None:
+            sesion = reclamada
             ganancia = sesion["apuesta"] * sesion["multiplicador_auto"]
-            user.saldo += ganancia
-            db.commit()
-            db.refresh(user)
-            
-            sesion["estado"] = "cashout"
+            sesion["multiplicador_actual"] = desde_centesimas(multiplicador_actual)
             sesion["multiplicador_retiro"] = sesion["multiplicador_auto"]
             sesion["retiro_manual"] = False
             sesion["tiempo_explosion"] = datetime.now()
+            game_sessions.guardar(session_id, sesion, si_estado="cashout")
+
+            nuevo_saldo = acreditar(db, current_user.id, ganancia, juego="aviator")
+            if nuevo_saldo is None:
+                raise HTTPException(status_code=404, detail="Usuario no encontrado")
             
             return {
                 "session_id": session_id,
                 "estado": "cashout",
-                "multiplicador_actual": float(multiplicador_actual),
+                "multiplicador_actual": multiplicador_actual / 100,
                 "multiplicador_crash": float(sesion["multiplicador_crash"]),
                 "multiplicador_retiro": float(sesion["multiplicador_auto"]),
                 "apuesta": float(sesion["apuesta"]),
                 "tiempo_transcurrido": tiempo_transcurrido,
                 "exploto": False,
                 "ganancia": float(ganancia),
-                "nuevo_saldo": float(user.saldo),
+                "nuevo_saldo": float(nuevo_saldo),
                 "auto_retiro": True,
             }
     
+    # Condicional: no pisar un cierre que otra petición hizo mientras tanto
+    game_sessions.guardar(session_id, sesion, si_estado=sesion["estado"])
+
     return {
         "session_id": session_id,
         "estado": sesion["estado"],
-        "multiplicador_actual": float(multiplicador_actual),
+        "multiplicador_actual": multiplicador_actual / 100,
         "multiplicador_crash": float(sesion["multiplicador_crash"]) if sesion["estado"] != "vuelo" else None,
         "multiplicador_retiro": float(sesion["multiplicador_retiro"]) if sesion["multiplicador_retiro"] else None,
         "apuesta": float(sesion["apuesta"]),
@@ -493,7 +506,7 @@ def configurar_autoretiro(
     ),
     activar: bool = Query(True, description="Activar o desactivar auto-retiro"),
     db: Session = Depends(get_db),
-    current_user: usuario.Usuario = Depends(get_current_user),
+    current_user: UsuarioActual = Depends(get_current_principal),
 ):
     """Configura retiro automático."""
     sesion = obtener_sesion_asegurada(session_id, current_user.id)
@@ -509,6 +522,8 @@ def configurar_autoretiro(
     
     sesion["auto_retiro_activo"] = activar
     sesion["multiplicador_auto"] = multiplicador_auto
+    if not game_sessions.guardar(session_id, sesion, si_estado="vuelo"):
+        raise HTTPException(status_code=400, detail="Este vuelo ya terminó")
     
     return {
         "mensaje": f"Retiro automático {'activado' if activar else 'desactivado'} en {multiplicador_auto}x",
@@ -524,7 +539,7 @@ def configurar_autoretiro(
 @router.get("/juegos/aviator/estadisticas")
 def obtener_estadisticas(
     db: Session = Depends(get_db),
-    current_user: usuario.Usuario = Depends(get_current_user),
+    current_user: UsuarioActual = Depends(get_current_principal),
 ):
     """Obtiene estadísticas del jugador en Aviator."""
     # En un sistema real, esto vendría de la base de datos
@@ -537,4 +552,680 @@ def obtener_estadisticas(
         "balance": 0.0,
         "mayor_ganancia": 0.0,
         "multiplicador_record": 0.0,
-    }
\ No newline at end of file
+    }
+
+
+# ----------------------------------------------------------------------
+# Transmisión del vuelo por WebSocket
+# ----------------------------------------------------------------------
+#
+# Sustituye al sondeo de /estado: una sola conexión por jugador, autenticada
+# al abrirla, y un bucle en el servidor que empuja el multiplicador cada
+# AVIATOR_TICK_MS calculándolo con la copia de la sesión en memoria (sin
+# leer el store, decodificar el JWT ni consultar la BD en cada tick).
+#
+# Mensajes del servidor:
+#   {"tipo": "tick", "multiplicador": 1.37, "tiempo_transcurrido": 0.8}
+#   {"tipo": "cashout", "multiplicador_retiro", "ganancia", "nuevo_saldo", "auto_retiro"}
+#   {"tipo": "explosion", "multiplicador_crash"}
+#   {"tipo": "error", "detalle"}
+# Mensajes del cliente:
+#   {"accion": "cashout"}
+#   {"accion": "autoretiro", "multiplicador": 2.5, "activar": true}
+
+def _abrir_transmision(session_id: str, token: str) -> Tuple[int, SesionAviator]:
+    """Autentica el token y carga la sesión una sola vez (bloqueante)."""
+    with SessionLocal() as db:
+        principal = principal_desde_token(token, db)
+    return principal.id, obtener_sesion_asegurada(session_id, principal.id)
+
+
+def _cobrar_vuelo(session_id: str, user_id: int, multiplicador: Decimal, manual: bool) -> Optional[Dict[str, Any]]:
+    """
+    Liquida el retiro al multiplicador del servidor (bloqueante). Reclama el
+    vuelo en el store antes de pagar: si el endpoint HTTP de cashout o el
+    auto-retiro lo cerraron antes, el reclamo falla y devuelve None.
+    """
+    sesion = game_sessions.reclamar(session_id, "vuelo", "cashout")
+    if sesion is None:
+        return None
+
+    multiplicador = max(Decimal('1.0'), min(multiplicador, sesion["multiplicador_crash"]))
+    ganancia = sesion["apuesta"] * multiplicador
+
+    sesion["multiplicador_retiro"] = multiplicador
+    sesion["retiro_manual"] = manual
+    sesion["multiplicador_actual"] = multiplicador
+    sesion["tiempo_explosion"] = datetime.now()
+    game_sessions.guardar(session_id, sesion, si_estado="cashout")
+
+    with SessionLocal() as db:
+        nuevo_saldo = acreditar(db, user_id, ganancia, juego="aviator")
+    if nuevo_saldo is None:
+        return None
+
+    return {
+        "tipo": "cashout",
+        "multiplicador_retiro": float(multiplicador),
+        "multiplicador_crash": float(sesion["multiplicador_crash"]),
+        "ganancia": float(ganancia),
+        "nuevo_saldo": float(nuevo_saldo),
+        "auto_retiro": not manual,
+    }
+
+
+def _configurar_autoretiro(session_id: str, activar: bool, multiplicador: Decimal) -> None:
+    """Guarda el auto-retiro también en el store (lo ve /estado si el socket se cae)."""
+    sesion = game_sessions.obtener(session_id)
+    if sesion is not None and sesion["estado"] == "vuelo":
+        sesion["auto_retiro_activo"] = activar
+        sesion["multiplicador_auto"] = multiplicador
+        # Si el vuelo se cerró entretanto no se reescribe la sesión terminada
+        game_sessions.guardar(session_id, sesion, si_estado="vuelo")
+
+
+def _marcar_explosion(session_id: str) -> None:
+    """Cierra el vuelo como explosión si nadie lo cobró antes (bloqueante)."""
+    sesion = game_sessions.reclamar(session_id, "vuelo", "explosion")
+    if sesion is not None:
+        sesion["multiplicador_actual"] = sesion["multiplicador_crash"]
+        sesion["tiempo_explosion"] = datetime.now()
+        game_sessions.guardar(session_id, sesion, si_estado="explosion")
+
+
+@router.websocket("/juegos/aviator/{session_id}/ws")
+async def transmitir_vuelo(
+    websocket: WebSocket,
+    session_id: str,
+    token: str = Query(..., description="JWT de acceso (los navegadores no envían cabeceras en WebSocket)"),
+):
+    """Empuja el multiplicador del vuelo y acepta el cashout por el mismo socket."""
+    try:
+        user_id, sesion = await anyio.to_thread.run_sync(_abrir_transmision, session_id, token)
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(e.detail))
+        return
+
+    await websocket.accept()
+
+    if sesion["estado"] != "vuelo":
+        await websocket.send_json({
+            "tipo": sesion["estado"],
+            "multiplicador_crash": float(sesion["multiplicador_crash"]),
+            "multiplicador_retiro": float(sesion["multiplicador_retiro"]) if sesion["multiplicador_retiro"] else None,
+        })
+        await websocket.close()
+        return
+
+    # El bucle trabaja en centésimas enteras; Decimal solo al cobrar
+    crash = centesimas(sesion["multiplicador_crash"])
+    auto = centesimas(sesion["multiplicador_auto"]) if sesion["auto_retiro_activo"] else None
+    duracion_total = sesion.get("duracion_total") or 30.0
+    tick = AVIATOR_TICK_MS / 1000
+    # Un solo candado serializa envíos y liquidaciones entre el bucle y la lectura
+    candado = anyio.Lock()
+    terminado = False
+
+    def multiplicador_ahora() -> Tuple[int, float]:
+        transcurrido = (datetime.now() - sesion["tiempo_inicio"]).total_seconds()
+        return multiplicador_centesimas(transcurrido, crash, duracion_total), transcurrido
+
+    async def cobrar(multiplicador: Decimal, manual: bool) -> None:
+        nonlocal terminado
+        resultado = await anyio.to_thread.run_sync(_cobrar_vuelo, session_id, user_id, multiplicador, manual)
+        terminado = True
+        await websocket.send_json(resultado or {"tipo": "error", "detalle": "Este vuelo ya terminó"})
+
+    async def emitir(cancelar) -> None:
+        nonlocal terminado
+        try:
+            while True:
+                async with candado:
+                    if terminado:
+                        break
+                    multiplicador, transcurrido = multiplicador_ahora()
+
+                    if transcurrido >= duracion_total or multiplicador >= crash:
+                        await anyio.to_thread.run_sync(_marcar_explosion, session_id)
+                        terminado = True
+                        await websocket.send_json({"tipo": "explosion", "multiplicador_crash": crash / 100})
+                        break
+
+                    if auto is not None and multiplicador >= auto and auto <= crash:
+                        await cobrar(desde_centesimas(auto), manual=False)
+                        break
+
+                    await websocket.send_json({
+                        "tipo": "tick",
+                        "multiplicador": multiplicador / 100,
+                        "tiempo_transcurrido": round(transcurrido, 3),
+                    })
+                await anyio.sleep(tick)
+        except WebSocketDisconnect:
+            pass
+        cancelar()
+
+    async def recibir(cancelar) -> None:
+        nonlocal auto
+        try:
+            while True:
+                mensaje = await websocket.receive_json()
+                accion = mensaje.get("accion") if isinstance(mensaje, dict) else None
+                async with candado:
+                    if terminado:
+                        continue
+                    if accion == "cashout":
+                        multiplicador, _ = multiplicador_ahora()
+                        await cobrar(desde_centesimas(multiplicador), manual=True)
+                    elif accion == "autoretiro":
+                        try:
+                            valor = Decimal(str(mensaje.get("multiplicador", "2.0")))
+                            valor = max(Decimal('1.1'), min(valor, MAX_MULTIPLICADOR)).quantize(Decimal('0.01'))
+                        except decimal.InvalidOperation:
+                            await websocket.send_json({"tipo": "error", "detalle": "Multiplicador no válido"})
+                            continue
+                        activar = bool(mensaje.get("activar", True))
+                        auto = centesimas(valor) if activar else None
+                        await anyio.to_thread.run_sync(_configurar_autoretiro, session_id, activar, valor)
+                    else:
+                        await websocket.send_json({"tipo": "error", "detalle": "Acción no reconocida"})
+        except (WebSocketDisconnect, ValueError):
+            # Cliente desconectado o mensaje que no es JSON
+            cancelar()
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(emitir, tg.cancel_scope.cancel)
+        tg.start_soon(recibir, tg.cancel_scope.cancel)
+
+    try:
+        await websocket.close()
+    except RuntimeError:
+        # El cliente ya cerró
+        pass
+
+
+# ----------------------------------------------------------------------
+# Rondas compartidas
+# ----------------------------------------------------------------------
+#
+# Una sola curva por ronda para todos los jugadores: ventana de apuestas,
+# vuelo con un único punto de crash y pausa. El crash de cada ronda sale de
+# HMAC(AVIATOR_RONDA_SEMILLA, id de ronda), así que todos los workers y
+# réplicas calculan las mismas rondas a partir del reloj, sin coordinarse.
+# Las rondas se encadenan desde el inicio de cada hora UTC; la última de la
+# hora alarga su pausa hasta el cambio de hora.
+#
+# Las apuestas son filas de apuestas_ronda, así que se pueden cobrar desde
+# cualquier worker. El retiro solo anota el multiplicador del servidor
+# (UPDATE ... WHERE estado = 'activa'); el proceso líder liquida la ronda
+# cuando explota: reclama sus apuestas con UPDATE ... RETURNING y las paga
+# en lote (un UPDATE executemany) en la misma transacción, de modo que un
+# fallo o un cambio de líder a mitad no paga dos veces. El auto-retiro se
+# resuelve en la liquidación: no cuesta nada por tick. El trabajo por tick
+# es constante: un multiplicador por worker, difundido a sus sockets.
+
+RONDA_APUESTAS_SEGUNDOS = float(os.environ.get("AVIATOR_RONDA_APUESTAS_SEGUNDOS", 5))
+RONDA_PAUSA_SEGUNDOS = float(os.environ.get("AVIATOR_RONDA_PAUSA_SEGUNDOS", 3))
+# Sin semilla secreta el crash de cada ronda sería predecible: no hay valor
+# por defecto y el motor se niega a arrancar (ver MotorRondas.iniciar)
+_semilla = os.environ.get("AVIATOR_RONDA_SEMILLA") or os.environ.get("SECRET_KEY")
+RONDA_SEMILLA = _semilla.encode() if _semilla else None
+_SEGUNDOS_HORA = 3600
+
+
+class Ronda(NamedTuple):
+    id: str
+    hora: int
+    indice: int
+    inicio: float        # epoch: abren las apuestas
+    despegue: float      # epoch: cierran las apuestas y arranca el multiplicador
+    crash: int           # centésimas (para la curva)
+    multiplicador_crash: Decimal
+    duracion: float      # segundos de vuelo hasta el crash
+    fin: float           # epoch: empieza la siguiente ronda
+
+    @property
+    def explosion(self) -> float:
+        return self.despegue + self.duracion
+
+    def fase(self, ahora: float) -> str:
+        if ahora < self.despegue:
+            return "apuestas"
+        if ahora < self.explosion:
+            return "vuelo"
+        return "pausa"
+
+    def multiplicador(self, ahora: float) -> int:
+        """Multiplicador en centésimas en el instante `ahora`."""
+        return multiplicador_centesimas(ahora - self.despegue, self.crash, self.duracion)
+
+
+def _crash_de_ronda(ronda_id: str) -> Tuple[int, float]:
+    """Crash (centésimas) y duración deterministas de una ronda (56 bits de azar por uniforme)."""
+    digest = hmac.new(RONDA_SEMILLA, ronda_id.encode(), hashlib.sha256).digest()
+    r = int.from_bytes(digest[:7], "big") / 2 ** 56
+    u = int.from_bytes(digest[7:14], "big") / 2 ** 56
+    crash = crash_centesimas(r, u)
+    return crash, duracion_decimas(crash) / 10
+
+
+def _crear_ronda(hora: int, indice: int, inicio: float) -> Ronda:
+    ronda_id = f"{hora}-{indice}"
+    crash, duracion = _crash_de_ronda(ronda_id)
+    despegue = inicio + RONDA_APUESTAS_SEGUNDOS
+    fin = despegue + duracion + RONDA_PAUSA_SEGUNDOS
+
+    # Si la siguiente ronda no cabe antes del cambio de hora, esta alarga su pausa
+    fin_hora = (hora + 1) * float(_SEGUNDOS_HORA)
+    _, duracion_siguiente = _crash_de_ronda(f"{hora}-{indice + 1}")
+    if fin + RONDA_APUESTAS_SEGUNDOS + duracion_siguiente + RONDA_PAUSA_SEGUNDOS > fin_hora:
+        fin = fin_hora
+
+    return Ronda(ronda_id, hora, indice, inicio, despegue, crash, desde_centesimas(crash), duracion, fin)
+
+
+def _resultado_apuesta(apuesta) -> Tuple[Optional[Decimal], Decimal]:
+    """
+    Multiplicador efectivo y ganancia de una apuesta de una ronda ya explotada:
+    el menor entre el retiro manual y el auto-retiro alcanzado (el que ocurrió primero).
+    Acepta la fila ORM o la fila devuelta por RETURNING.
+    """
+    candidatos = []
+    if apuesta.retiro is not None:
+        candidatos.append(apuesta.retiro)
+    if apuesta.auto is not None and apuesta.auto <= apuesta.multiplicador_crash:
+        candidatos.append(apuesta.auto)
+    if not candidatos:
+        return None, Decimal('0')
+    multiplicador = min(candidatos)
+    return multiplicador, apuesta.apuesta * multiplicador
+
+
+def _apuesta_a_dict(apuesta: ApuestaRonda, ahora: float) -> Dict[str, Any]:
+    """Vista pública de una apuesta (el crash solo se revela tras la explosión)."""
+    exploto = ahora >= apuesta.explosion
+    datos = {
+        "apuesta_id": apuesta.id,
+        "ronda_id": apuesta.ronda_id,
+        "apuesta": float(apuesta.apuesta),
+        "auto_retiro": float(apuesta.auto) if apuesta.auto is not None else None,
+        "multiplicador_retiro": float(apuesta.retiro) if apuesta.retiro is not None else None,
+        "liquidada": apuesta.estado == "liquidada",
+    }
+    if exploto:
+        multiplicador, ganancia = _resultado_apuesta(apuesta)
+        datos.update({
+            "multiplicador_crash": float(apuesta.multiplicador_crash),
+            "multiplicador_retiro": float(multiplicador) if multiplicador is not None else None,
+            "ganancia": float(ganancia),
+            "estado": "cashout" if multiplicador is not None else "explosion",
+        })
+    else:
+        datos["estado"] = "cashout" if apuesta.retiro is not None else "pendiente"
+    return datos
+
+
+class MotorRondas:
+    """Reloj de rondas y difusión a los sockets de este worker (uno por proceso)."""
+
+    def __init__(self):
+        self._actual: Optional[Ronda] = None
+        self._suscriptores: Set[WebSocket] = set()
+        self._tarea: Optional[asyncio.Task] = None
+        self._es_lider: Callable[[], bool] = lambda: True
+        self._ultima_liquidada: Optional[str] = None
+        # Al arrancar, al ganar el liderazgo o tras un error se liquida todo
+        # lo que quedó pendiente, no solo la ronda actual
+        self._recuperar = True
+        self.total_liquidadas = 0
+
+    def ronda_en(self, ahora: float) -> Ronda:
+        """Ronda vigente en `ahora` (avanza la cadena desde la última calculada)."""
+        hora = int(ahora // _SEGUNDOS_HORA)
+        ronda = self._actual
+        if ronda is None or ronda.hora != hora or ronda.inicio > ahora:
+            ronda = _crear_ronda(hora, 0, hora * float(_SEGUNDOS_HORA))
+        while ronda.fin <= ahora:
+            ronda = _crear_ronda(hora, ronda.indice + 1, ronda.fin)
+        self._actual = ronda
+        return ronda
+
+    def estado(self, ahora: Optional[float] = None) -> Dict[str, Any]:
+        ahora = time.time() if ahora is None else ahora
+        ronda = self.ronda_en(ahora)
+        fase = ronda.fase(ahora)
+        datos = {
+            "ronda_id": ronda.id,
+            "fase": fase,
+            "inicio": datetime.utcfromtimestamp(ronda.inicio).isoformat(),
+            "despegue": datetime.utcfromtimestamp(ronda.despegue).isoformat(),
+            "siguiente_ronda": datetime.utcfromtimestamp(ronda.fin).isoformat(),
+        }
+        if fase == "apuestas":
+            datos["segundos_para_despegue"] = round(ronda.despegue - ahora, 3)
+        elif fase == "vuelo":
+            datos["multiplicador"] = ronda.multiplicador(ahora) / 100
+            datos["tiempo_transcurrido"] = round(ahora - ronda.despegue, 3)
+        else:
+            datos["multiplicador_crash"] = ronda.crash / 100
+        return datos
+
+    # -------------------------------
+    # Apuestas (bloqueantes: se llaman desde el threadpool)
+    # -------------------------------
+
+    def apostar(self, db: Session, user_id: int, apuesta: Decimal, auto: Optional[Decimal]) -> Dict[str, Any]:
+        if apuesta not in APUESTAS_PERMITIDAS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Apuesta no válida. Debe ser una de {[float(a) for a in APUESTAS_PERMITIDAS]}",
+            )
+        if auto is not None and not (Decimal('1.1') <= auto <= MAX_MULTIPLICADOR):
+            raise HTTPException(status_code=400, detail="El auto-retiro debe estar entre 1.1x y 500x")
+
+        ahora = time.time()
+        ronda = self.ronda_en(ahora)
+        if ronda.fase(ahora) != "apuestas":
+            raise HTTPException(status_code=400, detail="Las apuestas de esta ronda están cerradas")
+
+        # Débito y alta de la apuesta en la misma transacción
+        nuevo_saldo = debitar(db, user_id, apuesta, commit=False, juego="aviator", detalles={"ronda": ronda.id})
+        if nuevo_saldo is None:
+            db.rollback()
+            raise HTTPException(status_code=400, detail=f"Saldo insuficiente. Necesitas ${apuesta} para jugar.")
+
+        registro = ApuestaRonda(
+            id=str(uuid.uuid4()),
+            ronda_id=ronda.id,
+            usuario_id=user_id,
+            apuesta=apuesta,
+            auto=auto,
+            retiro=None,
+            multiplicador_crash=ronda.multiplicador_crash,
+            despegue=ronda.despegue,
+            explosion=ronda.explosion,
+            estado="activa",
+        )
+        db.add(registro)
+        db.commit()
+
+        return {**_apuesta_a_dict(registro, ahora), "nuevo_saldo": float(nuevo_saldo)}
+
+    def cobrar(self, db: Session, user_id: int, apuesta_id: str) -> Dict[str, Any]:
+        """Anota el retiro al multiplicador actual del servidor; se paga al liquidar la ronda."""
+        apuesta = self.obtener_apuesta(db, user_id, apuesta_id)
+        ahora = time.time()
+        if ahora < apuesta.despegue:
+            raise HTTPException(status_code=400, detail="La ronda aún no ha despegado")
+        if ahora >= apuesta.explosion:
+            raise HTTPException(status_code=400, detail="El avión ya explotó")
+        if apuesta.estado != "activa":
+            raise HTTPException(status_code=400, detail="Esta apuesta ya fue retirada")
+
+        multiplicador = calcular_multiplicador_actual(
+            ahora - apuesta.despegue, apuesta.multiplicador_crash, apuesta.explosion - apuesta.despegue
+        )
+        if apuesta.auto is not None and apuesta.auto <= multiplicador:
+            # El auto-retiro ya se alcanzó: vale ese
+            multiplicador = apuesta.auto
+
+        # Condicionado al estado: otro retiro o la liquidación pueden haber ganado
+        resultado = db.execute(
+            update(ApuestaRonda)
+            .where(
+                ApuestaRonda.id == apuesta_id,
+                ApuestaRonda.estado == "activa",
+                ApuestaRonda.explosion > ahora,
+            )
+            .values(retiro=multiplicador, estado="cobrada")
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        if resultado.rowcount == 0:
+            raise HTTPException(status_code=400, detail="Esta apuesta ya fue retirada o liquidada")
+        db.refresh(apuesta)
+
+        return {
+            **_apuesta_a_dict(apuesta, ahora),
+            "ganancia": float(apuesta.apuesta * multiplicador),
+        }
+
+    def obtener_apuesta(self, db: Session, user_id: int, apuesta_id: str) -> ApuestaRonda:
+        apuesta = db.get(ApuestaRonda, apuesta_id)
+        if apuesta is None:
+            raise HTTPException(status_code=404, detail="Apuesta no encontrada")
+        if apuesta.usuario_id != user_id:
+            raise HTTPException(status_code=403, detail="No tienes acceso a esta apuesta")
+        return apuesta
+
+    def liquidar(self, ronda_id: Optional[str] = None) -> int:
+        """
+        Paga en lote las apuestas de la ronda `ronda_id` (solo el líder). Sin
+        ronda recoge todas las pendientes ya explotadas, p. ej. las que dejó
+        un líder anterior.
+
+        Reclama las apuestas (estado -> liquidada) y acredita solo las filas
+        reclamadas, en una sola transacción: si algo falla no queda nada
+        marcado ni pagado, y otro líder no puede volver a reclamarlas.
+        """
+        condicion = ApuestaRonda.estado.in_(("activa", "cobrada"))
+        if ronda_id is not None:
+            condicion = condicion & (ApuestaRonda.ronda_id == ronda_id)
+        else:
+            condicion = condicion & (ApuestaRonda.explosion <= time.time())
+
+        with SessionLocal() as db:
+            reclamadas = db.execute(
+                update(ApuestaRonda)
+                .where(condicion)
+                .values(estado="liquidada")
+                .returning(
+                    ApuestaRonda.usuario_id, ApuestaRonda.apuesta, ApuestaRonda.auto,
+                    ApuestaRonda.retiro, ApuestaRonda.multiplicador_crash,
+                )
+                .execution_options(synchronize_session=False)
+            ).all()
+            if not reclamadas:
+                db.rollback()
+                return 0
+
+            pagos: Dict[int, Decimal] = {}
+            for apuesta in reclamadas:
+                _, ganancia = _resultado_apuesta(apuesta)
+                if ganancia:
+                    pagos[apuesta.usuario_id] = pagos.get(apuesta.usuario_id, Decimal('0')) + ganancia
+
+            acreditar_lote(db, pagos, commit=False, juego="aviator")
+            db.commit()
+
+        self.total_liquidadas += len(reclamadas)
+        return len(reclamadas)
+
+    # -------------------------------
+    # Difusión y ciclo de vida
+    # -------------------------------
+
+    def suscribir(self, websocket: WebSocket) -> None:
+        self._suscriptores.add(websocket)
+
+    def desuscribir(self, websocket: WebSocket) -> None:
+        self._suscriptores.discard(websocket)
+
+    async def _difundir(self, mensaje: Dict[str, Any]) -> None:
+        if not self._suscriptores:
+            return
+        sockets = list(self._suscriptores)
+        resultados = await asyncio.gather(
+            *(ws.send_json(mensaje) for ws in sockets), return_exceptions=True
+        )
+        for ws, resultado in zip(sockets, resultados):
+            if isinstance(resultado, Exception):
+                self._suscriptores.discard(ws)
+
+    async def _bucle(self) -> None:
+        tick = AVIATOR_TICK_MS / 1000
+        ronda_anterior, fase_anterior = None, None
+        while True:
+            try:
+                ahora = time.time()
+                ronda = self.ronda_en(ahora)
+                fase = ronda.fase(ahora)
+
+                if ronda.id != ronda_anterior or fase != fase_anterior:
+                    await self._difundir({"tipo": "ronda", **self.estado(ahora)})
+                    ronda_anterior, fase_anterior = ronda.id, fase
+                elif fase == "vuelo":
+                    # Un solo cálculo por tick, compartido por todos los sockets
+                    await self._difundir({
+                        "tipo": "tick",
+                        "ronda_id": ronda.id,
+                        "multiplicador": ronda.multiplicador(ahora) / 100,
+                        "tiempo_transcurrido": round(ahora - ronda.despegue, 3),
+                    })
+
+                if not self._es_lider():
+                    self._recuperar = True
+                elif fase == "pausa" and self._ultima_liquidada != ronda.id:
+                    self._ultima_liquidada = ronda.id
+                    if self._recuperar:
+                        liquidadas = await anyio.to_thread.run_sync(self.liquidar)
+                        self._recuperar = False
+                    else:
+                        liquidadas = await anyio.to_thread.run_sync(self.liquidar, ronda.id)
+                    if liquidadas:
+                        print(f"✈️ [AVIATOR] Ronda {ronda.id} liquidada: {liquidadas} apuestas")
+            except Exception as e:
+                # La siguiente liquidación recoge también lo que quedó sin pagar
+                self._recuperar = True
+                print(f"❌ [AVIATOR] Error en el motor de rondas: {e}")
+            await asyncio.sleep(tick)
+
+    async def iniciar(self, es_lider: Optional[Callable[[], bool]] = None) -> None:
+        """Arranca el reloj de rondas (llamar desde el lifespan)."""
+        if RONDA_SEMILLA is None:
+            raise RuntimeError("❌ Aviator: define AVIATOR_RONDA_SEMILLA o SECRET_KEY para las rondas compartidas")
+        if es_lider is not None:
+            self._es_lider = es_lider
+        self._tarea = asyncio.create_task(self._bucle())
+        print(f"✅ Motor de rondas de Aviator activo (ronda actual {self.ronda_en(time.time()).id})")
+
+    async def detener(self) -> None:
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        print("✅ Motor de rondas de Aviator detenido")
+
+    def metricas(self) -> Dict[str, Any]:
+        return {
+            "ronda_actual": self._actual.id if self._actual else None,
+            "sockets": len(self._suscriptores),
+            "apuestas_liquidadas": self.total_liquidadas,
+        }
+
+
+motor_rondas = MotorRondas()
+
+
+@router.get("/juegos/aviator/ronda")
+def estado_ronda():
+    """Estado de la ronda compartida en curso (público; el crash solo tras explotar)."""
+    return motor_rondas.estado()
+
+
+@router.post("/juegos/aviator/ronda/apostar")
+def apostar_en_ronda(
+    apuesta: Decimal = Query(..., description="Monto de la apuesta", ge=Decimal('1.0')),
+    auto_retiro: Optional[Decimal] = Query(None, description="Multiplicador de auto-retiro", ge=Decimal('1.1'), le=Decimal('500.0')),
+    db: Session = Depends(get_db),
+    current_user: UsuarioActual = Depends(get_current_principal),
+):
+    """Apuesta en la ronda compartida (solo durante la ventana de apuestas)."""
+    return motor_rondas.apostar(db, current_user.id, apuesta, auto_retiro)
+
+
+@router.post("/juegos/aviator/ronda/apuestas/{apuesta_id}/cashout")
+def cobrar_en_ronda(
+    apuesta_id: str,
+    db: Session = Depends(get_db),
+    current_user: UsuarioActual = Depends(get_current_principal),
+):
+    """Retira la apuesta al multiplicador actual; el pago llega al liquidar la ronda."""
+    return motor_rondas.cobrar(db, current_user.id, apuesta_id)
+
+
+@router.get("/juegos/aviator/ronda/apuestas/{apuesta_id}")
+def consultar_apuesta_ronda(
+    apuesta_id: str,
+    db: Session = Depends(get_db),
+    current_user: UsuarioActual = Depends(get_current_principal),
+):
+    """Estado o resultado de una apuesta de ronda."""
+    apuesta = motor_rondas.obtener_apuesta(db, current_user.id, apuesta_id)
+    return _apuesta_a_dict(apuesta, time.time())
+
+
+def _apostar_por_socket(user_id: int, apuesta: Decimal, auto: Optional[Decimal]) -> Dict[str, Any]:
+    with SessionLocal() as db:
+        return motor_rondas.apostar(db, user_id, apuesta, auto)
+
+
+def _cobrar_por_socket(user_id: int, apuesta_id: str) -> Dict[str, Any]:
+    with SessionLocal() as db:
+        return motor_rondas.cobrar(db, user_id, apuesta_id)
+
+
+# No termina en "/ws": esa ruta ya la toma /juegos/aviator/{session_id}/ws
+@router.websocket("/juegos/aviator/ronda/en-vivo")
+async def transmitir_rondas(
+    websocket: WebSocket,
+    token: str = Query(..., description="JWT de acceso"),
+):
+    """
+    Recibe las rondas compartidas (mensajes "ronda" y "tick") y permite
+    {"accion": "apostar", "apuesta": 1000, "auto_retiro": 2.0} y
+    {"accion": "cashout", "apuesta_id": "..."} por el mismo socket.
+    """
+    try:
+        def autenticar() -> int:
+            with SessionLocal() as db:
+                return principal_desde_token(token, db).id
+        user_id = await anyio.to_thread.run_sync(autenticar)
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(e.detail))
+        return
+
+    await websocket.accept()
+    await websocket.send_json({"tipo": "ronda", **motor_rondas.estado()})
+    motor_rondas.suscribir(websocket)
+    try:
+        while True:
+            mensaje = await websocket.receive_json()
+            accion = mensaje.get("accion") if isinstance(mensaje, dict) else None
+            try:
+                if accion == "apostar":
+                    auto = mensaje.get("auto_retiro")
+                    resultado = await anyio.to_thread.run_sync(
+                        _apostar_por_socket, user_id,
+                        Decimal(str(mensaje.get("apuesta"))),
+                        Decimal(str(auto)) if auto is not None else None,
+                    )
+                    await websocket.send_json({"tipo": "apuesta", **resultado})
+                elif accion == "cashout":
+                    resultado = await anyio.to_thread.run_sync(
+                        _cobrar_por_socket, user_id, str(mensaje.get("apuesta_id"))
+                    )
+                    await websocket.send_json({"tipo": "cashout", **resultado})
+                else:
+                    await websocket.send_json({"tipo": "error", "detalle": "Acción no reconocida"})
+            except HTTPException as e:
+                await websocket.send_json({"tipo": "error", "detalle": e.detail})
+            except decimal.InvalidOperation:
+                await websocket.send_json({"tipo": "error", "detalle": "Monto no válido"})
+    except (WebSocketDisconnect, ValueError):
+        pass
+    finally:
+        motor_rondas.desuscribir(websocket)
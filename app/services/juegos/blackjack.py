@@ -1,7 +1,7 @@
 # app/services/juegos/blackjack.py
 from __future__ import annotations
 
-from datetime import datetime, timedelta
+from datetime import datetime
 import random
 import uuid
 from typing import Dict, List, TypedDict, Optional
@@ -9,15 +9,13 @@ from typing import Dict, List, TypedDict, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
-# Importa el almacén de sesiones COMPARTIDO
-# Asegúrate de que en app/api/juegos.py exista:
-#   game_sessions: Dict[str, dict] = {}
+# Importa el almacén de sesiones COMPARTIDO (ver app/api/sesiones.py)
 from ...api.juegos import game_sessions
 
 # Dependencias del proyecto
-from ...models import usuario
 from ...database import get_db
-from ...api.auth import get_current_user
+from ...api.auth import UsuarioActual, get_current_principal
+from ..billetera import acreditar, debitar, obtener_saldo
 
 
 router = APIRouter()
@@ -106,26 +104,11 @@ def mano_dict(mano: List[Carta]) -> List[dict]:
     return [carta_dict(c) for c in mano]
 
 
-def limpiar_sesiones_expiradas() -> None:
-    """
-    Elimina sesiones con más de MAX_HORAS_SESION de antigüedad.
-    Debe llamarse en el inicio de cada endpoint del juego.
-    """
-    now = datetime.now()
-    expiradas = []
-    for sid, sdata in list(game_sessions.items()):
-        created = sdata.get("created_at", now)
-        if now - created > timedelta(hours=MAX_HORAS_SESION):
-            expiradas.append(sid)
-    for sid in expiradas:
-        del game_sessions[sid]
-
-
 def obtener_sesion_asegurada(session_id: str, user_id: int) -> SesionBlackjack:
     """Obtiene la sesión y valida existencia/propiedad/estado."""
-    if session_id not in game_sessions:
+    sesion: Optional[SesionBlackjack] = game_sessions.obtener(session_id)
+    if sesion is None:
         raise HTTPException(status_code=404, detail="Sesión de juego no encontrada")
-    sesion: SesionBlackjack = game_sessions[session_id]  # type: ignore
     if sesion["user_id"] != user_id:
         raise HTTPException(status_code=403, detail="No tienes acceso a esta sesión")
     if sesion["estado"] != "jugando":
@@ -158,7 +141,7 @@ def iniciar_blackjack(
         ge=1,
     ),
     db: Session = Depends(get_db),
-    current_user: usuario.Usuario = Depends(get_current_user),
+    current_user: UsuarioActual = Depends(get_current_principal),
 ):
     """
     Inicia una nueva sesión de Blackjack:
@@ -167,19 +150,15 @@ def iniciar_blackjack(
       - Reparte 2 cartas jugador y banca
       - Guarda sesión (con apuesta) y retorna datos iniciales
     """
-    limpiar_sesiones_expiradas()
-
     if apuesta not in APUESTAS_PERMITIDAS:
         raise HTTPException(
             status_code=400,
             detail=f"Apuesta no válida. Debe ser una de {APUESTAS_PERMITIDAS}",
         )
 
-    user = db.query(usuario.Usuario).filter(usuario.Usuario.id == current_user.id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
-    if user.saldo < apuesta:
+    # Descontar apuesta (validación de saldo incluida en el UPDATE)
+    nuevo_saldo = debitar(db, current_user.id, apuesta, juego="blackjack")
+    if nuevo_saldo is None:
         raise HTTPException(status_code=400, detail=f"Saldo insuficiente. Necesitas ${apuesta} para jugar.")
 
     session_id = str(uuid.uuid4())
@@ -190,21 +169,16 @@ def iniciar_blackjack(
 
     puntaje_jugador = calcular_puntaje(mano_jugador)
 
-    # Descontar apuesta
-    user.saldo -= apuesta
-    db.commit()
-    db.refresh(user)
-
-    # Persistimos la sesión en memoria
-    game_sessions[session_id] = {
-        "user_id": user.id,
+    # Persistimos la sesión en el store compartido
+    game_sessions.guardar(session_id, {
+        "user_id": current_user.id,
         "baraja": baraja,
         "mano_jugador": mano_jugador,
         "mano_banca": mano_banca,
         "apuesta": apuesta,
         "created_at": datetime.now(),
         "estado": "jugando",
-    }
+    }, ttl=MAX_HORAS_SESION * 3600)
 
     # Nota: el front muestra solo la primera carta de la banca
     puntaje_banca_visible = mano_banca[0].valor if mano_banca[0].nombre != "A" else 11
@@ -215,7 +189,7 @@ def iniciar_blackjack(
         "mano_banca": mano_dict(mano_banca),
         "puntaje_jugador": puntaje_jugador,
         "puntaje_banca_visible": puntaje_banca_visible,
-        "nuevo_saldo": user.saldo,
+        "nuevo_saldo": nuevo_saldo,
         "jugador_blackjack": tiene_blackjack(mano_jugador),
     }
 
@@ -228,7 +202,7 @@ def iniciar_blackjack(
 def pedir_carta_blackjack(
     session_id: str,
     db: Session = Depends(get_db),
-    current_user: usuario.Usuario = Depends(get_current_user),
+    current_user: UsuarioActual = Depends(get_current_principal),
 ):
     """
     El jugador pide una carta:
@@ -236,8 +210,6 @@ def pedir_carta_blackjack(
       - Extrae 1 carta y recalcula puntaje
       - Si supera 21, termina (pierde) y se elimina la sesión
     """
-    limpiar_sesiones_expiradas()
-
     sesion = obtener_sesion_asegurada(session_id, current_user.id)
 
     if not sesion["baraja"]:
@@ -257,10 +229,11 @@ def pedir_carta_blackjack(
 
     if jugador_se_paso:
         # Fin de juego: no hay devolución, pierde su apuesta
-        sesion["estado"] = "terminado"
+        if game_sessions.reclamar(session_id, "jugando", "terminado") is None:
+            raise HTTPException(status_code=400, detail="El juego ya terminó")
 
-        user = db.query(usuario.Usuario).filter(usuario.Usuario.id == current_user.id).first()
-        if not user:
+        nuevo_saldo = obtener_saldo(db, current_user.id)
+        if nuevo_saldo is None:
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
         puntaje_banca_final = calcular_puntaje(sesion["mano_banca"])
@@ -269,14 +242,18 @@ def pedir_carta_blackjack(
             {
                 "resultado": "Te pasaste de 21. Perdiste.",
                 "ganancia": 0,
-                "nuevo_saldo": user.saldo,
+                "nuevo_saldo": nuevo_saldo,
                 "puntaje_banca_final": puntaje_banca_final,
                 "mano_banca_final": mano_dict(sesion["mano_banca"]),
             }
         )
 
         # Elimina la sesión: terminó
-        del game_sessions[session_id]
+        game_sessions.eliminar(session_id)
+    else:
+        # Persistir la carta robada (sin resucitar la sesión si otra petición se plantó)
+        if not game_sessions.guardar(session_id, sesion, si_estado="jugando"):
+            raise HTTPException(status_code=400, detail="El juego ya terminó")
 
     return response
 
@@ -289,7 +266,7 @@ def pedir_carta_blackjack(
 def plantarse_blackjack(
     session_id: str,
     db: Session = Depends(get_db),
-    current_user: usuario.Usuario = Depends(get_current_user),
+    current_user: UsuarioActual = Depends(get_current_principal),
 ):
     """
     El jugador se planta:
@@ -298,13 +275,11 @@ def plantarse_blackjack(
       - Se paga 2.5x en Blackjack (apuesta * 2.5), 2x al ganar normal, 1x al empate
       - Se elimina la sesión
     """
-    limpiar_sesiones_expiradas()
-
-    sesion = obtener_sesion_asegurada(session_id, current_user.id)
-
-    user = db.query(usuario.Usuario).filter(usuario.Usuario.id == current_user.id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    obtener_sesion_asegurada(session_id, current_user.id)
+    # Reclamar la partida: dos "plantarse" simultáneos no pueden cobrar dos veces
+    sesion = game_sessions.reclamar(session_id, "jugando", "terminado")
+    if sesion is None:
+        raise HTTPException(status_code=400, detail="El juego ya terminó")
 
     puntaje_jugador = calcular_puntaje(sesion["mano_jugador"])
     puntaje_banca = calcular_puntaje(sesion["mano_banca"])
@@ -354,16 +329,17 @@ def plantarse_blackjack(
         ganancia = 0
 
     # Pagar (o devolver) al jugador
-    user.saldo += ganancia
-    db.commit()
-    db.refresh(user)
-
-    sesion["estado"] = "terminado"
+    if ganancia > 0:
+        nuevo_saldo = acreditar(db, current_user.id, ganancia, juego="blackjack")
+    else:
+        nuevo_saldo = obtener_saldo(db, current_user.id)
+    if nuevo_saldo is None:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
     respuesta = {
         "resultado": resultado,
         "ganancia": ganancia,
-        "nuevo_saldo": user.saldo,
+        "nuevo_saldo": nuevo_saldo,
         "mano_banca_inicial": mano_dict(mano_banca_inicial),
         "puntaje_banca_inicial": puntaje_banca_inicial,
         "mano_banca_final": mano_dict(sesion["mano_banca"]),
@@ -372,7 +348,7 @@ def plantarse_blackjack(
     }
 
     # Elimina la sesión: terminó
-    del game_sessions[session_id]
+    game_sessions.eliminar(session_id)
 
     return respuesta
 
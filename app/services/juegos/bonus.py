@@ -4,7 +4,9 @@ from typing import List
 from datetime import datetime, timedelta
 from ...models.usuario import Usuario
 from ...database import get_db
-from ...api.auth import get_current_user
+from ...api.auth import UsuarioActual, get_current_principal
+from ..billetera import acreditar
+from ..movimientos import registrar_al_confirmar
 
 router = APIRouter()
 
@@ -17,7 +19,7 @@ BONUS_NO_VERIFICADO = 10
 @router.post("/bonus-diario")
 def reclamar_bonus_diario(
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_user)
+    current_user: UsuarioActual = Depends(get_current_principal)
 ):
     """Reclamar bonus diario - Usando datetime con zona horaria Colombia"""
 
@@ -48,9 +50,10 @@ def reclamar_bonus_diario(
     # Calcular monto según verificación
     monto_bonus = BONUS_VERIFICADO if user.verificado else BONUS_NO_VERIFICADO
     
-    # Actualizar saldo y fecha
-    user.saldo += monto_bonus
+    # Actualizar saldo (UPDATE atómico) y fecha en la misma transacción
+    nuevo_saldo = acreditar(db, user.id, monto_bonus, commit=False)
     user.ultima_recompensa = hoy_colombia
+    registrar_al_confirmar(db, user.id, "bonus", monto_bonus, saldo_resultante=nuevo_saldo)
     
     # Opcional: Guardar también la hora exacta del reclamo
     # Si tu modelo tiene campo para hora, descomenta estas líneas:
@@ -58,12 +61,11 @@ def reclamar_bonus_diario(
     #     user.ultima_hora_recompensa = ahora_colombia
     
     db.commit()
-    db.refresh(user)
 
     return {
         "mensaje": f"✅ Bonus diario reclamado: +${monto_bonus} COP",
         "monto": monto_bonus,
-        "nuevo_saldo": user.saldo,
+        "nuevo_saldo": nuevo_saldo,
         "tipo_usuario": "verificado" if user.verificado else "no_verificado",
         "fecha_reclamo": hoy_colombia.strftime("%d/%m/%Y"),
         "hora_reclamo": ahora_colombia.strftime("%H:%M:%S"),
@@ -75,7 +77,7 @@ def reclamar_bonus_diario(
 @router.get("/bonus-diario/estado")
 def estado_bonus_diario(
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_user)
+    current_user: UsuarioActual = Depends(get_current_principal)
 ):
     """Verificar estado del bonus diario"""
     
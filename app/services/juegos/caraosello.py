@@ -2,8 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 import random
 from ...database import get_db
-from ...api.auth import get_current_user
-from ...models.usuario import Usuario
+from ...api.auth import UsuarioActual, get_current_principal
+from ..billetera import liquidar_apuesta
 
 router = APIRouter()
 
@@ -14,7 +14,7 @@ def jugar_cara_sello(
     apuesta: int,
     eleccion: str,  # "cara" o "sello"
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_user)
+    current_user: UsuarioActual = Depends(get_current_principal)
 ):
     """
     Juego de Cara o Sello.
@@ -22,12 +22,6 @@ def jugar_cara_sello(
     Si acierta, gana el doble (apuesta * 2).
     Si falla, pierde la apuesta.
     """
-    
-    # Recargar el usuario en la sesión actual
-    user = db.query(Usuario).filter(Usuario.id == current_user.id).first()
-
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
     # Validar elección
     if eleccion.lower() not in ["cara", "sello"]:
@@ -40,16 +34,6 @@ def jugar_cara_sello(
             detail=f"La apuesta mínima es ${APUESTA_MINIMA}"
         )
 
-    # Validar saldo
-    if user.saldo < apuesta:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Saldo insuficiente. Necesitas ${apuesta} para apostar."
-        )
-
-    # Descontar apuesta
-    user.saldo -= apuesta
-
     # Generar resultado aleatorio (50/50)
     resultado = random.choice(["cara", "sello", "perdiste"])  # Added "perdiste" to ensure fair distribution
     
@@ -66,13 +50,17 @@ def jugar_cara_sello(
     if gano:
         # Gana el doble de lo apostado
         ganancia = apuesta * 2
-        user.saldo += ganancia
         mensaje = f"¡Ganaste! Salió {resultado.upper()}. Has ganado ${ganancia} 🎉"
     else:
         mensaje = f"Perdiste. Salió {resultado.upper()}. Has perdido ${apuesta} 😢"
 
-    db.commit()
-    db.refresh(user)
+    # Descontar apuesta y pagar ganancia en una sola operación atómica
+    nuevo_saldo = liquidar_apuesta(db, current_user.id, apuesta, ganancia, juego="caraosello")
+    if nuevo_saldo is None:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Saldo insuficiente. Necesitas ${apuesta} para apostar."
+        )
 
     return {
         "resultado": resultado,
@@ -80,5 +68,5 @@ def jugar_cara_sello(
         "mensaje": mensaje,
         "ganancia": ganancia,
         "apuesta": apuesta,
-        "nuevo_saldo": user.saldo
+        "nuevo_saldo": nuevo_saldo
     }
\ No newline at end of file
@@ -2,8 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 import random
 from ...database import get_db
-from ...api.auth import get_current_user
-from ...models.usuario import Usuario
+from ...api.auth import UsuarioActual, get_current_principal
+from ..billetera import liquidar_apuesta
 
 router = APIRouter()
 
@@ -29,7 +29,7 @@ PALOS = ["♠️", "♥️", "♦️", "♣️"]
 def jugar_carta_mayor(
     apuesta: int,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_user)
+    current_user: UsuarioActual = Depends(get_current_principal)
 ):
     """
     Juego de Carta Mayor.
@@ -40,12 +40,6 @@ def jugar_carta_mayor(
     Casa gana: pierde la apuesta.
     """
     
-    # Recargar el usuario en la sesión actual
-    user = db.query(Usuario).filter(Usuario.id == current_user.id).first()
-
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
     # Validar apuesta mínima
     if apuesta < APUESTA_MINIMA:
         raise HTTPException(
@@ -53,15 +47,6 @@ def jugar_carta_mayor(
             detail=f"La apuesta mínima es ${APUESTA_MINIMA}"
         )
 
-    # Validar saldo
-    if user.saldo < apuesta:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Saldo insuficiente. Necesitas ${apuesta} para apostar."
-        )
-
-    # Descontar apuesta
-    user.saldo -= apuesta
     valor_casa = 0
     valor_usuario = 0
 
@@ -85,12 +70,12 @@ def jugar_carta_mayor(
     resultado = ""
     mensaje = ""
     ganancia = 0
+    devolucion = 0
     
     if valor_usuario > valor_casa:
         # Usuario gana
         resultado = "gana_usuario"
         ganancia = apuesta * 2
-        user.saldo += ganancia
         mensaje = f"¡Ganaste! Tu carta ({VALORES_CARTAS[valor_usuario][0]}) es mayor que la de la casa ({VALORES_CARTAS[valor_casa][0]}). Has ganado ${ganancia} 🎉"
     elif valor_usuario < valor_casa:
         # Casa gana
@@ -100,11 +85,16 @@ def jugar_carta_mayor(
         # Empate
         resultado = "empate"
         # Devolver la apuesta
-        user.saldo += apuesta
+        devolucion = apuesta
         mensaje = f"¡Empate! Ambos sacaron {VALORES_CARTAS[valor_usuario][0]}. Se devuelve tu apuesta de ${apuesta}."
 
-    db.commit()
-    db.refresh(user)
+    # Descontar apuesta y pagar ganancia (o devolución) en una sola operación atómica
+    nuevo_saldo = liquidar_apuesta(db, current_user.id, apuesta, ganancia + devolucion, juego="cartamayor")
+    if nuevo_saldo is None:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Saldo insuficiente. Necesitas ${apuesta} para apostar."
+        )
 
     return {
         "resultado": resultado,
@@ -123,7 +113,7 @@ def jugar_carta_mayor(
         "mensaje": mensaje,
         "ganancia": ganancia,
         "apuesta": apuesta,
-        "nuevo_saldo": user.saldo
+        "nuevo_saldo": nuevo_saldo
     }
 
 # Opcional: Endpoint para obtener estadísticas de probabilidades
@@ -1,11 +1,10 @@
-from decimal import Decimal
 import random
 from fastapi import APIRouter, HTTPException, Depends, Query
 from sqlalchemy.orm import Session
 from typing import List, Dict, Tuple, Optional
 from ...database import get_db
-from ...api.auth import get_current_user
-from ...models.usuario import Usuario
+from ...api.auth import UsuarioActual, get_current_principal
+from ..billetera import liquidar_apuesta
 
 router = APIRouter()
 
@@ -289,7 +288,7 @@ def jugar_cascadas(
     configuracion: str = Query(..., description="Configuración (5x5 o 10x10)"),
     apuesta: int = Query(..., description="Monto de la apuesta"),
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_user),
+    current_user: UsuarioActual = Depends(get_current_principal),
 ):
     # Validar configuración
     if configuracion not in CONFIGURACIONES:
@@ -307,16 +306,6 @@ def jugar_cascadas(
             detail=f"Apuesta no válida para {configuracion}. Mínimo: ${config['apuesta_minima']}, Máximo: ${config['apuesta_maxima']}"
         )
 
-    usuario = db.query(Usuario).filter(Usuario.id == current_user.id).first()
-    if not usuario:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
-    if usuario.saldo < apuesta:
-        raise HTTPException(status_code=400, detail="Saldo insuficiente para apostar")
-
-    # Descontar la apuesta
-    usuario.saldo -= apuesta
-
     # Generar matriz inicial
     matriz = generar_matriz(config["filas"], config["columnas"])
     
@@ -375,9 +364,6 @@ def jugar_cascadas(
         # Copiar matriz para mostrar el estado después de la caída
         cascada_info["matriz_despues"] = [fila.copy() for fila in matriz]
     
-    # Añadir ganancia total al saldo
-    usuario.saldo += Decimal(ganancia_total)
-
     # Preparar respuesta
     if ganancia_total > 0:
         if nivel_cascada > 1:
@@ -387,14 +373,16 @@ def jugar_cascadas(
     else:
         mensaje = "❌ Sin combinaciones esta vez. ¡Inténtalo de nuevo!"
 
-    db.commit()
-    db.refresh(usuario)
+    # Descontar apuesta y pagar ganancia en una sola operación atómica
+    nuevo_saldo = liquidar_apuesta(db, current_user.id, apuesta, ganancia_total, juego="cascadastestris")
+    if nuevo_saldo is None:
+        raise HTTPException(status_code=400, detail="Saldo insuficiente para apostar")
 
     return {
         "matriz_inicial": matriz if not cascadas else cascadas[0].get("matriz_despues", []),
         "cascadas": cascadas,
         "ganancia_total": ganancia_total,
-        "nuevo_saldo": usuario.saldo,
+        "nuevo_saldo": nuevo_saldo,
         "mensaje": mensaje,
         "apuesta": apuesta,
         "configuracion": configuracion,
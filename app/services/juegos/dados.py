@@ -1,9 +1,9 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
 from sqlalchemy.orm import Session
 import random
-from ...models.usuario import Usuario
 from ...database import get_db
-from ...api.auth import get_current_user
+from ...api.auth import UsuarioActual, get_current_principal
+from ..billetera import liquidar_apuesta
 
 router = APIRouter()
 
@@ -29,25 +29,12 @@ def obtener_configuracion():
 def lanzar_dados(
     apuesta: int = Query(..., description="Cantidad apostada"),
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_user)
+    current_user: UsuarioActual = Depends(get_current_principal)
 ):
     # Validar apuesta
     if apuesta not in APUESTAS_PERMITIDAS:
         raise HTTPException(status_code=400, detail="Apuesta no permitida")
 
-    usuario = db.query(Usuario).filter(Usuario.id == current_user.id).first()
-    if not usuario:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
-    if usuario.saldo < apuesta:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Saldo insuficiente para jugar. Se requieren ${apuesta}"
-        )
-
-    # Descontar apuesta
-    usuario.saldo -= apuesta
-
     # Lanzar los dados
     dado1 = random.randint(1, 6)
     dado2 = random.randint(1, 6)
@@ -66,16 +53,19 @@ def lanzar_dados(
         mensaje = f"¡Doble {dado1}! Ganaste {MULTIPLICADORES['doble_otro']}× tu apuesta."
         tipo_resultado = "doble_otro"
 
-    # Actualizar saldo
-    usuario.saldo += ganancia
-    db.commit()
-    db.refresh(usuario)
+    # Descontar apuesta y pagar ganancia en una sola operación atómica
+    nuevo_saldo = liquidar_apuesta(db, current_user.id, apuesta, ganancia, juego="dados")
+    if nuevo_saldo is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Saldo insuficiente para jugar. Se requieren ${apuesta}"
+        )
 
     return {
         "dado1": dado1,
         "dado2": dado2,
         "ganancia": ganancia,
-        "nuevo_saldo": usuario.saldo,
+        "nuevo_saldo": nuevo_saldo,
         "mensaje": mensaje,
         "tipo_resultado": tipo_resultado
     }
@@ -1,6 +1,5 @@
 import os
 import uuid
-import json
 from random import sample
 from typing import List, Dict, Optional
 from fastapi import APIRouter, Depends, HTTPException, status
@@ -10,8 +9,9 @@ from datetime import datetime
 
 # Ajusta estas importaciones según tu estructura de proyecto
 from ...database import get_db
-from ...api.auth import get_current_user
-from ...models.usuario import Usuario
+from ...api.auth import UsuarioActual, get_current_principal
+from ...api.sesiones import crear_session_store
+from ..billetera import acreditar, debitar, obtener_saldo
 
 router = APIRouter()
 
@@ -22,10 +22,30 @@ MINAS_CONFIG = {
     "dificil": {"tamano": 7, "minas": 20, "multiplicador_base": 1.15}
 }
 
-# Sesiones activas de juego
-sesiones_activas = {}
+# Sesiones activas de juego (store compartido entre workers, ver app/api/sesiones.py)
+sesiones_activas = crear_session_store(prefijo="minas:")
+# Índice secundario usuario_id -> session_id (un juego activo por usuario)
+sesion_por_usuario = crear_session_store(prefijo="minas-usuario:")
+
+
+def _registrar_juego(juego: "JuegoMinas") -> None:
+    """Guarda un juego nuevo y apunta el índice del usuario a él."""
+    sesiones_activas.guardar(juego.id, juego, ttl=sesiones_activas.ttl)
+    sesion_por_usuario.guardar(str(juego.usuario_id), juego.id, ttl=sesiones_activas.ttl)
+
+
+def _terminar_juego(session_id: str, usuario_id: int) -> None:
+    """Elimina el juego y su entrada del índice (si aún apunta a él)."""
+    sesiones_activas.eliminar(session_id)
+    if sesion_por_usuario.obtener(str(usuario_id)) == session_id:
+        sesion_por_usuario.eliminar(str(usuario_id))
+
 
 class JuegoMinas:
+    # Estado de la sesión en el store ("jugando" | "terminado"); solo lo cambia
+    # `reclamar`, game_over/ganado son el estado del tablero
+    estado = "jugando"
+
     def __init__(self, usuario_id: int, username: str, apuesta: int, dificultad: str):
         self.id = str(uuid.uuid4())
         self.usuario_id = usuario_id
@@ -232,17 +252,17 @@ def iniciar_minas(
     apuesta: int,
     dificultad: str = "facil",
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_user)  # Cambiado: Usuario en lugar de dict
+    current_user: UsuarioActual = Depends(get_current_principal)  # Cambiado: Usuario en lugar de dict
 ):
     """Inicia un nuevo juego de minas"""
     print(f"🔍 Solicitud recibida - apuesta: {apuesta}, dificultad: {dificultad}")
     print(f"👤 Usuario: {current_user.username} (ID: {current_user.id})")
     
     # Verificar si el usuario ya tiene un juego activo
-    for juego_id, juego in list(sesiones_activas.items()):
-        if juego.usuario_id == current_user.id:  # Cambiado: current_user.id en lugar de current_user["id"]
-            # Limpiar juego anterior
-            del sesiones_activas[juego_id]
+    juego_anterior_id = sesion_por_usuario.obtener(str(current_user.id))
+    if juego_anterior_id:
+        # Limpiar juego anterior
+        sesiones_activas.eliminar(juego_anterior_id)
     
     if dificultad not in MINAS_CONFIG:
         raise HTTPException(status_code=400, detail="Dificultad no válida. Opciones: facil, medio, dificil")
@@ -250,32 +270,27 @@ def iniciar_minas(
     if apuesta < 100:
         raise HTTPException(status_code=400, detail="La apuesta mínima es $100")
     
-    # Obtener usuario desde la base de datos (ya está cargado en current_user)
-    user = db.query(Usuario).filter(Usuario.id == current_user.id).first()  # Cambiado: current_user.id
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    
-    if user.saldo < apuesta:
+    # Descontar apuesta (validación de saldo incluida en el UPDATE)
+    nuevo_saldo = debitar(db, current_user.id, apuesta, juego="minas")
+    if nuevo_saldo is None:
+        saldo_actual = obtener_saldo(db, current_user.id)
+        if saldo_actual is None:
+            raise HTTPException(status_code=404, detail="Usuario no encontrado")
         raise HTTPException(
             status_code=400, 
-            detail=f"Saldo insuficiente. Tienes ${user.saldo}, necesitas ${apuesta} para jugar."
+            detail=f"Saldo insuficiente. Tienes ${saldo_actual}, necesitas ${apuesta} para jugar."
         )
     
-    # Descontar apuesta
-    user.saldo -= apuesta
-    db.commit()
-    db.refresh(user)
-    
     # Crear nuevo juego
     juego = JuegoMinas(
-        usuario_id=user.id,
-        username=user.username,
+        usuario_id=current_user.id,
+        username=current_user.username,
         apuesta=apuesta,
         dificultad=dificultad
     )
     
     # Guardar en sesiones activas
-    sesiones_activas[juego.id] = juego
+    _registrar_juego(juego)
     
     # Obtener config para respuesta
     config = MINAS_CONFIG[dificultad]
@@ -288,7 +303,7 @@ def iniciar_minas(
         "apuesta": apuesta,
         "dificultad": dificultad,
         "multiplicador_base": config["multiplicador_base"],
-        "nuevo_saldo": user.saldo,
+        "nuevo_saldo": nuevo_saldo,
         "mensaje": f"¡Juego iniciado! Encuentra {config['minas']} minas en un tablero {config['tamano']}x{config['tamano']}"
     }
 
@@ -298,10 +313,10 @@ def abrir_casilla(
     x: int,
     y: int,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_user)  # Cambiado: Usuario en lugar de dict
+    current_user: UsuarioActual = Depends(get_current_principal)  # Cambiado: Usuario en lugar de dict
 ):
     """Abre una casilla en el juego de minas"""
-    juego = sesiones_activas.get(session_id)
+    juego = sesiones_activas.obtener(session_id)
     if not juego:
         raise HTTPException(status_code=404, detail="Sesión de juego no encontrada o expirada")
     
@@ -309,74 +324,42 @@ def abrir_casilla(
         raise HTTPException(status_code=403, detail="No tienes permiso para este juego")
     
     try:
-        user = db.query(Usuario).filter(Usuario.id == current_user.id).first()  # Cambiado: current_user.id
-        
         resultado = juego.abrir_casilla(x, y)
         
         if resultado["game_over"]:
+            # Cerrar la partida antes de pagar: un retiro simultáneo no cobra dos veces
+            if sesiones_activas.reclamar(session_id, "jugando", "terminado") is None:
+                raise HTTPException(status_code=400, detail="El juego ya ha terminado")
+
             if resultado["ganado"]:
                 # Pagar ganancia al usuario
                 ganancia = resultado["ganancia"]
-                user.saldo += ganancia
-                
-                # Registrar en historial
-                try:
-                    from ...models.historial import HistorialJuego  # Ajusta según tu modelo
-                    historial = HistorialJuego(
-                        usuario_id=user.id,
-                        juego="minas",
-                        resultado="ganado",
-                        apuesta=juego.apuesta,
-                        ganancia=ganancia,
-                        multiplicador=juego.multiplicador_actual,
-                        dificultad=juego.dificultad,
-                        detalles=json.dumps({
-                            "casillas_abiertas": len(juego.casillas_abiertas),
-                            "minas_totales": juego.minas_totales,
-                            "session_id": session_id
-                        })
-                    )
-                    db.add(historial)
-                    db.commit()
-                
-                except Exception as e:
-                    print(f"⚠️ Error al registrar historial: {e}")
-                    db.commit()  # Aún así commit los cambios de saldo
+                # (el movimiento queda registrado en el libro mayor)
+                nuevo_saldo = acreditar(
+                    db, current_user.id, ganancia, juego="minas",
+                    detalles={
+                        "resultado": "ganado",
+                        "multiplicador": juego.multiplicador_actual,
+                        "dificultad": juego.dificultad,
+                        "casillas_abiertas": len(juego.casillas_abiertas),
+                        "minas_totales": juego.minas_totales,
+                        "session_id": session_id
+                    }
+                )
                 
                 # Eliminar sesión
-                del sesiones_activas[session_id]
+                _terminar_juego(session_id, current_user.id)
                 
                 return {
                     "success": True,
                     **resultado,
-                    "nuevo_saldo": user.saldo,
+                    "nuevo_saldo": nuevo_saldo,
                     "tablero_completo": juego.tablero,
                     "casillas_abiertas": [(c[0], c[1], juego.tablero[c[0]][c[1]]["minas_cercanas"]) for c in juego.casillas_abiertas]
                 }
             elif resultado["es_mine"]:
-                # Registrar pérdida
-                try:
-                    from ...models.historial import HistorialJuego
-                    historial = HistorialJuego(
-                        usuario_id=user.id,
-                        juego="minas",
-                        resultado="perdido",
-                        apuesta=juego.apuesta,
-                        ganancia=0,
-                        multiplicador=1.0,
-                        dificultad=juego.dificultad,
-                        detalles=json.dumps({
-                            "casillas_abiertas": len(juego.casillas_abiertas),
-                            "minas_totales": juego.minas_totales,
-                            "session_id": session_id,
-                            "mina_en": {"x": x, "y": y}
-                        })
-                    )
-                    db.add(historial)
-                    db.commit()
-                except Exception as e:
-                    print(f"⚠️ Error al registrar historial: {e}")
-                    db.commit()
+                # La apuesta ya se descontó al iniciar: solo se consulta el saldo
+                nuevo_saldo = obtener_saldo(db, current_user.id)
                 
                 # Mostrar todas las minas
                 for i in range(juego.tamano):
@@ -385,17 +368,19 @@ def abrir_casilla(
                             juego.tablero[i][j]["abierta"] = True
                 
                 # Eliminar sesión
-                del sesiones_activas[session_id]
+                _terminar_juego(session_id, current_user.id)
                 
                 return {
                     "success": True,
                     **resultado,
-                    "nuevo_saldo": user.saldo,
+                    "nuevo_saldo": nuevo_saldo,
                     "tablero_completo": juego.tablero,
                     "casillas_abiertas": [(c[0], c[1], juego.tablero[c[0]][c[1]]["minas_cercanas"]) for c in juego.casillas_abiertas]
                 }
         else:
-            # Juego aún activo
+            # Juego aún activo: persistir el tablero actualizado (si nadie lo cerró)
+            if not sesiones_activas.guardar(session_id, juego, si_estado="jugando"):
+                raise HTTPException(status_code=400, detail="El juego ya ha terminado")
             casillas_con_info = []
             for cx, cy in juego.casillas_abiertas:
                 casilla = juego.tablero[cx][cy]
@@ -405,12 +390,12 @@ def abrir_casilla(
                     "minas_cercanas": casilla["minas_cercanas"]
                 })
             
-            db.commit()
+            nuevo_saldo = obtener_saldo(db, current_user.id)
             
             return {
                 "success": True,
                 **resultado,
-                "nuevo_saldo": user.saldo,
+                "nuevo_saldo": nuevo_saldo,
                 "casillas_abiertas": casillas_con_info,
                 "casillas_marcadas": juego.casillas_marcadas,
                 "minas_restantes": juego.minas_totales - len(juego.casillas_marcadas),
@@ -419,6 +404,8 @@ def abrir_casilla(
                 "mensaje": f"Casilla segura. Multiplicador actual: {juego.multiplicador_actual:.2f}x"
             }
         
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -431,10 +418,10 @@ def marcar_casilla(
     x: int,
     y: int,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_user)  # Cambiado: Usuario en lugar de dict
+    current_user: UsuarioActual = Depends(get_current_principal)  # Cambiado: Usuario en lugar de dict
 ):
     """Marca/desmarca una casilla con bandera"""
-    juego = sesiones_activas.get(session_id)
+    juego = sesiones_activas.obtener(session_id)
     if not juego:
         raise HTTPException(status_code=404, detail="Sesión de juego no encontrada")
     
@@ -443,6 +430,8 @@ def marcar_casilla(
     
     try:
         marcada = juego.marcar_casilla(x, y)
+        if not sesiones_activas.guardar(session_id, juego, si_estado="jugando"):
+            raise ValueError("El juego ya ha terminado")
         
         return {
             "success": True,
@@ -458,10 +447,10 @@ def marcar_casilla(
 def retirarse_minas(
     session_id: str,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_user)  # Cambiado: Usuario en lugar de dict
+    current_user: UsuarioActual = Depends(get_current_principal)  # Cambiado: Usuario en lugar de dict
 ):
     """El jugador se retira del juego y cobra su ganancia"""
-    juego = sesiones_activas.get(session_id)
+    juego = sesiones_activas.obtener(session_id)
     if not juego:
         raise HTTPException(status_code=404, detail="Sesión de juego no encontrada")
     
@@ -470,46 +459,34 @@ def retirarse_minas(
     
     if juego.game_over:
         raise HTTPException(status_code=400, detail="El juego ya ha terminado")
-    
-    user = db.query(Usuario).filter(Usuario.id == current_user.id).first()  # Cambiado: current_user.id
+
+    # Reclamar la partida: solo una petición (retiro o casilla ganadora) cobra
+    juego = sesiones_activas.reclamar(session_id, "jugando", "terminado")
+    if juego is None or juego.game_over:
+        raise HTTPException(status_code=400, detail="El juego ya ha terminado")
     
     try:
         # Calcular ganancia por retiro
         ganancia = juego.retirarse()
-        user.saldo += ganancia
-        
-        # Registrar en historial
-        try:
-            from ...models.historial import HistorialJuego
-            historial = HistorialJuego(
-                usuario_id=user.id,
-                juego="minas",
-                resultado="retirado",
-                apuesta=juego.apuesta,
-                ganancia=ganancia,
-                multiplicador=juego.multiplicador_actual,
-                dificultad=juego.dificultad,
-                detalles=json.dumps({
-                    "casillas_abiertas": len(juego.casillas_abiertas),
-                    "minas_totales": juego.minas_totales,
-                    "session_id": session_id
-                })
-            )
-            db.add(historial)
-            db.commit()
-            db.refresh(user)
-        except Exception as e:
-            print(f"⚠️ Error al registrar historial: {e}")
-            db.commit()
-            db.refresh(user)
+        nuevo_saldo = acreditar(
+            db, current_user.id, ganancia, juego="minas",
+            detalles={
+                "resultado": "retirado",
+                "multiplicador": juego.multiplicador_actual,
+                "dificultad": juego.dificultad,
+                "casillas_abiertas": len(juego.casillas_abiertas),
+                "minas_totales": juego.minas_totales,
+                "session_id": session_id
+            }
+        )
         
         # Eliminar sesión
-        del sesiones_activas[session_id]
+        _terminar_juego(session_id, current_user.id)
         
         return {
             "success": True,
             "ganancia": ganancia,
-            "nuevo_saldo": user.saldo,
+            "nuevo_saldo": nuevo_saldo,
             "casillas_abiertas": len(juego.casillas_abiertas),
             "multiplicador_final": juego.multiplicador_actual,
             "mensaje": f"Te retiraste con ${ganancia} de ganancia (Multiplicador: {juego.multiplicador_actual:.2f}x)"
@@ -522,10 +499,10 @@ def retirarse_minas(
 def cancelar_juego(
     session_id: str,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_user)  # Cambiado: Usuario en lugar de dict
+    current_user: UsuarioActual = Depends(get_current_principal)  # Cambiado: Usuario en lugar de dict
 ):
     """Cancela un juego activo (sin ganancia)"""
-    juego = sesiones_activas.get(session_id)
+    juego = sesiones_activas.obtener(session_id)
     if not juego:
         raise HTTPException(status_code=404, detail="Sesión de juego no encontrada")
     
@@ -534,7 +511,7 @@ def cancelar_juego(
     
     # No devolver dinero al cancelar (ya se descontó al iniciar)
     # Eliminar sesión
-    del sesiones_activas[session_id]
+    _terminar_juego(session_id, current_user.id)
     
     return {
         "success": True,
@@ -545,10 +522,10 @@ def cancelar_juego(
 @router.get("/{session_id}/estado")
 def obtener_estado(
     session_id: str,
-    current_user: Usuario = Depends(get_current_user)  # Cambiado: Usuario en lugar de dict
+    current_user: UsuarioActual = Depends(get_current_principal)  # Cambiado: Usuario en lugar de dict
 ):
     """Obtiene el estado actual del juego"""
-    juego = sesiones_activas.get(session_id)
+    juego = sesiones_activas.obtener(session_id)
     if not juego:
         raise HTTPException(status_code=404, detail="Sesión de juego no encontrada")
     
@@ -576,12 +553,13 @@ def get_config_minas():
     }
 
 @router.get("/sesiones-activas")
-def listar_sesiones_activas(current_user: Usuario = Depends(get_current_user)):  # Cambiado: Usuario en lugar de dict
+def listar_sesiones_activas(current_user: UsuarioActual = Depends(get_current_principal)):  # Cambiado: Usuario en lugar de dict
     """Lista las sesiones activas del usuario"""
     sesiones_usuario = []
-    for juego_id, juego in sesiones_activas.items():
-        if juego.usuario_id == current_user.id:  # Cambiado: current_user.id
-            sesiones_usuario.append(juego.obtener_estado())
+    session_id = sesion_por_usuario.obtener(str(current_user.id))
+    juego = sesiones_activas.obtener(session_id) if session_id else None
+    if juego:
+        sesiones_usuario.append(juego.obtener_estado())
     
     return {
         "success": True,
@@ -598,8 +576,10 @@ def test_endpoint():
         "sesiones_activas": len(sesiones_activas)
     }
 
+# Síncrono: con el backend Postgres len() hace un SELECT count(*) y debe
+# correr en el threadpool, no en el event loop
 @router.get("/health")
-async def health_check():
+def health_check():
     """Endpoint de salud para verificar que el servidor está vivo"""
     return {
         "status": "healthy",
@@ -2,8 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 import random
 from ...database import get_db
-from ...api.auth import get_current_user
-from ...models.usuario import Usuario
+from ...api.auth import UsuarioActual, get_current_principal
+from ..billetera import liquidar_apuesta
 
 router = APIRouter()
 
@@ -36,7 +36,7 @@ def jugar_piedra_papel_tijera(
     apuesta: int,
     eleccion: str,  # "piedra", "papel" o "tijera"
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_user)
+    current_user: UsuarioActual = Depends(get_current_principal)
 ):
     """
     Juego de Piedra, Papel o Tijera.
@@ -44,12 +44,6 @@ def jugar_piedra_papel_tijera(
     La máquina elige aleatoriamente.
     """
     
-    # Recargar el usuario en la sesión actual
-    user = db.query(Usuario).filter(Usuario.id == current_user.id).first()
-
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
     # Validar elección
     if eleccion.lower() not in OPCIONES:
         raise HTTPException(status_code=400, detail="Elección no válida. Debe ser 'piedra', 'papel' o 'tijera'")
@@ -61,16 +55,6 @@ def jugar_piedra_papel_tijera(
             detail=f"La apuesta mínima es ${APUESTA_MINIMA}"
         )
 
-    # Validar saldo
-    if user.saldo < apuesta:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Saldo insuficiente. Necesitas ${apuesta} para apostar."
-        )
-
-    # Descontar apuesta
-    user.saldo -= apuesta
-
     # Máquina elige aleatoriamente
     eleccion_maquina = random.choice(list(OPCIONES.keys()))
     
@@ -78,25 +62,30 @@ def jugar_piedra_papel_tijera(
     resultado = ""
     mensaje = ""
     ganancia = 0
+    devolucion = 0
     
     if eleccion == eleccion_maquina:
         # Empate
         resultado = "empate"
-        user.saldo += apuesta  # Devolver apuesta
+        devolucion = apuesta  # Devolver apuesta
         mensaje = f"¡Empate! Ambos eligieron {OPCIONES[eleccion]['nombre']} {OPCIONES[eleccion]['emoji']}. Se devuelve tu apuesta de ${apuesta}."
     elif eleccion_maquina in OPCIONES[eleccion]["vence_a"]:
         # Usuario gana
         resultado = "gana_usuario"
         ganancia = apuesta * 2
-        user.saldo += ganancia
         mensaje = f"¡Ganaste! {OPCIONES[eleccion]['nombre']} {OPCIONES[eleccion]['emoji']} vence a {OPCIONES[eleccion_maquina]['nombre']} {OPCIONES[eleccion_maquina]['emoji']}. Has ganado ${ganancia} 🎉"
     else:
         # Máquina gana
         resultado = "gana_maquina"
         mensaje = f"Perdiste. {OPCIONES[eleccion_maquina]['nombre']} {OPCIONES[eleccion_maquina]['emoji']} vence a {OPCIONES[eleccion]['nombre']} {OPCIONES[eleccion]['emoji']}. Has perdido ${apuesta} 😢"
 
-    db.commit()
-    db.refresh(user)
+    # Descontar apuesta y pagar ganancia (o devolución) en una sola operación atómica
+    nuevo_saldo = liquidar_apuesta(db, current_user.id, apuesta, ganancia + devolucion, juego="piedrapapeltijera")
+    if nuevo_saldo is None:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Saldo insuficiente. Necesitas ${apuesta} para apostar."
+        )
 
     return {
         "resultado": resultado,
@@ -113,7 +102,7 @@ def jugar_piedra_papel_tijera(
         "mensaje": mensaje,
         "ganancia": ganancia,
         "apuesta": apuesta,
-        "nuevo_saldo": user.saldo
+        "nuevo_saldo": nuevo_saldo
     }
 
 @router.get("/juegos/piedrapapeltijera/probabilidades")
@@ -1,7 +1,6 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta
-from decimal import Decimal
+from datetime import datetime
 import random
 import uuid
 from typing import Dict, List, Tuple, Optional
@@ -11,9 +10,9 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
 from ...api.juegos import game_sessions
-from ...models import usuario
 from ...database import get_db
-from ...api.auth import get_current_user
+from ...api.auth import UsuarioActual, get_current_principal
+from ..billetera import acreditar, debitar, obtener_saldo
 
 router = APIRouter()
 
@@ -312,25 +311,11 @@ class SesionPoker:
 # Utilidades
 # ----------------------------------------------------------------------
 
-def limpiar_sesiones_expiradas():
-    now = datetime.now()
-    expiradas = []
-    for sid, sdata in list(game_sessions.items()):
-        if isinstance(sdata, SesionPoker):
-            if now - sdata.created_at > timedelta(hours=MAX_HORAS_SESION):
-                expiradas.append(sid)
-        else:
-            created = sdata.get("created_at", now)
-            if now - created > timedelta(hours=MAX_HORAS_SESION):
-                expiradas.append(sid)
-    for sid in expiradas:
-        del game_sessions[sid]
-
 
 def obtener_sesion_poker(session_id: str, user_id: int) -> SesionPoker:
-    if session_id not in game_sessions:
+    sesion = game_sessions.obtener(session_id)
+    if sesion is None:
         raise HTTPException(status_code=404, detail="Sesión de póker no encontrada")
-    sesion = game_sessions[session_id]
     if not isinstance(sesion, SesionPoker):
         raise HTTPException(status_code=400, detail="ID de sesión inválido")
     if sesion.usuario_id != user_id:
@@ -365,31 +350,23 @@ def iniciar_poker(
     apuesta: int = Query(..., description="Buy-in inicial", ge=1),
     blind: int = Query(25, description="Tamaño del blind pequeño"),
     db: Session = Depends(get_db),
-    current_user: usuario.Usuario = Depends(get_current_user),
+    current_user: UsuarioActual = Depends(get_current_principal),
 ):
-    limpiar_sesiones_expiradas()
-
     if apuesta not in APUESTAS_PERMITIDAS:
         raise HTTPException(status_code=400, detail=f"Apuesta no válida. Debe ser una de {APUESTAS_PERMITIDAS}")
 
     if blind not in BLINDS:
         raise HTTPException(status_code=400, detail=f"Blind no válido. Debe ser uno de {BLINDS}")
 
-    user = db.query(usuario.Usuario).filter(usuario.Usuario.id == current_user.id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
-    if user.saldo < apuesta:
+    # Descontar buy-in (validación de saldo incluida en el UPDATE)
+    nuevo_saldo = debitar(db, current_user.id, apuesta, juego="poker")
+    if nuevo_saldo is None:
         raise HTTPException(status_code=400, detail=f"Saldo insuficiente. Necesitas ${apuesta} para jugar.")
 
-    user.saldo -= Decimal(apuesta)
-    db.commit()
-    db.refresh(user)
-
     session_id = str(uuid.uuid4())
-    sesion = SesionPoker(session_id, user.id, apuesta, blind=blind)
+    sesion = SesionPoker(session_id, current_user.id, apuesta, blind=blind)
 
-    game_sessions[session_id] = sesion
+    game_sessions.guardar(session_id, sesion, ttl=MAX_HORAS_SESION * 3600)
 
     return {
         "session_id": session_id,
@@ -401,7 +378,7 @@ def iniciar_poker(
         "ronda_actual": sesion.mesa.ronda_actual.value,
         "small_blind": sesion.mesa.small_blind,
         "big_blind": sesion.mesa.big_blind,
-        "nuevo_saldo": user.saldo,
+        "nuevo_saldo": nuevo_saldo,
         "cartas_comunitarias": [],
         "estado": sesion.mesa.ronda_actual.value,
     }
@@ -423,7 +400,12 @@ def _avanzar_calle(s: SesionPoker):
     s.mesa.reset_calle()
 
 
-def _resolver_showdown(s: SesionPoker, db: Session, user: usuario.Usuario):
+def _resolver_showdown(s: SesionPoker, db: Session, usuario_id: int):
+    # Reclamar la partida antes de pagar: dos acciones simultáneas que llegan
+    # al showdown (o un rendirse a la vez) no pueden cobrar dos veces
+    if game_sessions.reclamar(s.session_id, "activa", "terminada") is None:
+        raise HTTPException(status_code=400, detail="La partida ya terminó")
+
     mano_j, vals_j = s.evaluar_mano(s.jugador.cartas + s.mesa.cartas_comunitarias)
     mano_b, vals_b = s.evaluar_mano(s.banca.cartas + s.mesa.cartas_comunitarias)
 
@@ -433,8 +415,6 @@ def _resolver_showdown(s: SesionPoker, db: Session, user: usuario.Usuario):
     if mano_j.value > mano_b.value:
         resultado = f"¡Ganaste con {nombre_mano(mano_j)}!"
         ganancia = s.mesa.bote - s.jugador.total_apostado()
-        if ganancia > 0:
-            user.saldo += Decimal(ganancia)
     elif mano_b.value > mano_j.value:
         resultado = f"La banca gana con {nombre_mano(mano_b)}."
         ganancia = -s.jugador.total_apostado()
@@ -452,8 +432,6 @@ def _resolver_showdown(s: SesionPoker, db: Session, user: usuario.Usuario):
         if ganador == "jugador":
             resultado = f"¡Ganaste con {nombre_mano(mano_j)} (carta más alta)!"
             ganancia = s.mesa.bote - s.jugador.total_apostado()
-            if ganancia > 0:
-                user.saldo += Decimal(ganancia)
         elif ganador == "banca":
             resultado = f"La banca gana con {nombre_mano(mano_b)} (carta más alta)."
             ganancia = -s.jugador.total_apostado()
@@ -461,22 +439,23 @@ def _resolver_showdown(s: SesionPoker, db: Session, user: usuario.Usuario):
             resultado = "¡Empate! El bote se divide."
             mitad = s.mesa.bote // 2
             ganancia = mitad - s.jugador.total_apostado()
-            if ganancia > 0:
-                user.saldo += Decimal(ganancia)
 
-    db.commit()
-    db.refresh(user)
+    # Pagar al jugador en un único UPDATE (si perdió, solo se consulta el saldo)
+    if ganancia > 0:
+        nuevo_saldo = acreditar(db, usuario_id, ganancia, juego="poker")
+    else:
+        nuevo_saldo = obtener_saldo(db, usuario_id)
 
     bote_final = s.mesa.bote
     s.mesa.bote = 0
     s.estado = "terminada"
 
-    del game_sessions[s.session_id]
+    game_sessions.eliminar(s.session_id)
 
     return {
         "resultado": resultado,
         "ganancia": ganancia,
-        "nuevo_saldo": user.saldo,
+        "nuevo_saldo": nuevo_saldo,
         "bote_final": bote_final,
         "estado": "terminada",
         "cartas_banca": [carta_a_dict(c) for c in s.banca.cartas],
@@ -554,15 +533,10 @@ def realizar_accion(
     accion: str = Query(..., description="Acción a realizar"),
     cantidad: int = Query(0, description="Cantidad total a aportar en la acción (para subir)"),
     db: Session = Depends(get_db),
-    current_user: usuario.Usuario = Depends(get_current_user),
+    current_user: UsuarioActual = Depends(get_current_principal),
 ):
-    limpiar_sesiones_expiradas()
     s = obtener_sesion_poker(session_id, current_user.id)
 
-    user = db.query(usuario.Usuario).filter(usuario.Usuario.id == current_user.id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
     if s.estado == "terminada":
         raise HTTPException(status_code=400, detail="La partida ya terminó")
 
@@ -583,17 +557,19 @@ def realizar_accion(
 
     # ---- acción jugador (1 por calle) ----
     if a == AccionJugador.RETIRARSE:
+        if game_sessions.reclamar(session_id, "activa", "terminada") is None:
+            raise HTTPException(status_code=400, detail="La partida ya terminó")
         s.jugador.retirar()
         s.estado = "terminada"
         bote_final = s.mesa.bote
         s.mesa.bote = 0
         ganancia = -s.jugador.total_apostado()
 
-        del game_sessions[session_id]
+        game_sessions.eliminar(session_id)
         return {
             "resultado": "Te retiraste. La banca gana el bote.",
             "ganancia": ganancia,
-            "nuevo_saldo": user.saldo,
+            "nuevo_saldo": obtener_saldo(db, current_user.id),
             "bote_final": bote_final,
             "estado": "terminada",
             "cartas_banca": [carta_a_dict(c) for c in s.banca.cartas],
@@ -650,7 +626,11 @@ def realizar_accion(
 
     # showdown?
     if s.mesa.ronda_actual == EstadoPartida.SHOWDOWN:
-        return _resolver_showdown(s, db, user)
+        return _resolver_showdown(s, db, current_user.id)
+
+    # Condicional: no resucitar la partida si otra petición la cerró mientras tanto
+    if not game_sessions.guardar(session_id, s, si_estado="activa"):
+        raise HTTPException(status_code=400, detail="La partida ya terminó")
 
     return {
         "fichas_jugador": s.jugador.fichas,
@@ -668,14 +648,13 @@ def realizar_accion(
 def rendirse(
     session_id: str,
     db: Session = Depends(get_db),
-    current_user: usuario.Usuario = Depends(get_current_user),
+    current_user: UsuarioActual = Depends(get_current_principal),
 ):
-    limpiar_sesiones_expiradas()
-    s = obtener_sesion_poker(session_id, current_user.id)
-
-    user = db.query(usuario.Usuario).filter(usuario.Usuario.id == current_user.id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    obtener_sesion_poker(session_id, current_user.id)
+    # Reclamar la partida: la devolución se paga una sola vez
+    s = game_sessions.reclamar(session_id, "activa", "terminada")
+    if s is None:
+        raise HTTPException(status_code=400, detail="La partida ya terminó")
 
     total_apostado = s.jugador.total_apostado()
 
@@ -686,11 +665,11 @@ def rendirse(
         devolucion = total_apostado // 2
         ganancia = devolucion - total_apostado
 
-    user.saldo += Decimal(devolucion)
-    db.commit()
-    db.refresh(user)
+    nuevo_saldo = acreditar(db, current_user.id, devolucion, juego="poker", tipo="devolucion")
+    if nuevo_saldo is None:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
-    del game_sessions[session_id]
+    game_sessions.eliminar(session_id)
 
     return {
         "resultado": (
@@ -700,7 +679,7 @@ def rendirse(
         ),
         "devolucion": devolucion,
         "ganancia": ganancia,
-        "nuevo_saldo": user.saldo,
+        "nuevo_saldo": nuevo_saldo,
         "estado": "terminada",
     }
 
@@ -709,9 +688,8 @@ def rendirse(
 def obtener_estado(
     session_id: str,
     db: Session = Depends(get_db),
-    current_user: usuario.Usuario = Depends(get_current_user),
+    current_user: UsuarioActual = Depends(get_current_principal),
 ):
-    limpiar_sesiones_expiradas()
     s = obtener_sesion_poker(session_id, current_user.id)
 
     return {
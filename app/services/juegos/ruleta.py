@@ -4,8 +4,8 @@ from typing import List
 from fastapi import APIRouter, FastAPI, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from ...database import get_db
-from ...api.auth import get_current_user
-from ...models.usuario import Usuario
+from ...api.auth import UsuarioActual, get_current_principal
+from ..billetera import liquidar_apuesta
 
 router = APIRouter()
 
@@ -56,38 +56,28 @@ OPCIONES_RULETA = [
 @router.post("/juegos/ruleta")
 def jugar_ruleta(
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_user)
+    current_user: UsuarioActual = Depends(get_current_principal)
 ):
-    # Recargar el usuario en la sesión actual
-    user = db.query(Usuario).filter(Usuario.id == current_user.id).first()
-
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
-    if user.saldo < COSTO_RULETA:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Saldo insuficiente. Necesitas ${COSTO_RULETA} para jugar."
-        )
-
     # Elegir resultado
     nombre, multiplicador, mensaje = choice(OPCIONES_RULETA)
 
-    # Descontar costo (excepto giro gratis)
-    if nombre != "Free":
-        user.saldo -= COSTO_RULETA
     ganancia = 0
     if multiplicador > 0:
         ganancia = COSTO_RULETA * multiplicador
-        user.saldo += ganancia
 
-    db.commit()
-    db.refresh(user)
+    # Se exige saldo para el costo aunque el giro salga gratis (en ese caso se devuelve)
+    reembolso = COSTO_RULETA if nombre == "Free" else 0
+    nuevo_saldo = liquidar_apuesta(db, current_user.id, COSTO_RULETA, ganancia + reembolso, juego="ruleta")
+    if nuevo_saldo is None:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Saldo insuficiente. Necesitas ${COSTO_RULETA} para jugar."
+        )
 
     return {
         "resultado": nombre,
         "mensaje": mensaje,
         "ganancia": ganancia,
         "costo_juego": COSTO_RULETA,
-        "nuevo_saldo": user.saldo
+        "nuevo_saldo": nuevo_saldo
     }
\ No newline at end of file
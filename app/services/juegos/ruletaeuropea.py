@@ -3,8 +3,8 @@ from sqlalchemy.orm import Session
 import random
 from typing import Dict, List
 from ...database import get_db
-from ...api.auth import get_current_user
-from ...models.usuario import Usuario
+from ...api.auth import UsuarioActual, get_current_principal
+from ..billetera import liquidar_apuesta
 
 router = APIRouter()
 
@@ -104,19 +104,13 @@ ruleta = RuletaEuropea()
 def jugar_ruleta_europea(
     apuestas: Dict[str, Dict],  # {tipo_apuesta: {"valor": ..., "monto": ...}}
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_user)
+    current_user: UsuarioActual = Depends(get_current_principal)
 ):
     """
     Juego de Ruleta Europea.
     El usuario puede realizar múltiples apuestas en una jugada.
     """
     
-    # Recargar el usuario en la sesión actual
-    user = db.query(Usuario).filter(Usuario.id == current_user.id).first()
-
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    
     # Validar que haya apuestas
     if not apuestas or len(apuestas) == 0:
         raise HTTPException(status_code=400, detail="Debes realizar al menos una apuesta")
@@ -132,16 +126,6 @@ def jugar_ruleta_europea(
                 detail=f"La apuesta mínima para {tipo} es $10"
             )
     
-    # Validar saldo
-    if user.saldo < total_apostado:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Saldo insuficiente. Necesitas ${total_apostado} para apostar."
-        )
-    
-    # Descontar el total apostado
-    user.saldo -= total_apostado
-    
     # Girar la ruleta
     numero_ganador = ruleta.girar()
     color_ganador = ruleta.obtener_color(numero_ganador)
@@ -220,11 +204,13 @@ def jugar_ruleta_europea(
                 "ganancia": 0
             })
     
-    # Sumar ganancias al saldo
-    user.saldo += ganancia_total
-    
-    db.commit()
-    db.refresh(user)
+    # Descontar el total apostado y sumar ganancias en una sola operación atómica
+    nuevo_saldo = liquidar_apuesta(db, current_user.id, total_apostado, ganancia_total, juego="ruletaeuropea")
+    if nuevo_saldo is None:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Saldo insuficiente. Necesitas ${total_apostado} para apostar."
+        )
     
     return {
         "numero_ganador": numero_ganador,
@@ -237,7 +223,7 @@ def jugar_ruleta_europea(
         "columna": ruleta.obtener_columna(numero_ganador),
         "total_apostado": total_apostado,
         "ganancia_total": ganancia_total,
-        "nuevo_saldo": user.saldo,
+        "nuevo_saldo": nuevo_saldo,
         "apuestas_ganadoras": apuestas_ganadoras,
         "apuestas_perdedoras": apuestas_perdedoras,
         "mensaje": f"¡Número ganador: {numero_ganador} {color_ganador.upper()}!"
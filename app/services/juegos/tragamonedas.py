@@ -2,8 +2,8 @@ import random
 from fastapi import APIRouter, HTTPException, Depends, Query
 from sqlalchemy.orm import Session
 from ...database import get_db
-from ...api.auth import get_current_user
-from ...models.usuario import Usuario
+from ...api.auth import UsuarioActual, get_current_principal
+from ..billetera import liquidar_apuesta
 
 router = APIRouter()
 
@@ -47,7 +47,7 @@ def obtener_apuestas_permitidas():
 def jugar_tragamonedas(
     apuesta: int = Query(..., description="Monto de la apuesta"),
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_user),
+    current_user: UsuarioActual = Depends(get_current_principal),
 ):
     # Validar que la apuesta esté permitida
     if apuesta not in APUESTAS_PERMITIDAS:
@@ -56,16 +56,6 @@ def jugar_tragamonedas(
             detail=f"Apuesta no válida. Apuestas permitidas: {APUESTAS_PERMITIDAS}"
         )
 
-    usuario = db.query(Usuario).filter(Usuario.id == current_user.id).first()
-    if not usuario:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
-    if usuario.saldo < apuesta:
-        raise HTTPException(status_code=400, detail="Saldo insuficiente para apostar")
-
-    # Descontar la apuesta
-    usuario.saldo -= apuesta
-
     # Probabilidad de premio ajustable según la apuesta
     PROBABILIDAD_DE_PREMIO = 0.30  # 30% base de probabilidad de premio
     
@@ -96,22 +86,21 @@ def jugar_tragamonedas(
                 break
         ganancia = 0
 
-    # Añadir ganancia al saldo
-    usuario.saldo += ganancia
-
     # Preparar mensaje
     if ganancia > 0:
         mensaje = f"🎉 ¡GANASTE! {' '.join(resultado)} - Premio: ${ganancia:,}"
     else:
         mensaje = f"❌ Sin suerte esta vez: {' '.join(resultado)}"
 
-    db.commit()
-    db.refresh(usuario)
+    # Descontar apuesta y pagar ganancia en una sola operación atómica
+    nuevo_saldo = liquidar_apuesta(db, current_user.id, apuesta, ganancia, juego="tragamonedas")
+    if nuevo_saldo is None:
+        raise HTTPException(status_code=400, detail="Saldo insuficiente para apostar")
 
     return {
         "resultado": list(resultado),  # Convertir tupla a lista para JSON
         "ganancia": ganancia,
-        "nuevo_saldo": usuario.saldo,
+        "nuevo_saldo": nuevo_saldo,
         "mensaje": mensaje,
         "apuesta_realizada": apuesta,
         "multiplicador": TABLA_PAGOS.get(resultado[0], 0) if ganancia > 0 else 0
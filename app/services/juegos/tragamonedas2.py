@@ -3,8 +3,8 @@ from fastapi import APIRouter, HTTPException, Depends, Query
 from sqlalchemy.orm import Session
 from typing import List, Dict, Tuple
 from ...database import get_db
-from ...api.auth import get_current_user
-from ...models.usuario import Usuario
+from ...api.auth import UsuarioActual, get_current_principal
+from ..billetera import liquidar_apuesta
 
 router = APIRouter()
 
@@ -145,7 +145,7 @@ def jugar_tragamonedas2(
     apuesta: int = Query(..., description="Monto de la apuesta por línea"),
     lineas_activas: int = Query(10, description="Número de líneas activas (1-10)"),
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_user),
+    current_user: UsuarioActual = Depends(get_current_principal),
 ):
     # Validaciones
     if apuesta not in APUESTAS_PERMITIDAS:
@@ -160,21 +160,8 @@ def jugar_tragamonedas2(
             detail=f"Número de líneas debe estar entre 1 y {len(LINEAS_DE_PAGO)}"
         )
 
-    usuario = db.query(Usuario).filter(Usuario.id == current_user.id).first()
-    if not usuario:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
     # Calcular apuesta total
     apuesta_total = apuesta * lineas_activas
-    
-    if usuario.saldo < apuesta_total:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Saldo insuficiente. Necesitas ${apuesta_total:,} (${apuesta:,} x {lineas_activas} líneas)"
-        )
-
-    # Descontar la apuesta total
-    usuario.saldo -= apuesta_total
 
     # Generar reels
     reels = generar_reels()
@@ -208,9 +195,6 @@ def jugar_tragamonedas2(
             "ganancia_linea": resultado["ganancia"] * apuesta if resultado["ganancia"] > 0 else 0
         })
 
-    # Añadir ganancia total al saldo
-    usuario.saldo += ganancia_total
-
     # Preparar mensaje
     if ganancia_total > 0:
         if len(lineas_ganadoras) == 1:
@@ -229,13 +213,18 @@ def jugar_tragamonedas2(
             fila.append(reels[col][row])
         reels_transpuestos.append(fila)
 
-    db.commit()
-    db.refresh(usuario)
+    # Descontar apuesta y pagar ganancia en una sola operación atómica
+    nuevo_saldo = liquidar_apuesta(db, current_user.id, apuesta_total, ganancia_total, juego="tragamonedas2")
+    if nuevo_saldo is None:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Saldo insuficiente. Necesitas ${apuesta_total:,} (${apuesta:,} x {lineas_activas} líneas)"
+        )
 
     return {
         "reels": reels_transpuestos,  # Matriz 3x5
         "ganancia_total": ganancia_total,
-        "nuevo_saldo": usuario.saldo,
+        "nuevo_saldo": nuevo_saldo,
         "mensaje": mensaje,
         "apuesta_por_linea": apuesta,
         "apuesta_total": apuesta_total,
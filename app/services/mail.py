@@ -1,42 +1,59 @@
 from datetime import datetime
+from html import escape
 import os
-from typing import Dict
-import requests
+import re
+import textwrap
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 import logging
 
+if TYPE_CHECKING:
+    # requests (urllib3, charset_normalizer...) se importa con el primer envío, no al arrancar
+    import requests
+
 logger = logging.getLogger(__name__)
 
-class SMTP2GoSimple:
-    """Servicio SMTP2Go simplificado"""
-    
-    def __init__(self):
-        self.api_key = os.environ.get("SMTP2GO_API_KEY", "test_key")
-        self.sender = os.environ.get("SMTP2GO_SENDER", "test@example.com")
-        self.enabled = bool(self.api_key and self.sender != "test@example.com")
-        self.url = os.environ.get("APP_URL", "http://localhost:8000")
-        
-    def enviar_solicitud_verificacion(self, usuario):
-        """Envía correo de solicitud de verificación simplificado"""
-        
-        # Si no está configurado SMTP2Go, solo loguear
-        if not self.enabled:
-            logger.info(f"📧 Email simulado para: {usuario.email}")
-            return {"success": True, "simulated": True}
-        
-        # Generar token simple (id + 12345678)
-        token = str(usuario.id + 12345678)
-        url_verificacion = f"https://betref.up.railway.app/verificacion/{token}"
-        
-        # Preparar el correo
-        subject = f"🔍 Solicitud de Verificación - {usuario.username}"
-        
-        # Texto simple
-        text_body = f"""
-        Hola {usuario.username},
+# Conexiones keep-alive que se mantienen abiertas con la API de SMTP2Go
+MAIL_POOL_CONEXIONES = int(os.environ.get("MAIL_POOL_CONEXIONES", 8))
+
+# -------------------------------
+# Plantillas compiladas
+# -------------------------------
+
+_CAMPO = re.compile(r"\{\{(\w+)\}\}")
+
+
+class PlantillaCorreo:
+    """
+    Plantilla de correo compilada una sola vez al importar el módulo.
+
+    El texto se parte en los trozos estáticos (CSS, maquetación...) y los
+    nombres de los campos `{{campo}}`; renderizar solo intercala los valores
+    del usuario entre trozos ya armados, sin volver a formatear todo el cuerpo.
+    Con `escapar=True` los valores se escapan para HTML.
+    """
+
+    def __init__(self, fuente: str, escapar: bool = False):
+        partes = _CAMPO.split(textwrap.dedent(fuente).strip("\n") + "\n")
+        self.estaticos: List[str] = partes[0::2]
+        self.campos: List[str] = partes[1::2]
+        self.escapar = escapar
+
+    def render(self, **valores) -> str:
+        salida = [self.estaticos[0]]
+        for campo, estatico in zip(self.campos, self.estaticos[1:]):
+            valor = str(valores[campo])
+            salida.append(escape(valor) if self.escapar else valor)
+            salida.append(estatico)
+        return "".join(salida)
+
+
+TEXTO_SOLICITUD_VERIFICACION = PlantillaCorreo("""
+        Hola {{username}},
 
         Hemos recibido tu solicitud de verificación. Para verificar tu cuenta, por favor da clic en el siguiente enlace:
 
-        {url_verificacion}
+        {{url_verificacion}}
 
         Este enlace expirará en 24 horas.
 
@@ -44,11 +61,10 @@ class SMTP2GoSimple:
 
         Atentamente,
         El equipo de soporte
-        {datetime.now().year}
-        """
-        
-        # HTML mejorado
-        html_body = f"""
+        {{anio}}
+        """)
+
+HTML_SOLICITUD_VERIFICACION = PlantillaCorreo("""
         <!DOCTYPE html>
         <html>
         <head>
@@ -56,7 +72,7 @@ class SMTP2GoSimple:
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
             <title>Verifica tu cuenta</title>
             <style>
-                body {{
+                body {
                     font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
                     line-height: 1.6;
                     color: #333;
@@ -64,23 +80,23 @@ class SMTP2GoSimple:
                     margin: 0 auto;
                     padding: 20px;
                     background-color: #f8f9fa;
-                }}
-                .container {{
+                }
+                .container {
                     background: white;
                     border-radius: 10px;
                     overflow: hidden;
                     box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-                }}
-                .header {{
+                }
+                .header {
                     background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
                     color: white;
                     padding: 30px;
                     text-align: center;
-                }}
-                .content {{
+                }
+                .content {
                     padding: 30px;
-                }}
-                .verification-link {{
+                }
+                .verification-link {
                     background: #f1f3f9;
                     border-left: 4px solid #667eea;
                     padding: 15px;
@@ -89,8 +105,8 @@ class SMTP2GoSimple:
                     word-break: break-all;
                     font-family: monospace;
                     font-size: 14px;
-                }}
-                .button {{
+                }
+                .button {
                     display: inline-block;
                     background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
                     color: white;
@@ -101,34 +117,34 @@ class SMTP2GoSimple:
                     font-size: 16px;
                     margin: 20px 0;
                     text-align: center;
-                }}
-                .warning {{
+                }
+                .warning {
                     background: #fff3cd;
                     border-left: 4px solid #ffc107;
                     padding: 15px;
                     margin: 20px 0;
                     border-radius: 5px;
                     font-size: 14px;
-                }}
-                .footer {{
+                }
+                .footer {
                     margin-top: 30px;
                     padding-top: 20px;
                     border-top: 1px solid #eee;
                     color: #666;
                     font-size: 13px;
-                }}
-                .steps {{
+                }
+                .steps {
                     margin: 25px 0;
-                }}
-                .step {{
+                }
+                .step {
                     display: flex;
                     align-items: center;
                     margin-bottom: 15px;
                     padding: 12px;
                     background: #f8f9fa;
                     border-radius: 8px;
-                }}
-                .step-number {{
+                }
+                .step-number {
                     background: #667eea;
                     color: white;
                     width: 30px;
@@ -139,7 +155,7 @@ class SMTP2GoSimple:
                     justify-content: center;
                     margin-right: 15px;
                     font-weight: bold;
-                }}
+                }
             </style>
         </head>
         <body>
@@ -150,7 +166,7 @@ class SMTP2GoSimple:
                 </div>
                 
                 <div class="content">
-                    <h2>Hola <strong>{usuario.username}</strong>,</h2>
+                    <h2>Hola <strong>{{username}}</strong>,</h2>
                     <p>Gracias por registrarte. Para completar tu registro y acceder a todas las funciones, necesitamos verificar tu cuenta.</p>
                     
                     <div class="steps">
@@ -169,14 +185,14 @@ class SMTP2GoSimple:
                     </div>
                     
                     <center>
-                        <a href="{url_verificacion}" class="button">
+                        <a href="{{url_verificacion}}" class="button">
                             ✅ VERIFICAR MI CUENTA
                         </a>
                     </center>
                     
                     <div class="verification-link">
                         <strong>Enlace alternativo:</strong><br>
-                        {url_verificacion}
+                        {{url_verificacion}}
                     </div>
                     
                     <div class="warning">
@@ -198,64 +214,20 @@ class SMTP2GoSimple:
                     Alguien (probablemente tú) solicitó la verificación de esta cuenta con este correo electrónico.</p>
                     <p style="font-size: 11px; color: #999; margin-top: 20px;">
                         Este es un correo automático, por favor no responder.<br>
-                        © {datetime.now().year} TuEmpresa. Todos los derechos reservados.
+                        © {{anio}} TuEmpresa. Todos los derechos reservados.
                     </p>
                 </div>
             </div>
         </body>
         </html>
-        """
-        
-        # Llamar a la API de SMTP2Go
-        url = "https://api.smtp2go.com/v3/email/send"
-        payload = {
-            "api_key": self.api_key,
-            "sender": self.sender,
-            "to": [usuario.email],
-            "subject": subject,
-            "text_body": text_body,
-            "html_body": html_body
-        }
-        
-        try:
-            response = requests.post(url, json=payload, timeout=10)
-            data = response.json()
-            
-            if response.status_code == 200 and data.get("data", {}).get("succeeded") == 1:
-                logger.info(f"✅ Email enviado a: {usuario.email}")
-                return {"success": True, "email_id": data.get("data", {}).get("email_id")}
-            else:
-                logger.error(f"❌ Error SMTP2Go: {data}")
-                return {"success": False, "error": data.get("error", "Unknown error")}
-                
-        except requests.exceptions.Timeout:
-            logger.error("⏰ Timeout al enviar email")
-            return {"success": False, "error": "Timeout"}
-        except requests.exceptions.RequestException as e:
-            logger.error(f"🌐 Error de conexión: {str(e)}")
-            return {"success": False, "error": str(e)}
-        except Exception as e:
-            logger.error(f"⚠️ Error enviando email: {str(e)}")
-            return {"success": False, "error": str(e)}
-    
-    def enviar_verificacion(self, usuario):
-        """Envía correo de verificación simplificado"""
-        
-        # Si no está configurado SMTP2Go, solo loguear
-        if not self.enabled:
-            logger.info(f"📧 Email simulado para: {usuario.email}")
-            return {"success": True, "simulated": True}
-        
-        # Preparar el correo
-        subject = f"✅ Cuenta verificada - {usuario.username}"
-        
-        # Texto simple
-        text_body = f"""
-        🎉 ¡FELICIDADES {usuario.username.upper()}!
+        """, escapar=True)
+
+TEXTO_VERIFICACION = PlantillaCorreo("""
+        🎉 ¡FELICIDADES {{username_mayus}}!
 
         ✅ TU CUENTA HA SIDO VERIFICADA EXITOSAMENTE
 
-        💰 SALDO ACTUAL: ${usuario.saldo:,.0f} COP
+        💰 SALDO ACTUAL: ${{saldo}} COP
         (Disponible para invertir inmediatamente)
 
         🔓 AHORA TIENES ACCESO COMPLETO:
@@ -276,11 +248,10 @@ class SMTP2GoSimple:
 
         Atentamente,
         El equipo de inversiones
-        {datetime.now().year}
-        """
-                        
-        # HTML mejorado pero manteniendo simplicidad
-        html_body = f"""
+        {{anio}}
+        """)
+
+HTML_VERIFICACION = PlantillaCorreo("""
         <!DOCTYPE html>
         <html>
         <head>
@@ -288,27 +259,27 @@ class SMTP2GoSimple:
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
             <title>Cuenta Verificada</title>
             <style>
-                body {{
+                body {
                     font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
                     line-height: 1.6;
                     color: #333;
                     max-width: 600px;
                     margin: 0 auto;
                     padding: 20px;
-                }}
-                .header {{
+                }
+                .header {
                     background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
                     color: white;
                     padding: 30px;
                     text-align: center;
                     border-radius: 10px 10px 0 0;
-                }}
-                .content {{
+                }
+                .content {
                     background: #f8f9fa;
                     padding: 30px;
                     border-radius: 0 0 10px 10px;
-                }}
-                .saldo-box {{
+                }
+                .saldo-box {
                     background: #28a745;
                     color: white;
                     padding: 20px;
@@ -317,11 +288,11 @@ class SMTP2GoSimple:
                     margin: 20px 0;
                     font-size: 24px;
                     font-weight: bold;
-                }}
-                .features {{
+                }
+                .features {
                     margin: 25px 0;
-                }}
-                .feature-item {{
+                }
+                .feature-item {
                     display: flex;
                     align-items: center;
                     margin-bottom: 10px;
@@ -329,12 +300,12 @@ class SMTP2GoSimple:
                     background: white;
                     border-radius: 5px;
                     border-left: 4px solid #667eea;
-                }}
-                .feature-icon {{
+                }
+                .feature-icon {
                     margin-right: 10px;
                     font-size: 20px;
-                }}
-                .button {{
+                }
+                .button {
                     display: inline-block;
                     background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
                     color: white;
@@ -343,22 +314,22 @@ class SMTP2GoSimple:
                     border-radius: 5px;
                     font-weight: bold;
                     margin: 15px 0;
-                }}
-                .footer {{
+                }
+                .footer {
                     margin-top: 30px;
                     padding-top: 20px;
                     border-top: 1px solid #ddd;
                     color: #666;
                     font-size: 12px;
-                }}
-                .warning {{
+                }
+                .warning {
                     background: #fff3cd;
                     border-left: 4px solid #ffc107;
                     padding: 15px;
                     margin: 15px 0;
                     border-radius: 5px;
                     font-size: 14px;
-                }}
+                }
             </style>
         </head>
         <body>
@@ -368,12 +339,12 @@ class SMTP2GoSimple:
             </div>
             
             <div class="content">
-                <h2>Hola <strong>{usuario.username}</strong>,</h2>
+                <h2>Hola <strong>{{username}}</strong>,</h2>
                 <p>Tu cuenta ha sido verificada exitosamente y ahora tienes acceso completo a todas las funcionalidades.</p>
                 
                 <div class="saldo-box">
                     💰 SALDO DISPONIBLE<br>
-                    <span style="font-size: 32px;">${usuario.saldo:,.0f} COP</span>
+                    <span style="font-size: 32px;">${{saldo}} COP</span>
                 </div>
                 
                 <div class="features">
@@ -419,29 +390,103 @@ class SMTP2GoSimple:
             
             <div class="footer">
                 Este es un correo automático, por favor no responder.<br>
-                © {datetime.now().year} TuEmpresa. Todos los derechos reservados.
+                © {{anio}} TuEmpresa. Todos los derechos reservados.
             </div>
         </body>
         </html>
-        """
+        """, escapar=True)
+
+
+class SMTP2GoSimple:
+    """Servicio SMTP2Go simplificado"""
+    
+    def __init__(self):
+        self.api_key = os.environ.get("SMTP2GO_API_KEY", "test_key")
+        self.sender = os.environ.get("SMTP2GO_SENDER", "test@example.com")
+        self.enabled = bool(self.api_key and self.sender != "test@example.com")
+        self.url = os.environ.get("APP_URL", "http://localhost:8000")
+        # Configurable para apuntar a un servidor HTTP local en pruebas
+        self.api_url = os.environ.get("SMTP2GO_API_URL", "https://api.smtp2go.com/v3/email/send")
+        self.timeout = float(os.environ.get("SMTP2GO_TIMEOUT", 10))
+        self._sesion: Optional["requests.Session"] = None
+        self._lock = threading.Lock()
+
+    @property
+    def sesion(self) -> "requests.Session":
+        """Sesión HTTP compartida (keep-alive y pool de conexiones), creada una sola vez."""
+        if self._sesion is None:
+            with self._lock:
+                if self._sesion is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    sesion = requests.Session()
+                    adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=MAIL_POOL_CONEXIONES)
+                    sesion.mount("https://", adaptador)
+                    sesion.mount("http://", adaptador)
+                    self._sesion = sesion
+        return self._sesion
+        
+    # -------------------------------
+    # Contenido de los correos
+    # -------------------------------
+
+    def contenido_solicitud_verificacion(self, usuario) -> Tuple[str, str, str]:
+        """Asunto, texto y HTML del correo de solicitud de verificación"""
+        
+        # Generar token simple (id + 12345678)
+        token = str(usuario.id + 12345678)
+        campos = {
+            "username": usuario.username,
+            "url_verificacion": f"https://betref.up.railway.app/verificacion/{token}",
+            "anio": datetime.now().year
+        }
+        
+        subject = f"🔍 Solicitud de Verificación - {usuario.username}"
+        return subject, TEXTO_SOLICITUD_VERIFICACION.render(**campos), HTML_SOLICITUD_VERIFICACION.render(**campos)
+
+    def contenido_verificacion(self, usuario) -> Tuple[str, str, str]:
+        """Asunto, texto y HTML del correo de cuenta verificada"""
+        
+        campos = {
+            "username": usuario.username,
+            "username_mayus": usuario.username.upper(),
+            "saldo": f"{usuario.saldo:,.0f}",
+            "anio": datetime.now().year
+        }
+        
+        subject = f"✅ Cuenta verificada - {usuario.username}"
+        return subject, TEXTO_VERIFICACION.render(**campos), HTML_VERIFICACION.render(**campos)
+
+    # -------------------------------
+    # Envío
+    # -------------------------------
+
+    def enviar(self, destinatario: str, asunto: str, texto: str, html: str) -> Dict:
+        """Envía un correo por la API de SMTP2Go reutilizando la sesión HTTP (bloqueante)"""
+        
+        # Si no está configurado SMTP2Go, solo loguear
+        if not self.enabled:
+            logger.info(f"📧 Email simulado para: {destinatario}")
+            return {"success": True, "simulated": True}
         
-        # Llamar a la API de SMTP2Go
-        url = "https://api.smtp2go.com/v3/email/send"
         payload = {
             "api_key": self.api_key,
             "sender": self.sender,
-            "to": [usuario.email],
-            "subject": subject,
-            "text_body": text_body,
-            "html_body": html_body
+            "to": [destinatario],
+            "subject": asunto,
+            "text_body": texto,
+            "html_body": html
         }
         
+        import requests
+
         try:
-            response = requests.post(url, json=payload, timeout=10)
+            response = self.sesion.post(self.api_url, json=payload, timeout=self.timeout)
             data = response.json()
             
             if response.status_code == 200 and data.get("data", {}).get("succeeded") == 1:
-                logger.info(f"✅ Email enviado a: {usuario.email}")
+                logger.info(f"✅ Email enviado a: {destinatario}")
                 return {"success": True, "email_id": data.get("data", {}).get("email_id")}
             else:
                 logger.error(f"❌ Error SMTP2Go: {data}")
@@ -457,5 +502,13 @@ class SMTP2GoSimple:
             logger.error(f"⚠️ Error enviando email: {str(e)}")
             return {"success": False, "error": str(e)}
 
+    def enviar_solicitud_verificacion(self, usuario):
+        """Envía correo de solicitud de verificación simplificado"""
+        return self.enviar(usuario.email, *self.contenido_solicitud_verificacion(usuario))
+    
+    def enviar_verificacion(self, usuario):
+        """Envía correo de verificación simplificado"""
+        return self.enviar(usuario.email, *self.contenido_verificacion(usuario))
+
 # Instancia global
 smtp2go = SMTP2GoSimple()
\ No newline at end of file
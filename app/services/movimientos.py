@@ -0,0 +1,211 @@
+# app/services/movimientos.py
+"""
+Registro de movimientos en el libro mayor con escritura diferida (write-behind).
+
+Los handlers solo encolan la fila en memoria (O(1), sin tocar la BD). Una tarea
+de fondo por worker la vuelca con un INSERT multi-fila cada LEDGER_FLUSH_FILAS
+filas o cada LEDGER_FLUSH_MS milisegundos, lo que ocurra primero. Al apagar la
+aplicación se hace un último volcado para no perder movimientos.
+
+Los movimientos que acompañan a un cambio de saldo dentro de una transacción
+(`registrar_al_confirmar`) solo se encolan cuando esa transacción hace commit:
+si el llamador hace rollback no queda una fila del libro mayor para un saldo
+que nunca cambió.
+"""
+import asyncio
+import json
+import os
+import threading
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Union
+
+import anyio
+from sqlalchemy import event, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..database import engine
+from ..models.movimiento import Movimiento
+
+LEDGER_FLUSH_FILAS = int(os.environ.get("LEDGER_FLUSH_FILAS", 200))
+LEDGER_FLUSH_MS = int(os.environ.get("LEDGER_FLUSH_MS", 500))
+# Tope de filas retenidas si la BD no responde (evita crecer sin límite)
+LEDGER_MAX_PENDIENTES = int(os.environ.get("LEDGER_MAX_PENDIENTES", 100000))
+
+
+class BufferMovimientos:
+    """Buffer por worker de filas pendientes de insertar en `movimientos`."""
+
+    def __init__(self, flush_filas: int = LEDGER_FLUSH_FILAS, flush_ms: int = LEDGER_FLUSH_MS):
+        self.flush_filas = flush_filas
+        self.flush_ms = flush_ms
+        self._filas: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._evento: Optional[asyncio.Event] = None
+        self._tarea: Optional[asyncio.Task] = None
+        # Filas descartadas por violar restricciones (ver `_volcar_por_fila`)
+        self.rechazadas = 0
+
+    def registrar(self, fila: Dict[str, Any]) -> None:
+        """Encola una fila; es seguro llamarlo desde el threadpool o el event loop."""
+        with self._lock:
+            self._filas.append(fila)
+            lleno = len(self._filas) >= self.flush_filas
+        if lleno and self._loop is not None and self._evento is not None:
+            self._loop.call_soon_threadsafe(self._evento.set)
+
+    def pendientes(self) -> int:
+        return len(self._filas)
+
+    def volcar(self) -> int:
+        """Inserta todo lo pendiente en una sola sentencia multi-fila. Devuelve cuántas filas escribió."""
+        with self._flush_lock:
+            with self._lock:
+                filas, self._filas = self._filas, []
+            if not filas:
+                return 0
+            try:
+                with engine.begin() as conn:
+                    conn.execute(insert(Movimiento.__table__), filas)
+                return len(filas)
+            except IntegrityError:
+                # Una fila inválida (p. ej. FK de un usuario borrado) no debe frenar
+                # al resto: se reintenta fila a fila y las rechazadas van al dead-letter
+                return self._volcar_por_fila(filas)
+            except Exception as e:
+                print(f"❌ [LEDGER] Error al volcar {len(filas)} movimientos: {e}")
+                # Error transitorio (BD caída): devolver las filas para el próximo intento
+                with self._lock:
+                    self._filas = (filas + self._filas)[-LEDGER_MAX_PENDIENTES:]
+                return 0
+
+    def _volcar_por_fila(self, filas: List[Dict[str, Any]]) -> int:
+        """Inserta cada fila en su propia transacción; las que violan restricciones se descartan."""
+        escritas = procesadas = 0
+        try:
+            with engine.connect() as conn:
+                for fila in filas:
+                    try:
+                        with conn.begin():
+                            conn.execute(insert(Movimiento.__table__), fila)
+                        escritas += 1
+                    except IntegrityError as e:
+                        self.rechazadas += 1
+                        # Dead-letter: la fila completa queda en el log para conciliarla a mano
+                        print(f"☠️ [LEDGER] Movimiento rechazado: {json.dumps(fila, default=str)} ({e.orig})")
+                    procesadas += 1
+        except Exception as e:
+            # Se cayó la conexión a mitad: las filas no procesadas vuelven al buffer
+            restantes = filas[procesadas:]
+            print(f"❌ [LEDGER] Error al volcar fila a fila ({len(restantes)} pendientes): {e}")
+            with self._lock:
+                self._filas = (restantes + self._filas)[-LEDGER_MAX_PENDIENTES:]
+        return escritas
+
+    async def _bucle(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._evento.wait(), timeout=self.flush_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+            self._evento.clear()
+            if self._filas:
+                await anyio.to_thread.run_sync(self.volcar)
+
+    async def iniciar(self) -> None:
+        """Arranca la tarea de volcado periódico (llamar desde el lifespan)."""
+        self._loop = asyncio.get_running_loop()
+        self._evento = asyncio.Event()
+        self._tarea = asyncio.create_task(self._bucle())
+        print(f"✅ Ledger de movimientos activo (cada {self.flush_filas} filas o {self.flush_ms} ms)")
+
+    async def detener(self) -> None:
+        """Detiene la tarea y hace el volcado final."""
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        escritas = await anyio.to_thread.run_sync(self.volcar)
+        print(f"✅ Ledger volcado al apagar ({escritas} movimientos)")
+
+
+buffer_movimientos = BufferMovimientos()
+
+
+def _fila_movimiento(
+    usuario_id: int,
+    tipo: str,
+    monto: Union[int, float, Decimal],
+    juego: Optional[str],
+    saldo_resultante: Optional[Union[int, float, Decimal]],
+    detalles: Optional[dict],
+) -> Dict[str, Any]:
+    return {
+        "usuario_id": usuario_id,
+        "tipo": tipo,
+        "juego": juego,
+        "monto": Decimal(str(monto)),
+        "saldo_resultante": Decimal(str(saldo_resultante)) if saldo_resultante is not None else None,
+        "detalles": json.dumps(detalles, default=str) if detalles else None,
+        "fecha": datetime.utcnow(),
+    }
+
+
+def registrar_movimiento(
+    usuario_id: int,
+    tipo: str,
+    monto: Union[int, float, Decimal],
+    juego: Optional[str] = None,
+    saldo_resultante: Optional[Union[int, float, Decimal]] = None,
+    detalles: Optional[dict] = None,
+) -> None:
+    """Encola un movimiento del libro mayor (no hace round trip a la BD)."""
+    buffer_movimientos.registrar(_fila_movimiento(usuario_id, tipo, monto, juego, saldo_resultante, detalles))
+
+
+# ----------------------------------------------------------------------
+# Movimientos ligados a la transacción del llamador
+# ----------------------------------------------------------------------
+
+_PENDIENTES = "movimientos_pendientes"
+
+
+def registrar_al_confirmar(
+    db,
+    usuario_id: int,
+    tipo: str,
+    monto: Union[int, float, Decimal],
+    juego: Optional[str] = None,
+    saldo_resultante: Optional[Union[int, float, Decimal]] = None,
+    detalles: Optional[dict] = None,
+) -> None:
+    """
+    Como `registrar_movimiento`, pero la fila espera en la sesión `db` (Session
+    o AsyncSession) y solo se encola cuando su transacción hace commit.
+    """
+    sesion = getattr(db, "sync_session", db)
+    sesion.info.setdefault(_PENDIENTES, []).append(
+        _fila_movimiento(usuario_id, tipo, monto, juego, saldo_resultante, detalles)
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def _encolar_confirmados(sesion: Session) -> None:
+    # Liberar un SAVEPOINT no hace durable nada: se espera al commit externo
+    if sesion.in_nested_transaction():
+        return
+    for fila in sesion.info.pop(_PENDIENTES, ()):
+        buffer_movimientos.registrar(fila)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _descartar_no_confirmados(sesion: Session, transaccion) -> None:
+    # Tras un commit ya no queda nada; tras rollback o close se descarta
+    if transaccion.parent is None:
+        sesion.info.pop(_PENDIENTES, None)
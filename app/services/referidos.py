@@ -1,51 +1,215 @@
-from fastapi import APIRouter, FastAPI, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, Query, Response, status
+from sqlalchemy import case, func, literal, or_, select, update
+from sqlalchemy.orm import Session, aliased
+from typing import List, Optional
 from ..models import usuario
 from ..database import get_db
 from ..api.auth import get_current_user
+from ..api.paginacion import CABECERA_CURSOR, cortar_pagina, decodificar_cursor, despues_del_cursor
 from ..schemas.usuario import ReferidoOut
 
 router = APIRouter()
 
+# Ganancia por referido directo y porcentaje que deja cada subreferido
+GANANCIA_VERIFICADO = 2000
+GANANCIA_NO_VERIFICADO = 100
+PORCENTAJE_SUBREFERIDO = 0.10
+GANANCIA_SUB_VERIFICADO = int(GANANCIA_VERIFICADO * PORCENTAJE_SUBREFERIDO)
+GANANCIA_SUB_NO_VERIFICADO = int(GANANCIA_NO_VERIFICADO * PORCENTAJE_SUBREFERIDO)
+
+
+# ========================
+# CONTADORES DE REFERIDOS
+# ========================
+def _sumar_a_referidor(db: Session, referido_por: int, ganancia_directa: int, ganancia_sub: int, **contadores):
+    """
+    Suma la ganancia (y los contadores indicados) al referidor y el porcentaje
+    al referidor de este, con dos UPDATE atómicos. No hace commit: se confirma
+    en la misma transacción que el registro o la verificación.
+    """
+    if not referido_por:
+        return
+    Usuario = usuario.Usuario
+    valores = {Usuario.ganancia_referidos: Usuario.ganancia_referidos + ganancia_directa}
+    for columna, incremento in contadores.items():
+        valores[getattr(Usuario, columna)] = getattr(Usuario, columna) + incremento
+    db.execute(
+        update(Usuario).where(Usuario.id == referido_por).values(valores)
+        .execution_options(synchronize_session=False)
+    )
+
+    padre = aliased(Usuario)
+    abuelo_id = select(padre.referido_por).where(padre.id == referido_por).scalar_subquery()
+    db.execute(
+        update(Usuario).where(Usuario.id == abuelo_id)
+        .values({Usuario.ganancia_referidos: Usuario.ganancia_referidos + ganancia_sub})
+        .execution_options(synchronize_session=False)
+    )
+
+
+def contar_nuevo_referido(db: Session, referido_por: int):
+    """Registro de un usuario referido (entra como no verificado)"""
+    _sumar_a_referidor(
+        db, referido_por, GANANCIA_NO_VERIFICADO, GANANCIA_SUB_NO_VERIFICADO,
+        referidos_total=1
+    )
+
+
+def contar_verificacion(db: Session, referido_por: int):
+    """Un referido pasa a verificado: se cambia su ganancia de no verificado a verificado"""
+    _sumar_a_referidor(
+        db, referido_por,
+        GANANCIA_VERIFICADO - GANANCIA_NO_VERIFICADO,
+        GANANCIA_SUB_VERIFICADO - GANANCIA_SUB_NO_VERIFICADO,
+        referidos_verificados=1
+    )
+
+
+def conciliar_contadores_referidos(db: Session) -> int:
+    """
+    Recalcula los contadores desde la tabla de usuarios con un único UPDATE
+    y solo reescribe las filas que se desviaron. Devuelve cuántas corrigió.
+    """
+    Usuario = usuario.Usuario
+    ref = aliased(Usuario)
+    sub = aliased(Usuario)
+
+    total = select(func.count(ref.id)).where(ref.referido_por == Usuario.id).scalar_subquery()
+    verificados = select(func.count(ref.id)).where(
+        ref.referido_por == Usuario.id, ref.verificado == True
+    ).scalar_subquery()
+    ganancia_directos = select(func.coalesce(func.sum(case(
+        (ref.verificado == True, GANANCIA_VERIFICADO), else_=GANANCIA_NO_VERIFICADO
+    )), 0)).where(ref.referido_por == Usuario.id).scalar_subquery()
+    ganancia_subreferidos = select(func.coalesce(func.sum(case(
+        (sub.verificado == True, GANANCIA_SUB_VERIFICADO), else_=GANANCIA_SUB_NO_VERIFICADO
+    )), 0)).select_from(sub).join(ref, sub.referido_por == ref.id).where(
+        ref.referido_por == Usuario.id
+    ).scalar_subquery()
+    ganancia = ganancia_directos + ganancia_subreferidos
+
+    resultado = db.execute(
+        update(Usuario).where(or_(
+            Usuario.referidos_total != total,
+            Usuario.referidos_verificados != verificados,
+            Usuario.ganancia_referidos != ganancia
+        )).values(
+            referidos_total=total,
+            referidos_verificados=verificados,
+            ganancia_referidos=ganancia
+        ).execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return resultado.rowcount
+
+
+def _arbol_subreferidos(db: Session, ids_directos: List[int], profundidad: int):
+    """
+    Descendientes de los referidos directos hasta `profundidad` niveles
+    (nivel 1 = referidos directos) en una sola consulta con CTE recursiva.
+    Devuelve {id_padre: [nodo, ...]} con cada nodo listo para la respuesta.
+    """
+    Usuario = usuario.Usuario
+    arbol = select(
+        Usuario.id,
+        Usuario.referido_por,
+        Usuario.username,
+        Usuario.verificado,
+        literal(2).label("nivel")
+    ).where(Usuario.referido_por.in_(ids_directos)).cte("arbol", recursive=True)
+
+    hijo = aliased(Usuario)
+    arbol = arbol.union_all(
+        select(
+            hijo.id,
+            hijo.referido_por,
+            hijo.username,
+            hijo.verificado,
+            arbol.c.nivel + 1
+        ).where(hijo.referido_por == arbol.c.id, arbol.c.nivel < profundidad)
+    )
+
+    hijos_por_padre = {}
+    for fila in db.execute(select(arbol).order_by(arbol.c.nivel, arbol.c.id)):
+        nodo = {"username": fila.username, "verificado": fila.verificado, "referidos": []}
+        hijos_por_padre.setdefault(fila.referido_por, []).append(nodo)
+        # Los hijos de este nodo (nivel siguiente) se cuelgan de su lista
+        hijos_por_padre.setdefault(fila.id, nodo["referidos"])
+    return hijos_por_padre
+
+
 # ========================
 # SISTEMA DE REFERIDOS
 # ========================
 @router.get("/referidos", response_model=List[ReferidoOut])
 def obtener_referidos(
+    response: Response,
+    limite: int = Query(100, ge=1, le=1000, description="Referidos directos por página"),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    profundidad: int = Query(2, ge=1, le=5, description="Niveles del árbol a incluir"),
     db: Session = Depends(get_db), 
     current_user: usuario.Usuario = Depends(get_current_user)
 ):
-    """Obtener lista de usuarios referidos y ganancias"""
-    referidos = db.query(usuario.Usuario).filter(
-        usuario.Usuario.referido_por == current_user.id
-    ).all()
+    """Obtener lista de usuarios referidos y ganancias (paginada por referidos directos)"""
+    Usuario = usuario.Usuario
+    posicion = decodificar_cursor(cursor, (int,))
 
-    resultado = []
+    # Página de referidos directos; la ganancia sale de sus contadores materializados
+    ganancia_base = case((Usuario.verificado == True, GANANCIA_VERIFICADO), else_=GANANCIA_NO_VERIFICADO)
+    ganancia_sub = (
+        Usuario.referidos_verificados * GANANCIA_SUB_VERIFICADO
+        + (Usuario.referidos_total - Usuario.referidos_verificados) * GANANCIA_SUB_NO_VERIFICADO
+    )
 
-    for ref in referidos:
-        # Ganancia base por referido
-        ganancia_base = 2000 if ref.verificado else 100
+    consulta = db.query(
+        Usuario.id,
+        Usuario.username,
+        Usuario.verificado,
+        (ganancia_base + ganancia_sub).label("ganancia")
+    ).filter(
+        Usuario.referido_por == current_user.id
+    )
+    if posicion:
+        consulta = consulta.filter(despues_del_cursor((Usuario.id,), posicion, descendente=False))
+    referidos = consulta.order_by(Usuario.id).limit(limite + 1).all()
 
-        # Buscar subreferidos (referidos del referido)
-        subreferidos = db.query(usuario.Usuario).filter(
-            usuario.Usuario.referido_por == ref.id
-        ).all()
+    referidos, siguiente = cortar_pagina(referidos, limite, lambda r: (r.id,))
+    if siguiente:
+        response.headers[CABECERA_CURSOR] = siguiente
 
-        # Calcular ganancia por subreferidos (10% de ganancia)
-        ganancia_subreferidos = 0
-        for sub in subreferidos:
-            sub_ganancia = 2000 if sub.verificado else 100
-            ganancia_subreferidos += int(sub_ganancia * 0.10)
+    # Subreferidos (y niveles más profundos) de toda la página en una sola consulta
+    hijos_por_padre = {}
+    if referidos and profundidad >= 2:
+        hijos_por_padre = _arbol_subreferidos(db, [ref.id for ref in referidos], profundidad)
 
-        resultado.append({
+    return [
+        {
             "username": ref.username,
             "verificado": ref.verificado,
-            "ganancia": ganancia_base + ganancia_subreferidos,
-            "referidos": [
-                {"username": sub.username, "verificado": sub.verificado}
-                for sub in subreferidos
-            ]
-        })
-
-    return resultado
\ No newline at end of file
+            "ganancia": int(ref.ganancia),
+            "referidos": hijos_por_padre.get(ref.id, [])
+        }
+        for ref in referidos
+    ]
+
+
+@router.get("/referidos/resumen")
+def obtener_resumen_referidos(
+    db: Session = Depends(get_db),
+    current_user: usuario.Usuario = Depends(get_current_user)
+):
+    """Totales del panel de afiliado (lectura O(1) de los contadores del usuario)"""
+    Usuario = usuario.Usuario
+    resumen = db.query(
+        Usuario.referidos_total,
+        Usuario.referidos_verificados,
+        Usuario.ganancia_referidos
+    ).filter(Usuario.id == current_user.id).first()
+    if not resumen:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+
+    return {
+        "referidos_total": resumen.referidos_total,
+        "referidos_verificados": resumen.referidos_verificados,
+        "ganancia_referidos": resumen.ganancia_referidos
+    }
@@ -1,71 +1,84 @@
 # app/services/transacciones.py (VERSIÓN CORREGIDA)
 
-from fastapi import APIRouter, Body, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response, UploadFile, File, Form
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List
 import uuid
 from datetime import datetime
-import os
 
-from ..database import SessionLocal
+from ..database import get_async_db
 from ..models import usuario as usuario_model
 from ..models import deposito as deposito_model
 from ..models import retiro as retiro_model
 from ..services.auth import get_current_user
+from ..api.auth import UsuarioActual, get_current_principal
+from ..api.paginacion import (
+    CABECERA_CURSOR, PAGINA_MAXIMA, PAGINA_POR_DEFECTO, cortar_pagina,
+    decodificar_cursor, despues_del_cursor, respuesta_json_streaming
+)
+from .archivos import guardar_upload_async
+from .billetera import acreditar_async, debitar_async
+from .movimientos import registrar_al_confirmar
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Todos los handlers de este router son `async def`: cualquier acceso a BD
+# o a disco debe ser awaitable para no bloquear el event loop.
 
 # ========================
 # ENDPOINTS DE ADMINISTRACIÓN PARA DEPÓSITOS
 # ========================
 
+def _usuario_de_fila(fila):
+    """Datos del usuario que vienen en la misma fila del JOIN (None si no existe)"""
+    if fila.username is None:
+        return None
+    return {
+        "username": fila.username,
+        "email": fila.email,
+        "verificado": fila.verificado
+    }
+
 @router.get("/admin/depositos/pendientes")
 async def obtener_depositos_pendientes(
-    current_user: usuario_model.Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    limite: int = Query(PAGINA_POR_DEFECTO, ge=1, le=PAGINA_MAXIMA),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    metodo: Optional[str] = Query(None, description="Filtrar por método de pago"),
+    monto_min: Optional[float] = Query(None, ge=0),
+    monto_max: Optional[float] = Query(None, ge=0),
+    current_user: UsuarioActual = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Obtener depósitos pendientes (solo admin)"""
+    """Obtener depósitos pendientes (solo admin), paginados por (fecha_solicitud, id)"""
     if current_user.username != "admin":
         raise HTTPException(status_code=403, detail="Acceso denegado. Solo administradores")
 
-    try:
-        # ✅ Usar nombres de variable diferentes
-        depositos_pendientes = db.query(deposito_model.Deposito).filter(
-            deposito_model.Deposito.estado == "PENDIENTE"
-        ).order_by(deposito_model.Deposito.fecha_solicitud.desc()).all()
+    Deposito = deposito_model.Deposito
+    Usuario = usuario_model.Usuario
+    posicion = decodificar_cursor(cursor, (datetime, int))
 
-        # Enriquecer con información del usuario
-        resultados = []
-        for dep in depositos_pendientes:  # ✅ Usar 'dep' en lugar de 'deposito'
-            usr = db.query(usuario_model.Usuario).filter(
-                usuario_model.Usuario.id == dep.usuario_id
-            ).first()
-            
-            resultados.append({
-                "id": dep.id,
-                "usuario_id": dep.usuario_id,
-                "monto": float(dep.monto),  # ✅ Convertir a float para JSON
-                "metodo_pago": dep.metodo_pago,
-                "referencia": dep.referencia,
-                "estado": dep.estado,
-                "comprobante_url": dep.comprobante_url,
-                "fecha_solicitud": dep.fecha_solicitud.isoformat() if dep.fecha_solicitud else None,
-                "fecha_procesamiento": dep.fecha_procesamiento.isoformat() if dep.fecha_procesamiento else None,
-                "usuario": {
-                    "username": usr.username if usr else "Desconocido",
-                    "email": usr.email if usr else None,
-                    "verificado": usr.verificado if usr else False
-                } if usr else None
-            })
-        
-        return resultados
+    try:
+        # Depósito y usuario en una sola consulta (sin una consulta por fila)
+        consulta = select(
+            Deposito, Usuario.username, Usuario.email, Usuario.verificado
+        ).outerjoin(
+            Usuario, Usuario.id == Deposito.usuario_id
+        ).where(Deposito.estado == "PENDIENTE")
+
+        if metodo:
+            consulta = consulta.where(Deposito.metodo_pago == metodo)
+        if monto_min is not None:
+            consulta = consulta.where(Deposito.monto >= monto_min)
+        if monto_max is not None:
+            consulta = consulta.where(Deposito.monto <= monto_max)
+        if posicion:
+            consulta = consulta.where(despues_del_cursor((Deposito.fecha_solicitud, Deposito.id), posicion))
+
+        filas = (await db.execute(
+            consulta.order_by(Deposito.fecha_solicitud.desc(), Deposito.id.desc()).limit(limite + 1)
+        )).all()
+        filas, siguiente = cortar_pagina(filas, limite, lambda f: (f.Deposito.fecha_solicitud, f.Deposito.id))
     
     except Exception as e:
         print(f"❌ Error en obtener_depositos_pendientes: {e}")
@@ -74,11 +87,27 @@ async def obtener_depositos_pendientes(
             detail=f"Error al obtener depósitos: {str(e)}"
         )
 
+    return respuesta_json_streaming((
+        {
+            "id": f.Deposito.id,
+            "usuario_id": f.Deposito.usuario_id,
+            "monto": float(f.Deposito.monto),
+            "metodo_pago": f.Deposito.metodo_pago,
+            "referencia": f.Deposito.referencia,
+            "estado": f.Deposito.estado,
+            "comprobante_url": f.Deposito.comprobante_url,
+            "fecha_solicitud": f.Deposito.fecha_solicitud.isoformat() if f.Deposito.fecha_solicitud else None,
+            "fecha_procesamiento": f.Deposito.fecha_procesamiento.isoformat() if f.Deposito.fecha_procesamiento else None,
+            "usuario": _usuario_de_fila(f)
+        }
+        for f in filas
+    ), siguiente)
+
 @router.post("/admin/depositos/{deposito_id}/aprobar")
 async def aprobar_deposito(
     deposito_id: int,
-    current_user: usuario_model.Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UsuarioActual = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Aprobar un depósito pendiente (solo admin)"""
     if current_user.username != "admin":
@@ -86,9 +115,7 @@ async def aprobar_deposito(
 
     try:
         # Buscar el depósito usando un nombre de variable único
-        deposito_obj = db.query(deposito_model.Deposito).filter(
-            deposito_model.Deposito.id == deposito_id
-        ).first()
+        deposito_obj = await db.get(deposito_model.Deposito, deposito_id)
         
         if not deposito_obj:
             raise HTTPException(status_code=404, detail="Depósito no encontrado")
@@ -96,62 +123,59 @@ async def aprobar_deposito(
         if deposito_obj.estado != "PENDIENTE":
             raise HTTPException(status_code=400, detail="El depósito ya fue procesado")
 
-        # Buscar usuario asociado al depósito
-        usuario_deposito = db.query(usuario_model.Usuario).filter(
-            usuario_model.Usuario.id == deposito_obj.usuario_id
-        ).first()
-        
-        if not usuario_deposito:
+        # Reclamar el depósito: dos aprobaciones simultáneas no lo acreditan dos veces
+        reclamado = await db.execute(
+            update(deposito_model.Deposito)
+            .where(deposito_model.Deposito.id == deposito_id, deposito_model.Deposito.estado == "PENDIENTE")
+            .values(estado="APROBADO", fecha_procesamiento=datetime.now())
+            .execution_options(synchronize_session=False)
+        )
+        if reclamado.rowcount == 0:
+            raise HTTPException(status_code=400, detail="El depósito ya fue procesado")
+
+        # Sumar con UPDATE saldo = saldo + monto (no pisa apuestas o premios concurrentes)
+        nuevo_saldo = await acreditar_async(db, deposito_obj.usuario_id, deposito_obj.monto, commit=False)
+        if nuevo_saldo is None:
+            await db.rollback()
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
-        
-        print(f"[APROBAR DEPÓSITO] Usuario: {usuario_deposito.username}, Saldo actual: {usuario_deposito.saldo}, Monto a sumar: {deposito_obj.monto}")
-        
-        # Actualizar saldo del usuario
-        usuario_deposito.saldo = float(usuario_deposito.saldo) + float(deposito_obj.monto)
-        
-        # Actualizar estado del depósito
-        deposito_obj.estado = "APROBADO"
-        deposito_obj.fecha_procesamiento = datetime.now()
-        
-        # Guardar cambios
-        db.commit()
-        
-        # Refrescar los objetos para obtener los valores actualizados
-        db.refresh(usuario_deposito)
-        db.refresh(deposito_obj)
-        
-        print(f"[APROBAR DEPÓSITO] Nuevo saldo: {usuario_deposito.saldo}")
-        
+
+        registrar_al_confirmar(
+            db, deposito_obj.usuario_id, "deposito", deposito_obj.monto,
+            saldo_resultante=nuevo_saldo,
+            detalles={"deposito_id": deposito_obj.id, "referencia": deposito_obj.referencia}
+        )
+        await db.commit()
+
+        print(f"[APROBAR DEPÓSITO] Usuario {deposito_obj.usuario_id}: +{deposito_obj.monto}, nuevo saldo {nuevo_saldo}")
+
         return {
             "mensaje": "Depósito aprobado correctamente",
             "deposito_id": deposito_obj.id,
-            "usuario_id": usuario_deposito.id,
+            "usuario_id": deposito_obj.usuario_id,
             "monto": float(deposito_obj.monto),
-            "nuevo_saldo_usuario": float(usuario_deposito.saldo),
-            "estado_deposito": deposito_obj.estado
+            "nuevo_saldo_usuario": float(nuevo_saldo),
+            "estado_deposito": "APROBADO"
         }
     
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"❌ Error al aprobar depósito: {e}")
         raise HTTPException(status_code=500, detail=f"Error al aprobar: {str(e)}")
 
 @router.post("/admin/depositos/{deposito_id}/rechazar")
 async def rechazar_deposito(
     deposito_id: int,
-    current_user: usuario_model.Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UsuarioActual = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Rechazar un depósito pendiente (solo admin)"""
     if current_user.username != "admin":
         raise HTTPException(status_code=403, detail="Acceso denegado. Solo administradores")
 
     try:
-        dep = db.query(deposito_model.Deposito).filter(
-            deposito_model.Deposito.id == deposito_id
-        ).first()
+        dep = await db.get(deposito_model.Deposito, deposito_id)
         
         if not dep:
             raise HTTPException(status_code=404, detail="Depósito no encontrado")
@@ -163,7 +187,7 @@ async def rechazar_deposito(
         dep.estado = "RECHAZADO"
         dep.fecha_procesamiento = datetime.now()
         
-        db.commit()
+        await db.commit()
         
         return {
             "mensaje": "Depósito rechazado correctamente",
@@ -173,7 +197,7 @@ async def rechazar_deposito(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"❌ Error al rechazar depósito: {e}")
         raise HTTPException(status_code=500, detail=f"Error al rechazar: {str(e)}")
 
@@ -183,7 +207,7 @@ async def realizar_deposito(
     metodo_pago: str = Form(...),
     comprobante: Optional[UploadFile] = File(None),
     current_user: usuario_model.Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Realizar un nuevo depósito"""
     print(f"[DEPOSITO] Usuario: {current_user.username if current_user else 'None'}")
@@ -205,16 +229,12 @@ async def realizar_deposito(
     comprobante_url = None
     if comprobante:
         try:
-            os.makedirs("recibos", exist_ok=True)
-            filename = f"{current_user.id}_{int(datetime.now().timestamp())}_{comprobante.filename}"
-            file_location = f"recibos/{filename}"
+            guardado = await guardar_upload_async(comprobante)
             
-            with open(file_location, "wb+") as file_object:
-                content = await comprobante.read()
-                file_object.write(content)
-            
-            comprobante_url = f"recibos/{filename}"
-            print(f"✅ Comprobante guardado en: {comprobante_url}")
+            comprobante_url = guardado.url
+            print(f"✅ Comprobante guardado en: {comprobante_url} ({guardado.tamano} bytes, sha256 {guardado.sha256[:12]})")
+        except HTTPException:
+            raise
         except Exception as e:
             print(f"❌ Error al guardar comprobante: {e}")
             raise HTTPException(status_code=500, detail="Error al guardar el comprobante")
@@ -236,8 +256,8 @@ async def realizar_deposito(
         )
         
         db.add(nuevo_deposito)
-        db.commit()
-        db.refresh(nuevo_deposito)
+        await db.commit()
+        await db.refresh(nuevo_deposito)
         
         print(f"✅ Depósito creado: {referencia} para usuario {current_user.username}")
         
@@ -254,7 +274,7 @@ async def realizar_deposito(
         }
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"❌ Error al crear depósito: {e}")
         raise HTTPException(status_code=500, detail="Error al procesar el depósito")
 
@@ -264,14 +284,26 @@ async def realizar_deposito(
 
 @router.get("/mis-depositos")
 async def obtener_mis_depositos(
-    current_user: usuario_model.Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    response: Response,
+    limite: int = Query(PAGINA_POR_DEFECTO, ge=1, le=PAGINA_MAXIMA),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    current_user: UsuarioActual = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Obtener el historial de depósitos del usuario actual"""
+    """Obtener el historial de depósitos del usuario actual (paginado por fecha)"""
+    Deposito = deposito_model.Deposito
+    posicion = decodificar_cursor(cursor, (datetime, int))
+
     try:
-        depositos = db.query(deposito_model.Deposito).filter(
-            deposito_model.Deposito.usuario_id == current_user.id
-        ).order_by(deposito_model.Deposito.fecha_solicitud.desc()).all()
+        consulta = select(Deposito).where(Deposito.usuario_id == current_user.id)
+        if posicion:
+            consulta = consulta.where(despues_del_cursor((Deposito.fecha_solicitud, Deposito.id), posicion))
+        depositos = (await db.execute(
+            consulta.order_by(Deposito.fecha_solicitud.desc(), Deposito.id.desc()).limit(limite + 1)
+        )).scalars().all()
+        depositos, siguiente = cortar_pagina(list(depositos), limite, lambda x: (x.fecha_solicitud, x.id))
+        if siguiente:
+            response.headers[CABECERA_CURSOR] = siguiente
 
         resultados = []
         for dep in depositos:
@@ -298,14 +330,12 @@ async def obtener_mis_depositos(
 @router.get("/deposito/{deposito_id}")
 async def obtener_detalle_deposito(
     deposito_id: int,
-    current_user: usuario_model.Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UsuarioActual = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Obtener detalle de un depósito específico"""
     try:
-        deposito = db.query(deposito_model.Deposito).filter(
-            deposito_model.Deposito.id == deposito_id
-        ).first()
+        deposito = await db.get(deposito_model.Deposito, deposito_id)
 
         if not deposito:
             raise HTTPException(status_code=404, detail="Depósito no encontrado")
@@ -347,7 +377,7 @@ async def realizar_retiro(
     comision: Optional[float] = Body(...),
     total: Optional[float] = Body(...),
     current_user: usuario_model.Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Realizar una solicitud de retiro"""
     print(f"[RETIRO] Usuario: {current_user.username}")
@@ -402,8 +432,8 @@ async def realizar_retiro(
         )
         
         db.add(nuevo_retiro)
-        db.commit()
-        db.refresh(nuevo_retiro)
+        await db.commit()
+        await db.refresh(nuevo_retiro)
         
         print(f"✅ Retiro creado: {referencia} para usuario {current_user.username}")
         
@@ -421,20 +451,32 @@ async def realizar_retiro(
         }
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"❌ Error al crear retiro: {e}")
         raise HTTPException(status_code=500, detail="Error al procesar el retiro")
 
 @router.get("/mis-retiros")
 async def obtener_mis_retiros(
-    current_user: usuario_model.Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    response: Response,
+    limite: int = Query(PAGINA_POR_DEFECTO, ge=1, le=PAGINA_MAXIMA),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    current_user: UsuarioActual = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Obtener el historial de retiros del usuario actual"""
+    """Obtener el historial de retiros del usuario actual (paginado por fecha)"""
+    Retiro = retiro_model.Retiro
+    posicion = decodificar_cursor(cursor, (datetime, int))
+
     try:
-        retiros = db.query(retiro_model.Retiro).filter(
-            retiro_model.Retiro.usuario_id == current_user.id
-        ).order_by(retiro_model.Retiro.fecha_solicitud.desc()).all()
+        consulta = select(Retiro).where(Retiro.usuario_id == current_user.id)
+        if posicion:
+            consulta = consulta.where(despues_del_cursor((Retiro.fecha_solicitud, Retiro.id), posicion))
+        retiros = (await db.execute(
+            consulta.order_by(Retiro.fecha_solicitud.desc(), Retiro.id.desc()).limit(limite + 1)
+        )).scalars().all()
+        retiros, siguiente = cortar_pagina(list(retiros), limite, lambda x: (x.fecha_solicitud, x.id))
+        if siguiente:
+            response.headers[CABECERA_CURSOR] = siguiente
 
         resultados = []
         for ret in retiros:
@@ -464,41 +506,42 @@ async def obtener_mis_retiros(
 
 @router.get("/admin/retiros/pendientes")
 async def obtener_retiros_pendientes(
-    current_user: usuario_model.Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    limite: int = Query(PAGINA_POR_DEFECTO, ge=1, le=PAGINA_MAXIMA),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    metodo: Optional[str] = Query(None, description="Filtrar por método de retiro"),
+    monto_min: Optional[float] = Query(None, ge=0),
+    monto_max: Optional[float] = Query(None, ge=0),
+    current_user: UsuarioActual = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Obtener retiros pendientes (solo admin)"""
+    """Obtener retiros pendientes (solo admin), paginados por (fecha_solicitud, id)"""
     if current_user.username != "admin":
         raise HTTPException(status_code=403, detail="Acceso denegado. Solo administradores")
 
-    try:
-        retiros_pendientes = db.query(retiro_model.Retiro).filter(
-            retiro_model.Retiro.estado == "PENDIENTE"
-        ).order_by(retiro_model.Retiro.fecha_solicitud.desc()).all()
+    Retiro = retiro_model.Retiro
+    Usuario = usuario_model.Usuario
+    posicion = decodificar_cursor(cursor, (datetime, int))
 
-        resultados = []
-        for ret in retiros_pendientes:
-            usr = db.query(usuario_model.Usuario).filter(
-                usuario_model.Usuario.id == ret.usuario_id
-            ).first()
-            
-            resultados.append({
-                "id": ret.id,
-                "usuario_id": ret.usuario_id,
-                "monto": float(ret.monto),
-                "metodo_retiro": ret.metodo_retiro,
-                "cuenta_destino": ret.cuenta_destino,
-                "referencia": ret.referencia,
-                "estado": ret.estado,
-                "fecha_solicitud": ret.fecha_solicitud.isoformat() if ret.fecha_solicitud else None,
-                "usuario": {
-                    "username": usr.username if usr else "Desconocido",
-                    "email": usr.email if usr else None,
-                    "verificado": usr.verificado if usr else False
-                } if usr else None
-            })
-        
-        return resultados
+    try:
+        consulta = select(
+            Retiro, Usuario.username, Usuario.email, Usuario.verificado
+        ).outerjoin(
+            Usuario, Usuario.id == Retiro.usuario_id
+        ).where(Retiro.estado == "PENDIENTE")
+
+        if metodo:
+            consulta = consulta.where(Retiro.metodo_retiro == metodo)
+        if monto_min is not None:
+            consulta = consulta.where(Retiro.monto >= monto_min)
+        if monto_max is not None:
+            consulta = consulta.where(Retiro.monto <= monto_max)
+        if posicion:
+            consulta = consulta.where(despues_del_cursor((Retiro.fecha_solicitud, Retiro.id), posicion))
+
+        filas = (await db.execute(
+            consulta.order_by(Retiro.fecha_solicitud.desc(), Retiro.id.desc()).limit(limite + 1)
+        )).all()
+        filas, siguiente = cortar_pagina(filas, limite, lambda f: (f.Retiro.fecha_solicitud, f.Retiro.id))
     
     except Exception as e:
         print(f"❌ Error en obtener_retiros_pendientes: {e}")
@@ -507,20 +550,33 @@ async def obtener_retiros_pendientes(
             detail=f"Error al obtener retiros: {str(e)}"
         )
 
+    return respuesta_json_streaming((
+        {
+            "id": f.Retiro.id,
+            "usuario_id": f.Retiro.usuario_id,
+            "monto": float(f.Retiro.monto),
+            "metodo_retiro": f.Retiro.metodo_retiro,
+            "cuenta_destino": f.Retiro.cuenta_destino,
+            "referencia": f.Retiro.referencia,
+            "estado": f.Retiro.estado,
+            "fecha_solicitud": f.Retiro.fecha_solicitud.isoformat() if f.Retiro.fecha_solicitud else None,
+            "usuario": _usuario_de_fila(f)
+        }
+        for f in filas
+    ), siguiente)
+
 @router.post("/admin/retiros/{retiro_id}/aprobar")
 async def aprobar_retiro(
     retiro_id: int,
-    current_user: usuario_model.Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UsuarioActual = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Aprobar un retiro pendiente (solo admin)"""
     if current_user.username != "admin":
         raise HTTPException(status_code=403, detail="Acceso denegado. Solo administradores")
 
     try:
-        retiro_obj = db.query(retiro_model.Retiro).filter(
-            retiro_model.Retiro.id == retiro_id
-        ).first()
+        retiro_obj = await db.get(retiro_model.Retiro, retiro_id)
         
         if not retiro_obj:
             raise HTTPException(status_code=404, detail="Retiro no encontrado")
@@ -528,67 +584,74 @@ async def aprobar_retiro(
         if retiro_obj.estado != "PENDIENTE":
             raise HTTPException(status_code=400, detail="El retiro ya fue procesado")
 
-        # Buscar usuario asociado al retiro
-        usuario_retiro = db.query(usuario_model.Usuario).filter(
-            usuario_model.Usuario.id == retiro_obj.usuario_id
-        ).first()
-        
-        if not usuario_retiro:
-            raise HTTPException(status_code=404, detail="Usuario no encontrado")
-        
-        # Verificar que aún tenga saldo suficiente
-        if retiro_obj.monto > usuario_retiro.saldo:
-            retiro_obj.estado = "RECHAZADO"
-            retiro_obj.fecha_procesamiento = datetime.now()
-            retiro_obj.observaciones = "Saldo insuficiente al momento de procesar"
-            db.commit()
+        # Reclamar el retiro: dos aprobaciones simultáneas no lo descuentan dos veces
+        reclamado = await db.execute(
+            update(retiro_model.Retiro)
+            .where(retiro_model.Retiro.id == retiro_id, retiro_model.Retiro.estado == "PENDIENTE")
+            .values(estado="APROBADO", fecha_procesamiento=datetime.now())
+            .execution_options(synchronize_session=False)
+        )
+        if reclamado.rowcount == 0:
+            raise HTTPException(status_code=400, detail="El retiro ya fue procesado")
+
+        # Descontar con UPDATE ... WHERE saldo >= monto: la comprobación de saldo es la misma sentencia
+        usuario_id, monto = retiro_obj.usuario_id, retiro_obj.monto
+        nuevo_saldo = await debitar_async(db, usuario_id, monto, commit=False)
+        if nuevo_saldo is None:
+            await db.rollback()
+            if await db.get(usuario_model.Usuario, usuario_id) is None:
+                raise HTTPException(status_code=404, detail="Usuario no encontrado")
+
+            # Saldo insuficiente al momento de procesar
+            await db.execute(
+                update(retiro_model.Retiro)
+                .where(retiro_model.Retiro.id == retiro_id, retiro_model.Retiro.estado == "PENDIENTE")
+                .values(estado="RECHAZADO", fecha_procesamiento=datetime.now())
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
             
             return {
                 "mensaje": "Retiro rechazado por saldo insuficiente",
-                "retiro_id": retiro_obj.id,
+                "retiro_id": retiro_id,
                 "estado": "RECHAZADO"
             }
-        
-        # Actualizar saldo del usuario
-        usuario_retiro.saldo = float(usuario_retiro.saldo) - float(retiro_obj.monto) 
-        
-        # Actualizar estado del retiro
-        retiro_obj.estado = "APROBADO"
-        retiro_obj.fecha_procesamiento = datetime.now()
-        
-        # Guardar cambios
-        db.commit()
+
+        registrar_al_confirmar(
+            db, usuario_id, "retiro", -monto,
+            saldo_resultante=nuevo_saldo,
+            detalles={"retiro_id": retiro_id}
+        )
+        await db.commit()
         
         return {
             "mensaje": "Retiro aprobado correctamente",
-            "retiro_id": retiro_obj.id,
-            "usuario_id": usuario_retiro.id,
-            "monto": float(retiro_obj.monto),
-            "nuevo_saldo_usuario": float(usuario_retiro.saldo),
-            "estado_retiro": retiro_obj.estado
+            "retiro_id": retiro_id,
+            "usuario_id": usuario_id,
+            "monto": float(monto),
+            "nuevo_saldo_usuario": float(nuevo_saldo),
+            "estado_retiro": "APROBADO"
         }
     
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"❌ Error al aprobar retiro: {e}")
         raise HTTPException(status_code=500, detail=f"Error al aprobar: {str(e)}")
 
 @router.post("/admin/retiros/{retiro_id}/rechazar")
 async def rechazar_retiro(
     retiro_id: int,
-    current_user: usuario_model.Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UsuarioActual = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Rechazar un retiro pendiente (solo admin)"""
     if current_user.username != "admin":
         raise HTTPException(status_code=403, detail="Acceso denegado. Solo administradores")
 
     try:
-        ret = db.query(retiro_model.Retiro).filter(
-            retiro_model.Retiro.id == retiro_id
-        ).first()
+        ret = await db.get(retiro_model.Retiro, retiro_id)
         
         if not ret:
             raise HTTPException(status_code=404, detail="Retiro no encontrado")
@@ -600,7 +663,7 @@ async def rechazar_retiro(
         ret.estado = "RECHAZADO"
         ret.fecha_procesamiento = datetime.now()
         
-        db.commit()
+        await db.commit()
         
         return {
             "mensaje": "Retiro rechazado correctamente",
@@ -610,6 +673,6 @@ async def rechazar_retiro(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"❌ Error al rechazar retiro: {e}")
         raise HTTPException(status_code=500, detail=f"Error al rechazar: {str(e)}")
\ No newline at end of file
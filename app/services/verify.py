@@ -3,7 +3,7 @@ from sqlalchemy.orm import Session
 from typing import List
 from ..models import usuario
 from ..database import get_db
-from ..api.auth import get_current_user, verificar_admin
+from ..api.auth import get_current_user, invalidar_usuario_cache, verificar_admin
 from ..schemas.verificacion import VerificacionOut
 from ..crud import crear_solicitud_verificacion, listar_verificaciones_pendientes
 
@@ -24,7 +24,9 @@ def solicitar_verificacion(
     if current_user.verificado:
         raise HTTPException(status_code=400, detail="Tu cuenta ya está verificada.")
 
-    return crear_solicitud_verificacion(db, current_user.id, archivo)
+    verificacion = crear_solicitud_verificacion(db, current_user.id, archivo)
+    invalidar_usuario_cache(current_user.id)
+    return verificacion
 
 @router.get("/verificaciones/pendientes", response_model=List[VerificacionOut])
 def obtener_verificaciones_pendientes(
@@ -1,19 +1,27 @@
 from datetime import datetime, timedelta
 import json
+import os
 import random
-from typing import List
+from typing import List, Optional
 from fastapi.responses import JSONResponse
 import pytz
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func
+from sqlalchemy import and_, func, select, update
 from decimal import Decimal
 
 from ..models.usuario import Usuario
-from ..models.resultado_sorteo import ResultadoSorteo, ParticipanteSorteo
+from ..models.resultado_sorteo import ResultadoSorteo, ParticipanteSorteo, ContadorSorteo
 from ..database import get_db
 from ..api.auth import get_current_user, verificar_admin
+from ..api.cache import TTLCache
+from ..api.paginacion import (
+    CABECERA_CURSOR, PAGINA_MAXIMA, PAGINA_POR_DEFECTO, cortar_pagina,
+    decodificar_cursor, despues_del_cursor
+)
+from .billetera import acreditar, debitar
+from .movimientos import registrar_movimiento
 from ..schemas.usuario import ParticipanteOut
 from ..schemas.resultado_sorteo import GanadorOut, ResultadoSorteoOut
 
@@ -21,7 +29,15 @@ router = APIRouter()
 
 ZONE = pytz.timezone("America/Bogota")  # Hora Colombia
 NEXT_DRAW = None
-sorteo_en_proceso = False  # Variable para prevenir ejecuciones simultáneas
+
+# Fila única de contadores del sorteo activo
+CONTADOR_ID = 1
+# /vip/next_draw se sirve desde esta caché por worker durante unos segundos
+NEXT_DRAW_CACHE_TTL = float(os.getenv("NEXT_DRAW_CACHE_TTL", 5))
+_next_draw_cache = TTLCache(maxsize=1, ttl=NEXT_DRAW_CACHE_TTL)
+# Premio del sorteo y tamaño de cada lote al archivar participaciones
+PREMIO_SORTEO = Decimal(500000)
+SORTEO_LOTE_ARCHIVO = int(os.getenv("SORTEO_LOTE_ARCHIVO", 10000))
 
 
 def calcular_proximo_sorteo():
@@ -45,116 +61,191 @@ def obtener_fichas_por_costo(costo: float) -> int:
         return 1  # Por defecto
 
 
-def verificar_y_ejecutar_sorteo_automatico(db: Session):
-    """Verifica si es hora del sorteo y lo ejecuta automáticamente"""
-    global NEXT_DRAW, sorteo_en_proceso
-    
-    if sorteo_en_proceso:
-        return None
-    
-    now_local = datetime.now(ZONE)
-    
-    # Si no hay próxima fecha o ya pasó el tiempo, ejecutar sorteo
-    if NEXT_DRAW is None or now_local >= NEXT_DRAW:
-        try:
-            sorteo_en_proceso = True
-            print(f"🕒 Hora del sorteo automático: {now_local}")
-            
-            # Verificar si hay participantes
-            participantes_activos = db.query(ParticipanteSorteo).filter(
-                ParticipanteSorteo.es_activo == True
-            ).count()
-            
-            if participantes_activos == 0:
-                print("⚠️ No hay participantes para el sorteo automático")
-                NEXT_DRAW = calcular_proximo_sorteo()
-                return None
-            
-            # Ejecutar sorteo
-            resultado = realizar_sorteo(db)
-            
-            # Programar próximo sorteo
-            NEXT_DRAW = calcular_proximo_sorteo()
-            print(f"✅ Sorteo automático ejecutado. Próximo sorteo: {NEXT_DRAW}")
-            
-            return resultado
-            
-        except Exception as e:
-            print(f"❌ Error en sorteo automático: {str(e)}")
-            return None
-        finally:
-            sorteo_en_proceso = False
-    
-    return None
+def _contar_activos(db: Session):
+    """Recuento completo de participaciones y fichas activas (solo para sembrar el contador)"""
+    participantes, fichas = db.query(
+        func.count(ParticipanteSorteo.id),
+        func.coalesce(func.sum(ParticipanteSorteo.fichas), 0)
+    ).filter(ParticipanteSorteo.es_activo == True).one()
+    return int(participantes), int(fichas)
+
+
+def ajustar_contadores(db: Session, participantes: int, fichas: int):
+    """
+    Suma (o resta) al contador del sorteo activo dentro de la transacción en
+    curso; no hace commit. Si la fila aún no existe se siembra con el
+    recuento real, que ya incluye los cambios pendientes de esta transacción.
+    """
+    actualizadas = db.query(ContadorSorteo).filter(
+        ContadorSorteo.id == CONTADOR_ID
+    ).update({
+        ContadorSorteo.participantes: ContadorSorteo.participantes + participantes,
+        ContadorSorteo.fichas: ContadorSorteo.fichas + fichas
+    }, synchronize_session=False)
+
+    if not actualizadas:
+        db.flush()
+        total_participantes, total_fichas = _contar_activos(db)
+        db.merge(ContadorSorteo(
+            id=CONTADOR_ID,
+            participantes=total_participantes,
+            fichas=total_fichas
+        ))
+
+
+def reiniciar_contadores(db: Session):
+    """Deja el contador en cero (se archivaron todas las participaciones activas); sin commit"""
+    db.merge(ContadorSorteo(id=CONTADOR_ID, participantes=0, fichas=0))
+
+
+def obtener_contadores(db: Session):
+    """Lee el contador del sorteo activo (una fila por clave primaria)"""
+    contador = db.get(ContadorSorteo, CONTADOR_ID)
+    if contador is None:
+        return _contar_activos(db)
+    return contador.participantes, contador.fichas
+
+
+def _elegir_ganador(db: Session, max_id: int, ficha: int):
+    """
+    Elige en SQL al dueño de la ficha número `ficha` (0-based): agrupa las
+    fichas por usuario, calcula la suma acumulada con una función de ventana y
+    toma el primer usuario cuya suma supera la ficha. Así la probabilidad de
+    cada usuario es proporcional a sus fichas sin traer el pool a Python.
+    """
+    por_usuario = select(
+        ParticipanteSorteo.usuario_id,
+        func.sum(ParticipanteSorteo.fichas).label("fichas")
+    ).where(
+        ParticipanteSorteo.es_activo == True,
+        ParticipanteSorteo.id <= max_id
+    ).group_by(ParticipanteSorteo.usuario_id).subquery()
+
+    acumulado = select(
+        por_usuario.c.usuario_id,
+        por_usuario.c.fichas,
+        func.sum(por_usuario.c.fichas).over(order_by=por_usuario.c.usuario_id).label("hasta")
+    ).subquery()
+
+    return db.execute(
+        select(acumulado.c.usuario_id, acumulado.c.fichas)
+        .where(acumulado.c.hasta > ficha)
+        .order_by(acumulado.c.hasta)
+        .limit(1)
+    ).first()
+
+
+def _archivar_participaciones(db: Session, sorteo_id: int, max_id: int):
+    """
+    Marca como resueltas las participaciones activas del sorteo en lotes de
+    SORTEO_LOTE_ARCHIVO filas, con un commit por lote para no retener locks.
+    Descuenta lo archivado del contador en la misma transacción de cada lote.
+    Las inscripciones posteriores al corte (id > max_id) siguen activas.
+
+    Es reanudable: si un lote falla, lo ya archivado queda confirmado y
+    `_completar_archivados_pendientes` termina el resto. Al acabar marca el
+    sorteo como archivado.
+    """
+    lote = select(ParticipanteSorteo.id).where(
+        ParticipanteSorteo.es_activo == True,
+        ParticipanteSorteo.id <= max_id
+    ).limit(SORTEO_LOTE_ARCHIVO)
+
+    total_archivadas = 0
+    while True:
+        fichas_archivadas = db.execute(
+            update(ParticipanteSorteo)
+            .where(ParticipanteSorteo.id.in_(lote))
+            .values(sorteo_id=sorteo_id, es_activo=False)
+            .returning(ParticipanteSorteo.fichas)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+
+        if not fichas_archivadas:
+            break
+
+        ajustar_contadores(db, participantes=-len(fichas_archivadas), fichas=-sum(fichas_archivadas))
+        db.commit()
+        total_archivadas += len(fichas_archivadas)
+
+    db.execute(
+        update(ResultadoSorteo)
+        .where(ResultadoSorteo.id == sorteo_id)
+        .values(archivado=True)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    _next_draw_cache.clear()
+    return total_archivadas
+
+
+def _completar_archivados_pendientes(db: Session) -> int:
+    """
+    Termina de archivar los sorteos que quedaron a medias. Se llama antes de
+    elegir un nuevo ganador: mientras sus participaciones sigan activas
+    podrían ganar un segundo premio.
+    """
+    pendientes = db.query(
+        ResultadoSorteo.id, ResultadoSorteo.corte_participacion_id
+    ).filter(ResultadoSorteo.archivado == False).order_by(ResultadoSorteo.id).all()
+
+    total = 0
+    for sorteo_id, corte in pendientes:
+        archivadas = _archivar_participaciones(db, sorteo_id, corte)
+        print(f"🗃️ Sorteo {sorteo_id}: archivado completado ({archivadas} participaciones pendientes)")
+        total += archivadas
+    return total
 
 
 def realizar_sorteo(db: Session):
-    """Función principal para realizar el sorteo (reutilizable)"""
+    """
+    Función principal para realizar el sorteo (reutilizable).
+
+    Todo se resuelve en SQL: un agregado fija el corte y el total de fichas,
+    una consulta con función de ventana elige al ganador, el premio se acredita
+    con un único UPDATE atómico y las participaciones se archivan por lotes.
+    """
     try:
-        # Obtener todos los participantes activos con sus fichas
-        participantes_query = db.query(
-            ParticipanteSorteo.usuario_id,
-            Usuario.username,
-            Usuario.verificado,
-            Usuario.saldo,
-            func.sum(ParticipanteSorteo.fichas).label('total_fichas')
-        ).join(
-            Usuario, ParticipanteSorteo.usuario_id == Usuario.id
-        ).filter(
-            ParticipanteSorteo.es_activo == True
-        ).group_by(
-            ParticipanteSorteo.usuario_id,
-            Usuario.username,
-            Usuario.verificado,
-            Usuario.saldo
-        ).all()
+        # Un sorteo anterior con el archivado a medias se termina primero
+        _completar_archivados_pendientes(db)
+
+        # Corte del sorteo: participaciones activas hasta el id máximo actual
+        total_participantes, total_fichas, max_id = db.query(
+            func.count(func.distinct(ParticipanteSorteo.usuario_id)),
+            func.coalesce(func.sum(ParticipanteSorteo.fichas), 0),
+            func.max(ParticipanteSorteo.id)
+        ).filter(ParticipanteSorteo.es_activo == True).one()
         
-        if not participantes_query:
+        if not total_fichas:
             raise HTTPException(status_code=400, detail="No hay participantes en el sorteo")
 
-        # Crear lista de participantes con duplicación según fichas
-        lista_para_sorteo = []
-        for p in participantes_query:
-            # Agregar el usuario_id tantas veces como fichas tenga
-            for _ in range(p.total_fichas):
-                lista_para_sorteo.append({
-                    "id": p.usuario_id,
-                    "username": p.username,
-                    "verificado": p.verificado,
-                    "saldo": p.saldo
-                })
-        
-        total_fichas = len(lista_para_sorteo)
         print(f"🎰 Total de fichas en juego: {total_fichas}")
-        
-        # Seleccionar ganador
-        ganador_data = random.choice(lista_para_sorteo)
-        numero_ganador = ganador_data["id"]
+
+        # Seleccionar ganador ponderado por fichas
+        ganador = _elegir_ganador(db, max_id, random.randrange(total_fichas))
+        if ganador is None:
+            # /vip/limpiar vació el pool entre el agregado y la elección
+            raise HTTPException(status_code=400, detail="No hay participantes en el sorteo")
+        numero_ganador = ganador.usuario_id
         print(f"🎰 Número ganador generado: {numero_ganador}")
         
-        # Buscar todos los usuarios que coincidan
-        usuarios_ganadores = []
+        # Acreditar el premio con un UPDATE atómico (solo se bloquea la fila del ganador)
         ganadores_info = []
-        
-        for p in participantes_query:
-            if p.usuario_id == numero_ganador:
-                usuario_db = db.query(Usuario).filter(Usuario.id == p.usuario_id).first()
-                if usuario_db:
-                    saldo_anterior = usuario_db.saldo
-                    premio = Decimal(500000)
-                    usuario_db.saldo += premio
-                    usuarios_ganadores.append(usuario_db)
-                    
-                    ganadores_info.append({
-                        "id": p.usuario_id,
-                        "username": p.username,
-                        "saldo": float(usuario_db.saldo),
-                        "verificado": p.verificado,
-                        "premio": float(premio),
-                        "saldo_anterior": float(saldo_anterior),
-                        "fichas": p.total_fichas
-                    })
-                    print(f"💰 Ganador encontrado: {p.username} con {p.total_fichas} fichas")
+        nuevo_saldo = acreditar(db, numero_ganador, PREMIO_SORTEO, commit=False)
+        if nuevo_saldo is not None:
+            datos_ganador = db.query(Usuario.username, Usuario.verificado).filter(
+                Usuario.id == numero_ganador
+            ).one()
+            ganadores_info.append({
+                "id": numero_ganador,
+                "username": datos_ganador.username,
+                "saldo": float(nuevo_saldo),
+                "verificado": datos_ganador.verificado,
+                "premio": float(PREMIO_SORTEO),
+                "saldo_anterior": float(nuevo_saldo - PREMIO_SORTEO),
+                "fichas": ganador.fichas
+            })
+            print(f"💰 Ganador encontrado: {datos_ganador.username} con {ganador.fichas} fichas")
         
         fecha_bogota = datetime.now(ZONE)
         
@@ -163,37 +254,43 @@ def realizar_sorteo(db: Session):
             fecha=fecha_bogota,
             numero_ganador=str(numero_ganador),
             ganadores=json.dumps(ganadores_info, ensure_ascii=False),
-            total_participantes=len(participantes_query),
-            total_ganadores=len(ganadores_info)
+            total_participantes=total_participantes,
+            total_ganadores=len(ganadores_info),
+            corte_participacion_id=max_id,
+            archivado=False
         )
         
         db.add(resultado)
-        db.flush()
-        
-        # Actualizar participantes con el sorteo_id y marcar como inactivos
-        db.query(ParticipanteSorteo).filter(
-            ParticipanteSorteo.es_activo == True
-        ).update({
-            "sorteo_id": resultado.id,
-            "es_activo": False
-        })
-        
         db.commit()
-        
-        # Refrescar usuarios ganadores
-        for usuario in usuarios_ganadores:
-            db.refresh(usuario)
-        
+
+        if nuevo_saldo is not None:
+            registrar_movimiento(
+                numero_ganador, "premio", PREMIO_SORTEO, juego="vip",
+                saldo_resultante=nuevo_saldo, detalles={"sorteo_id": resultado.id}
+            )
         print(f"✅ Resultado guardado en BD - ID: {resultado.id}")
-        print(f"📊 Total participantes: {len(participantes_query)} | Total fichas: {total_fichas} | Ganadores: {len(ganadores_info)}")
+
+        # Archivar participaciones en lotes cortos (fuera de la transacción del premio).
+        # El premio ya está confirmado: un fallo aquí no se relanza (un reintento
+        # pagaría otro premio); el próximo sorteo termina el archivado
+        sorteo_id = resultado.id
+        try:
+            archivadas = _archivar_participaciones(db, sorteo_id, max_id)
+        except Exception as e:
+            db.rollback()
+            archivadas = None
+            print(f"⚠️ Sorteo {sorteo_id}: archivado incompleto, se completará antes del próximo sorteo: {e}")
+        
+        print(f"📊 Total participantes: {total_participantes} | Total fichas: {total_fichas} | Ganadores: {len(ganadores_info)} | Archivadas: {archivadas}")
         
         return {
             "success": True,
             "numero_ganador": numero_ganador,
             "ganadores": ganadores_info,
-            "total_participantes": len(participantes_query),
+            "total_participantes": total_participantes,
             "total_fichas": total_fichas,
             "total_ganadores": len(ganadores_info),
+            "archivado_completo": archivadas is not None,
             "fecha_sorteo": fecha_bogota.isoformat()
         }
 
@@ -218,17 +315,10 @@ def participar_sorteo_vip(
     if not isinstance(costo_vip, (int, float)) or costo_vip <= 0:
         raise HTTPException(status_code=400, detail="Costo inválido")
 
-    usuario = db.query(Usuario).filter(Usuario.id == current_user.id).first()
-    if not usuario:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
-    if usuario.saldo < costo_vip:
-        raise HTTPException(status_code=400, detail=f"Saldo insuficiente. Se requieren ${costo_vip}")
-
     # Verificar si ya está inscrito en el sorteo activo
     participacion_existente = db.query(ParticipanteSorteo).filter(
         and_(
-            ParticipanteSorteo.usuario_id == usuario.id,
+            ParticipanteSorteo.usuario_id == current_user.id,
             ParticipanteSorteo.es_activo == True
         )
     ).first()
@@ -239,28 +329,34 @@ def participar_sorteo_vip(
     # Calcular fichas
     fichas = obtener_fichas_por_costo(costo_vip)
 
-    # Descontar saldo
-    usuario.saldo -= costo_vip
-    db.commit()
-
     # Crear registro de participante
     participante = ParticipanteSorteo(
-        usuario_id=usuario.id,
+        usuario_id=current_user.id,
         costo=costo_vip,
         fichas=fichas,
         fecha_participacion=datetime.utcnow(),
         sorteo_id=1,
         es_activo=True
     )
-    
     db.add(participante)
+    db.flush()
+
+    # Descontar saldo (validación en el UPDATE; se confirma junto con la inscripción y el contador)
+    nuevo_saldo = debitar(
+        db, current_user.id, costo_vip, commit=False, juego="vip",
+        detalles={"participacion_id": participante.id, "fichas": fichas}
+    )
+    if nuevo_saldo is None:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Saldo insuficiente. Se requieren ${costo_vip}")
+
+    ajustar_contadores(db, participantes=1, fichas=fichas)
     db.commit()
-    db.refresh(usuario)
-    db.refresh(participante)
+    _next_draw_cache.clear()
 
     return {
         "mensaje": f"Te has inscrito correctamente al sorteo VIP 🎉 Se descontaron ${costo_vip} por {fichas} ficha(s).",
-        "nuevo_saldo": float(usuario.saldo),
+        "nuevo_saldo": float(nuevo_saldo),
         "fichas_obtenidas": fichas,
         "id_participacion": participante.id
     }
@@ -324,6 +420,8 @@ def resolver_sorteo(db: Session = Depends(get_db)):
             "proximo_sorteo": NEXT_DRAW.isoformat()
         })
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error al resolver sorteo: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
@@ -331,37 +429,48 @@ def resolver_sorteo(db: Session = Depends(get_db)):
 
 @router.get("/vip/next_draw")
 def get_next_draw(db: Session = Depends(get_db)):
-    """Obtener información del próximo sorteo"""
+    """Obtener información del próximo sorteo (el sorteo lo ejecuta el scheduler, no esta consulta)"""
     global NEXT_DRAW
-    
-    # Verificar y ejecutar sorteo automático si es la hora
-    verificar_y_ejecutar_sorteo_automatico(db)
+
+    cacheado = _next_draw_cache.get("next_draw")
+    if cacheado is not None:
+        return cacheado
     
     # Si NEXT_DRAW no está definido o ya pasó, calcular próximo
     if NEXT_DRAW is None or datetime.now(ZONE) >= NEXT_DRAW:
         NEXT_DRAW = calcular_proximo_sorteo()
     
-    # Contar participantes activos y fichas
-    total_participantes = db.query(ParticipanteSorteo).filter(
-        ParticipanteSorteo.es_activo == True
-    ).count()
-    
-    total_fichas = db.query(func.sum(ParticipanteSorteo.fichas)).filter(
-        ParticipanteSorteo.es_activo == True
-    ).scalar() or 0
+    # Participantes activos y fichas desde el contador incremental
+    total_participantes, total_fichas = obtener_contadores(db)
 
-    return {
+    respuesta = {
         "next_draw": NEXT_DRAW.isoformat(),
         "participantes_actuales": total_participantes,
         "fichas_actuales": total_fichas,
         "timezone": "America/Bogota"
     }
+    _next_draw_cache.set("next_draw", respuesta)
+    return respuesta
 
 
 @router.get("/vip/results", response_model=List[ResultadoSorteoOut])
-def get_results(db: Session = Depends(get_db)):
+def get_results(
+    response: Response,
+    limite: int = Query(PAGINA_POR_DEFECTO, ge=1, le=PAGINA_MAXIMA),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    db: Session = Depends(get_db)
+):
+    posicion = decodificar_cursor(cursor, (datetime, int))
     try:
-        resultados_db = db.query(ResultadoSorteo).order_by(ResultadoSorteo.fecha.desc()).limit(50).all()
+        consulta = db.query(ResultadoSorteo)
+        if posicion:
+            consulta = consulta.filter(despues_del_cursor((ResultadoSorteo.fecha, ResultadoSorteo.id), posicion))
+        resultados_db = consulta.order_by(
+            ResultadoSorteo.fecha.desc(), ResultadoSorteo.id.desc()
+        ).limit(limite + 1).all()
+        resultados_db, siguiente = cortar_pagina(resultados_db, limite, lambda r: (r.fecha, r.id))
+        if siguiente:
+            response.headers[CABECERA_CURSOR] = siguiente
         print(f"📊 Resultados encontrados en BD: {len(resultados_db)}")
 
         resultados = []
@@ -409,7 +518,9 @@ def limpiar_participantes(
         db.query(ParticipanteSorteo).filter(
             ParticipanteSorteo.es_activo == True
         ).update({"es_activo": False})
+        reiniciar_contadores(db)
         db.commit()
+        _next_draw_cache.clear()
         
         return {"mensaje": "Todos los participantes han sido limpiados", "success": True}
     except Exception as e:
@@ -0,0 +1,106 @@
+"""
+Benchmark de arranque: tiempo hasta poder atender la primera petición.
+
+Cada medición es un proceso nuevo (importaciones en frío) que importa
+app.main y ejecuta el arranque del lifespan contra una base SQLite temporal.
+La primera pasada sincroniza el esquema desde cero; las siguientes
+encuentran la huella guardada y solo hacen la consulta de versión.
+
+Uso:
+    python benchmarks/arranque.py [--repeticiones 5] [--importtime 15]
+
+--importtime N muestra los N módulos más caros de importar app.main
+(según `python -X importtime`).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HIJO = """
+import asyncio, json, time
+inicio = time.perf_counter()
+import app.main as m
+importado = time.perf_counter()
+
+async def arrancar():
+    async with m.app.router.lifespan_context(m.app):
+        listo = time.perf_counter()
+        return listo
+
+listo = asyncio.run(arrancar())
+print("@@" + json.dumps({
+    "import_main_ms": round((importado - inicio) * 1000, 1),
+    "hasta_primera_peticion_ms": round((listo - inicio) * 1000, 1),
+    "routers_ms": m.informe_arranque.get("routers_ms"),
+    "esquema_ms": m.informe_arranque.get("esquema_ms"),
+}))
+"""
+
+
+def _entorno(base: str) -> dict:
+    entorno = dict(os.environ)
+    entorno["DATABASE_URL"] = f"sqlite:///{base}"
+    entorno.setdefault("RAILWAY_ENVIRONMENT", "production")
+    # Las rondas de Aviator no arrancan sin semilla
+    entorno.setdefault("SECRET_KEY", "clave-benchmark")
+    return entorno
+
+
+def medir(base: str) -> dict:
+    salida = subprocess.run(
+        [sys.executable, "-c", HIJO], cwd=RAIZ, env=_entorno(base),
+        capture_output=True, text=True, check=True
+    ).stdout
+    linea = next(l for l in salida.splitlines() if l.startswith("@@"))
+    return json.loads(linea[2:])
+
+
+def importaciones_caras(base: str, cuantas: int) -> None:
+    """Informe de presupuesto: módulos con mayor tiempo acumulado de importación."""
+    errores = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"], cwd=RAIZ,
+        env=_entorno(base), capture_output=True, text=True, check=True
+    ).stderr
+    filas = []
+    for linea in errores.splitlines():
+        if not linea.startswith("import time:") or "cumulative" in linea:
+            continue
+        # "import time:   propio |  acumulado |   modulo" (en microsegundos)
+        partes = linea.split("|")
+        filas.append((int(partes[1]), partes[2].strip()))
+    filas.sort(reverse=True)
+    print("\nImportaciones más caras de app.main (acumulado):")
+    for acumulado, modulo in filas[:cuantas]:
+        print(f"  {acumulado / 1000:8.1f} ms  {modulo}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--importtime", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        base = os.path.join(directorio, "arranque.db")
+
+        frio = medir(base)
+        print(f"Primer arranque (sincroniza el esquema): {frio}")
+
+        calientes = [medir(base) for _ in range(args.repeticiones)]
+        for clave in ("import_main_ms", "routers_ms", "esquema_ms", "hasta_primera_peticion_ms"):
+            valores = [c[clave] for c in calientes if c.get(clave) is not None]
+            if valores:
+                print(f"{clave:>28}: mediana {statistics.median(valores):8.1f} ms  (mín {min(valores):.1f}, máx {max(valores):.1f})")
+
+        if args.importtime:
+            importaciones_caras(base, args.importtime)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Microbenchmark de la matemática de Aviator: implementación original con
+Decimal (copiada aquí como referencia) frente a la tabla acumulada con
+bisect y la curva en centésimas enteras.
+
+Además de los tiempos por llamada comprueba que la distribución del crash
+no cambió (chi-cuadrado de dos muestras independientes, alfa 0.001). Las
+comprobaciones exactas (duración exhaustiva, crash y curva con las mismas
+entradas) están en tests/test_aviator_matematica.py y usan las funciones
+de referencia de este archivo.
+
+Uso:
+    python benchmarks/aviator.py [--muestras 200000]
+
+Sale con código 1 si alguna comprobación falla.
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import timeit
+from decimal import Decimal
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+# app.database exige una URL; el benchmark no toca la base
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.services.juegos.aviator import (  # noqa: E402
+    MAX_MULTIPLICADOR, MIN_MULTIPLICADOR, PROBABILIDADES,
+    crash_centesimas, duracion_decimas, multiplicador_centesimas,
+)
+
+# ----------------------------------------------------------------------
+# Referencia: implementación original con Decimal
+# ----------------------------------------------------------------------
+
+def ref_duracion(multiplicador: Decimal) -> Decimal:
+    if multiplicador <= Decimal('1.0'):
+        return Decimal('0.5')
+    if multiplicador <= Decimal('1.5'):
+        duracion = Decimal('0.5') + (multiplicador - Decimal('1.0')) * Decimal('2.0')
+        return max(Decimal('0.5'), min(duracion.quantize(Decimal('0.1')), Decimal('30.0')))
+    if multiplicador <= Decimal('2.0'):
+        duracion = Decimal('1.5') + (multiplicador - Decimal('1.5')) * Decimal('2.0')
+        return max(Decimal('0.5'), min(duracion.quantize(Decimal('0.1')), Decimal('30.0')))
+    if multiplicador <= Decimal('10.0'):
+        duracion = Decimal('2.5') + (multiplicador - Decimal('2.0')) * Decimal('0.69')
+        return max(Decimal('0.5'), min(duracion.quantize(Decimal('0.1')), Decimal('30.0')))
+    if multiplicador <= Decimal('100.0'):
+        duracion = Decimal('8.0') + (multiplicador - Decimal('10.0')) * Decimal('0.133')
+        return max(Decimal('0.5'), min(duracion.quantize(Decimal('0.1')), Decimal('30.0')))
+    if multiplicador <= Decimal('500.0'):
+        duracion = Decimal('20.0') + (multiplicador - Decimal('100.0')) * Decimal('0.025')
+        return max(Decimal('0.5'), min(duracion, Decimal('30.0'))).quantize(Decimal('0.1'))
+    return Decimal('30.0')
+
+
+def ref_crash(r: float, u: float) -> Decimal:
+    r = r * 100
+    acumulado = Decimal('0.0')
+    for i, (multiplier, prob) in enumerate(PROBABILIDADES):
+        acumulado += prob
+        if r < float(acumulado):
+            if i == 0:
+                return Decimal('1.00')
+            min_val = PROBABILIDADES[i - 1][0]
+            max_val = multiplier
+            factor = u ** 1.5
+            if min_val == max_val:
+                return min_val
+            resultado = min_val + (max_val - min_val) * Decimal(str(factor))
+            resultado = max(MIN_MULTIPLICADOR, min(resultado, MAX_MULTIPLICADOR))
+            return resultado.quantize(Decimal('0.01'))
+    return Decimal('1.50')
+
+
+def ref_multiplicador(tiempo: float, crash: Decimal, duracion: float) -> Decimal:
+    if duracion <= 0:
+        return Decimal('1.0')
+    progreso = min(tiempo / duracion, 1.0)
+    progreso_eased = 1 - pow(1 - progreso, 3)
+    rango = crash - Decimal('1.0')
+    multiplicador = Decimal('1.0') + rango * Decimal(str(progreso_eased))
+    multiplicador = max(Decimal('1.0'), min(multiplicador, crash))
+    return multiplicador.quantize(Decimal('0.01'))
+
+# ----------------------------------------------------------------------
+# Tiempos
+# ----------------------------------------------------------------------
+
+def por_llamada(funcion, repeticiones: int = 5, numero: int = 20000) -> float:
+    """Mejor tiempo por llamada en microsegundos."""
+    return min(timeit.repeat(funcion, repeat=repeticiones, number=numero)) / numero * 1e6
+
+
+def tiempos() -> None:
+    rnd = random.random
+    crash_d, crash_c = Decimal('3.47'), 347
+    casos = [
+        ("crash", lambda: ref_crash(rnd(), rnd()), lambda: crash_centesimas(rnd(), rnd())),
+        ("duración", lambda: ref_duracion(crash_d), lambda: duracion_decimas(crash_c)),
+        ("multiplicador", lambda: ref_multiplicador(1.3, crash_d, 4.4), lambda: multiplicador_centesimas(1.3, crash_c, 4.4)),
+    ]
+    print(f"{'función':>14} {'Decimal':>10} {'enteros':>10} {'mejora':>8}")
+    for nombre, antes, despues in casos:
+        t_antes, t_despues = por_llamada(antes), por_llamada(despues)
+        print(f"{nombre:>14} {t_antes:8.2f}µs {t_despues:8.2f}µs {t_antes / t_despues:7.1f}x")
+
+# ----------------------------------------------------------------------
+# Comprobaciones
+# ----------------------------------------------------------------------
+
+def _critico_chi2(grados: int, z: float = 3.0902) -> float:
+    """Valor crítico aproximado (Wilson-Hilferty) de chi-cuadrado; z=3.09 es alfa 0.001."""
+    return grados * (1 - 2 / (9 * grados) + z * math.sqrt(2 / (9 * grados))) ** 3
+
+
+def comprobar_distribucion(muestras: int) -> bool:
+    bordes = [100, 101, 105, 110, 120, 130, 140, 150, 175, 200, 300, 500, 1000, 2000, 5000, 50001]
+
+    def histograma(valores):
+        cuentas = [0] * (len(bordes) - 1)
+        for v in valores:
+            for i in range(len(bordes) - 1):
+                if v < bordes[i + 1]:
+                    cuentas[i] += 1
+                    break
+        return cuentas
+
+    antes_rng, despues_rng = random.Random(1), random.Random(2)
+    antes = histograma(int(ref_crash(antes_rng.random(), antes_rng.random()) * 100) for _ in range(muestras))
+    despues = histograma(crash_centesimas(despues_rng.random(), despues_rng.random()) for _ in range(muestras))
+
+    # Chi-cuadrado de dos muestras del mismo tamaño, sin los intervalos vacíos
+    pares = [(a, b) for a, b in zip(antes, despues) if a + b > 0]
+    chi2 = sum((a - b) ** 2 / (a + b) for a, b in pares)
+    critico = _critico_chi2(len(pares) - 1)
+    print(f"distribución: chi² = {chi2:.1f} con {len(pares) - 1} g.l. (crítico al 0.1 %: {critico:.1f})")
+    return chi2 < critico
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--muestras", type=int, default=200000)
+    args = parser.parse_args()
+
+    tiempos()
+    print()
+    correcto = comprobar_distribucion(args.muestras)
+    print("\nOK: la distribución no cambió" if correcto else "\nFALLO: la distribución difiere")
+    sys.exit(0 if correcto else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+# tests/conftest.py
+"""
+Configuración común de las pruebas: una base SQLite temporal por sesión de
+pytest. Las variables de entorno se fijan antes de importar `app`, porque
+app.database crea los motores al importarse.
+"""
+import os
+import tempfile
+
+_directorio = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_directorio, 'pruebas.db')}")
+os.environ.setdefault("SECRET_KEY", "clave-de-pruebas")
+os.environ.setdefault("RECIBOS_DIR", os.path.join(_directorio, "recibos"))
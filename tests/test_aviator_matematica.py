@@ -0,0 +1,45 @@
+# tests/test_aviator_matematica.py
+"""
+La matemática entera de Aviator (centésimas y décimas) debe dar exactamente
+lo mismo que la implementación original con Decimal, que vive como
+referencia en benchmarks/aviator.py junto a los tiempos y la prueba de
+distribución.
+"""
+import random
+from decimal import Decimal
+
+from benchmarks.aviator import ref_crash, ref_duracion, ref_multiplicador
+from app.services.juegos.aviator import crash_centesimas, duracion_decimas, multiplicador_centesimas
+
+MUESTRAS = 20000
+
+
+def test_duracion_identica_para_todos_los_crash():
+    distintas = [
+        c for c in range(100, 50001)
+        if ref_duracion(Decimal(c).scaleb(-2)) != Decimal(duracion_decimas(c)).scaleb(-1)
+    ]
+    assert not distintas, f"{len(distintas)} crash con otra duración, p. ej. {distintas[:5]}"
+
+
+def test_crash_identico_con_las_mismas_entradas():
+    rng = random.Random(7)
+    for _ in range(MUESTRAS):
+        r, u = rng.random(), rng.random()
+        assert Decimal(crash_centesimas(r, u)).scaleb(-2) == ref_crash(r, u), (r, u)
+
+
+def test_curva_identica_con_las_mismas_entradas():
+    rng = random.Random(7)
+    distintas = 0
+    for _ in range(MUESTRAS):
+        r, u = rng.random(), rng.random()
+        crash = ref_crash(r, u)
+        duracion = float(ref_duracion(crash))
+        t = rng.random() * duracion
+        esperado = ref_multiplicador(t, crash, duracion)
+        obtenido = Decimal(multiplicador_centesimas(t, crash_centesimas(r, u), duracion)).scaleb(-2)
+        # Solo se admiten empates exactos de redondeo (float frente a Decimal(str)): 0.01 como mucho
+        assert abs(obtenido - esperado) <= Decimal('0.01'), (t, crash, duracion)
+        distintas += obtenido != esperado
+    assert distintas <= MUESTRAS * 0.0001
@@ -0,0 +1,178 @@
+# tests/test_transacciones_loop.py
+"""
+Los handlers `async def` de app/services/transacciones.py no deben bloquear
+el event loop.
+
+Cada sentencia SQL tarda LATENCIA_SQL segundos (callback de traza de sqlite,
+que corre en el hilo que ejecuta la sentencia). Con la sesión asíncrona esa
+espera ocurre en el hilo de aiosqlite y el loop sigue libre; si un handler
+volviera a usar la sesión síncrona, el loop quedaría parado en cada consulta
+y el retraso medido superaría MAX_RETRASO_MS.
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI
+from sqlalchemy import event, text
+
+from app.database import Base, async_engine, engine, get_db
+from app.models.deposito import Deposito
+from app.models.retiro import Retiro
+from app.models.usuario import Usuario
+from app.api.auth import UsuarioActual, get_current_principal, get_current_user
+from app.services import transacciones
+
+LATENCIA_SQL = 0.1
+# Un handler que bloquea retiene el loop al menos LATENCIA_SQL por sentencia.
+# La mitad deja margen para el ruido del planificador y del GIL (con una sola
+# CPU, un loop ocioso llega a despertar con decenas de ms de retraso)
+MAX_RETRASO_MS = LATENCIA_SQL * 1000 / 2
+
+pytestmark = pytest.mark.anyio
+
+
+# De módulo para que latencia_sql (asíncrona, de módulo) comparta el loop de las pruebas
+@pytest.fixture(scope="module")
+def anyio_backend():
+    return "asyncio"
+
+
+def _dormir(_sentencia):
+    time.sleep(LATENCIA_SQL)
+
+
+def _latencia_async(conexion, _registro):
+    conexion.await_(conexion._connection.set_trace_callback(_dormir))
+
+
+def _latencia_sync(conexion, _registro):
+    conexion.set_trace_callback(_dormir)
+
+
+@pytest.fixture(scope="module")
+async def latencia_sql():
+    """
+    Activa la latencia solo en este módulo. Se vacían los pools al entrar
+    (las conexiones ya abiertas no tendrían el callback) y al salir: el hilo
+    de aiosqlite de cada conexión no es daemon y sin dispose() el proceso de
+    pytest no termina.
+    """
+    engine.dispose()
+    await async_engine.dispose()
+    event.listen(engine, "connect", _latencia_sync)
+    event.listen(async_engine.sync_engine, "connect", _latencia_async)
+    yield
+    event.remove(engine, "connect", _latencia_sync)
+    event.remove(async_engine.sync_engine, "connect", _latencia_async)
+    engine.dispose()
+    await async_engine.dispose()
+
+
+@pytest.fixture(scope="module")
+def usuario():
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM retiros"))
+        conn.execute(text("DELETE FROM depositos"))
+        conn.execute(text("DELETE FROM usuarios"))
+    with engine.begin() as conn:
+        usuario_id = conn.execute(Usuario.__table__.insert().values(
+            email="admin@prueba.com", username="admin", password_hash="x",
+            saldo=1_000_000, verificado=True,
+        )).inserted_primary_key[0]
+        for i in range(4):
+            conn.execute(Deposito.__table__.insert().values(
+                usuario_id=usuario_id, monto=20000, metodo_pago="nequi",
+                referencia=f"DEPTEST{i}", estado="PENDIENTE",
+            ))
+            conn.execute(Retiro.__table__.insert().values(
+                usuario_id=usuario_id, monto=60000, metodo_retiro="nequi",
+                cuenta_destino="3001234567", comision=0, total=60000,
+                referencia=f"RETTEST{i}", estado="PENDIENTE",
+            ))
+    return SimpleNamespace(id=usuario_id, username="admin", verificado=True, saldo=1_000_000)
+
+
+@pytest.fixture(scope="module")
+def app(usuario, latencia_sql):
+    app = FastAPI()
+    app.include_router(transacciones.router, prefix="/transacciones")
+    principal = UsuarioActual(usuario.id, usuario.username, True, False)
+    app.dependency_overrides[get_current_principal] = lambda: principal
+    app.dependency_overrides[get_current_user] = lambda: usuario
+
+    # Control: un handler async que usa la sesión síncrona sí debe detectarse
+    @app.get("/bloqueante")
+    async def bloqueante(db=Depends(get_db)):
+        return {"n": db.execute(text("SELECT count(*) FROM depositos")).scalar()}
+
+    return app
+
+
+async def _retraso_maximo_ms(app, peticiones) -> float:
+    """Lanza las peticiones mientras mide cuánto tarda el loop en despertar un sleep de 1 ms."""
+    retrasos = []
+    terminado = asyncio.Event()
+
+    async def vigilar():
+        while not terminado.is_set():
+            inicio = time.perf_counter()
+            await asyncio.sleep(0.001)
+            retrasos.append(time.perf_counter() - inicio - 0.001)
+
+    async def lanzar():
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://prueba") as cliente:
+            try:
+                for metodo, url, opciones in peticiones:
+                    respuesta = await cliente.request(metodo, url, **opciones)
+                    assert respuesta.status_code < 500, respuesta.text
+            finally:
+                terminado.set()
+
+    await asyncio.gather(vigilar(), lanzar())
+    return max(retrasos) * 1000
+
+
+LECTURAS = [
+    ("GET", "/transacciones/mis-depositos", {}),
+    ("GET", "/transacciones/mis-retiros", {}),
+    ("GET", "/transacciones/admin/depositos/pendientes", {}),
+    ("GET", "/transacciones/admin/retiros/pendientes", {}),
+    ("GET", "/transacciones/deposito/1", {}),
+]
+
+
+def _escrituras(aprobar: int, rechazar: int):
+    """Altas y aprobaciones/rechazos sobre los depósitos y retiros indicados."""
+    return [
+        ("POST", "/transacciones/deposito", {
+            "data": {"monto": "20000", "metodo_pago": "nequi"},
+            "files": {"comprobante": ("recibo.png", b"\x89PNG\r\n\x1a\n" + b"0" * 2048, "image/png")},
+        }),
+        ("POST", "/transacciones/retiro", {"json": {
+            "monto": 60000, "metodo_retiro": "nequi", "cuenta_destino": "3001234567",
+            "comision": 0, "total": 60000,
+        }}),
+        ("POST", f"/transacciones/admin/depositos/{aprobar}/aprobar", {}),
+        ("POST", f"/transacciones/admin/depositos/{rechazar}/rechazar", {}),
+        ("POST", f"/transacciones/admin/retiros/{aprobar}/aprobar", {}),
+        ("POST", f"/transacciones/admin/retiros/{rechazar}/rechazar", {}),
+    ]
+
+
+async def test_handlers_no_bloquean_el_loop(app):
+    # Calentamiento: la primera conexión y la compilación de cada consulta
+    # (que SQLAlchemy hace en el hilo del loop) no cuentan
+    await _retraso_maximo_ms(app, LECTURAS + _escrituras(aprobar=3, rechazar=4))
+
+    retraso = await _retraso_maximo_ms(app, LECTURAS + _escrituras(aprobar=1, rechazar=2))
+    assert retraso < MAX_RETRASO_MS, f"el loop estuvo bloqueado {retraso:.1f} ms"
+
+
+async def test_detecta_un_handler_bloqueante(app):
+    retraso = await _retraso_maximo_ms(app, [("GET", "/bloqueante", {})])
+    assert retraso >= LATENCIA_SQL * 1000 * 0.9